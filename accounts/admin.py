@@ -1,9 +1,36 @@
 ﻿from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 
+from taxi_project.admin import LargeTableAdmin
+
 from .models import DriverProfile, User
 
 
+class RatingListFilter(admin.SimpleListFilter):
+    """Ranges of the rating, rather than one choice per distinct value"""
+    title = 'rating'
+    parameter_name = 'rating'
+    RANGES = {
+        '4.5': ('4.5 and up', 4.5, None),
+        '4': ('4 to 4.5', 4, 4.5),
+        '3': ('3 to 4', 3, 4),
+        '0': ('Below 3', None, 3),
+    }
+    
+    def lookups(self, request, model_admin):
+        return [(value, label) for value, (label, _, _) in self.RANGES.items()]
+    
+    def queryset(self, request, queryset):
+        if self.value() not in self.RANGES:
+            return queryset
+        _, low, high = self.RANGES[self.value()]
+        if low is not None:
+            queryset = queryset.filter(rating__gte=low)
+        if high is not None:
+            queryset = queryset.filter(rating__lt=high)
+        return queryset
+
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['email', 'username', 'role', 'is_staff', 'is_active']
@@ -27,15 +54,25 @@ class UserAdmin(BaseUserAdmin):
 
 
 @admin.register(DriverProfile)
-class DriverProfileAdmin(admin.ModelAdmin):
+class DriverProfileAdmin(LargeTableAdmin):
     list_display = ['user', 'license_number', 'car_model', 'car_number', 'rating', 'created_at']
-    list_filter = ['rating', 'created_at']
-    search_fields = ['user__email', 'license_number', 'car_number', 'car_model']
-    readonly_fields = ['created_at', 'updated_at']
+    list_filter = [RatingListFilter, 'created_at']
+    list_select_related = ['user']
+    search_fields = ['license_number', 'car_number', 'car_model']
+    related_search_fields = {'user': ['email']}
+    # Served by driver_created_idx
+    ordering = ['-created_at', '-id']
+    sortable_by = ['created_at']
+    readonly_fields = [
+        'rating', 'rating_count', 'recent_rating',
+        'location_updated_at', 'created_at', 'updated_at',
+    ]
     
     fieldsets = (
         ('User Information', {'fields': ('user',)}),
-        ('Driver Details', {'fields': ('license_number', 'description', 'photo', 'rating')}),
+        ('Driver Details', {'fields': ('license_number', 'description', 'photo')}),
+        ('Rating', {'fields': (('rating', 'rating_count', 'recent_rating'),)}),
         ('Vehicle Information', {'fields': ('car_number', 'car_model')}),
+        ('Location', {'fields': (('last_lat', 'last_lng'), 'location_updated_at')}),
         ('Timestamps', {'fields': ('created_at', 'updated_at')}),
     )
@@ -0,0 +1,15 @@
+from rest_framework import viewsets
+
+from taxi_project.api import ConditionalGetMixin, ValuesQuerysetMixin, full_name
+
+from .models import DriverProfile
+from .serializers import DriverProfileSerializer
+
+
+class DriverProfileViewSet(
+    ConditionalGetMixin, ValuesQuerysetMixin, viewsets.ReadOnlyModelViewSet
+):
+    """Drivers with their ratings, newest first"""
+    serializer_class = DriverProfileSerializer
+    queryset = DriverProfile.objects.all()
+    value_expressions = {'name': full_name('user')}
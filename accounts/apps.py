@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save
 
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
+
+    def ready(self):
+        from taxi_project.images import schedule_variants
+
+        from . import principal  # noqa: F401  (connect the signal receivers)
+
+        post_save.connect(schedule_variants, sender=self.get_model('DriverProfile'))
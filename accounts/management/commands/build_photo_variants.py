@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from accounts.models import DriverProfile
+from taxi_project.images import process_photo, variant
+from vehicles.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the resized photo variants of drivers and vehicles that lack '
+        'them (all with --all) and report the bytes they save'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild the variants of every photo')
+        parser.add_argument('--workers', type=int, default=settings.TASK_WORKER_CONCURRENCY)
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model in (DriverProfile, Vehicle):
+            rows = model.objects.exclude(photo='').exclude(photo__isnull=True)
+            for instance in rows.only('pk', 'photo', 'photo_variants'):
+                if options['all'] or variant(instance, 'display') is None:
+                    jobs.append((model, instance.pk))
+
+        def build(job):
+            try:
+                process_photo(*job)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            list(pool.map(build, jobs))
+        self.stdout.write(f'Built the variants of {len(jobs)} photos.')
+
+        for model in (DriverProfile, Vehicle):
+            sizes = {label: 0 for label in settings.IMAGE_VARIANT_SIZES}
+            original, count = 0, 0
+            rows = model.objects.exclude(photo='').exclude(photo__isnull=True)
+            for instance in rows.only('pk', 'photo', 'photo_variants'):
+                if not default_storage.exists(instance.photo.name):
+                    continue
+                count += 1
+                original += default_storage.size(instance.photo.name)
+                for label in sizes:
+                    entry = variant(instance, label)
+                    if entry is not None:
+                        sizes[label] += default_storage.size(entry['webp'])
+            if count:
+                variants = ', '.join(
+                    f'{label} {size / count / 1024:.0f} KiB' for label, size in sizes.items()
+                )
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: {count} photos, '
+                    f'original {original / count / 1024:.0f} KiB, WebP {variants} on average'
+                )
@@ -0,0 +1,334 @@
+import math
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import DriverProfile, User
+from taxi_project.bulk import copy_rows
+from trips import stats as trip_stats
+from trips.geo import KM_PER_DEGREE, grid_cell
+from trips.models import (
+    EVENT_COLUMNS,
+    DriverActivity,
+    Trip,
+    TripEvent,
+    TripRating,
+    TripStats,
+)
+from trips.partitions import ensure_partitions, is_partitioned
+from vehicles.models import Vehicle
+
+FIRST_NAMES = [
+    'James', 'Mary', 'John', 'Linda', 'Robert', 'Sarah', 'Michael', 'Karen',
+    'David', 'Nancy', 'Daniel', 'Lisa', 'Paul', 'Emma', 'Mark', 'Olga',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+    'Davis', 'Wilson', 'Taylor', 'Clark', 'Lewis', 'Walker', 'Young',
+]
+STREETS = [
+    'Main Street', 'Oak Avenue', 'Pine Road', 'Elm Street', 'Maple Drive',
+    'Cedar Lane', 'Park Avenue', 'Lake Road', 'Beach Boulevard', 'Hill Street',
+    'River Road', 'Station Square', 'Airport Terminal', 'Market Place',
+]
+DISTRICTS = ['Downtown', 'Uptown', 'Suburb', 'City Center', 'North Side',
+             'South Side', 'East End', 'West End']
+CAR_MODELS = ['Toyota Camry', 'Honda Accord', 'Skoda Octavia', 'Kia Rio',
+              'Hyundai Solaris', 'Volkswagen Polo', 'Tesla Model 3']
+COLORS = ['Black', 'White', 'Silver', 'Grey', 'Blue', 'Red']
+COMMENTS = ['', '', '', 'Please take the highway', 'Need a ride ASAP',
+            'I have luggage', 'Call when you arrive']
+# Relative demand per hour of day: morning and evening rush hours
+HOURLY_DEMAND = [1, 1, 1, 1, 1, 2, 4, 8, 10, 7, 5, 5,
+                 6, 5, 5, 6, 8, 10, 9, 7, 5, 4, 3, 2]
+DEFAULT_STATUS_MIX = 'requested=1,accepted=2,completed=90,cancelled=7'
+
+# The event log of the generated trips: creation, acceptance by the driver a
+# few minutes later (mostly sooner), completion or cancellation at updated_at
+TRIP_EVENTS_SQL = f'''
+    INSERT INTO {TripEvent._meta.db_table} ({EVENT_COLUMNS})
+    SELECT trip.id, trip.rider_id, event.driver_id, NULL, event.from_status,
+           event.to_status, event.price, event.occurred_at, txid_current()
+    FROM (
+        SELECT trip.*, trip.created_at + random() ^ 2 * interval '4 minutes' AS accepted_at
+        FROM {Trip._meta.db_table} AS trip
+        JOIN {User._meta.db_table} AS rider ON rider.id = trip.rider_id
+        WHERE rider.email LIKE %s
+    ) AS trip
+    CROSS JOIN LATERAL (VALUES
+        ('', 'requested', NULL::bigint, NULL::numeric, trip.created_at, true),
+        ('requested', 'accepted', trip.driver_id, NULL, trip.accepted_at,
+         trip.driver_id IS NOT NULL),
+        (CASE WHEN trip.driver_id IS NULL THEN 'requested' ELSE 'accepted' END,
+         trip.status, trip.driver_id, trip.price, trip.updated_at,
+         trip.status IN ('completed', 'cancelled'))
+    ) AS event(from_status, to_status, driver_id, price, occurred_at, happened)
+    WHERE event.happened
+    ORDER BY event.occurred_at
+'''
+
+
+def parse_status_mix(value):
+    """Parse 'status=weight,...' into ([statuses], [weights])"""
+    valid = {status for status, _ in Trip.STATUS_CHOICES}
+    statuses, weights = [], []
+    for part in value.split(','):
+        status, _, weight = part.partition('=')
+        status = status.strip()
+        if status not in valid:
+            raise CommandError(f'Unknown trip status in --status-mix: {status!r}')
+        try:
+            weights.append(float(weight))
+        except ValueError:
+            raise CommandError(f'Invalid weight for {status!r} in --status-mix')
+        statuses.append(status)
+    if sum(weights) <= 0:
+        raise CommandError('--status-mix weights must add up to more than zero')
+    return statuses, weights
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate production-sized synthetic riders, drivers, vehicles and '
+        'trips with COPY for load testing'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=10000)
+        parser.add_argument('--drivers', type=int, default=1000)
+        parser.add_argument('--trips', type=int, default=100000)
+        parser.add_argument('--status-mix', default=DEFAULT_STATUS_MIX,
+                            help=f'Relative trip status weights (default: {DEFAULT_STATUS_MIX})')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Spread trips over this many past days')
+        parser.add_argument('--center', default='40.7128,-74.0060',
+                            help='City centre as "lat,lng" for trip and driver positions')
+        parser.add_argument('--city-km', type=float, default=15,
+                            help='Typical distance of positions from the centre')
+        parser.add_argument('--seed', type=int, default=1,
+                            help='Random seed; the same seed gives the same data')
+        parser.add_argument('--prefix', default='load',
+                            help='Prefix of generated usernames, emails and plates')
+        parser.add_argument('--password', default='password123',
+                            help='Password of every generated user (hashed once)')
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete data generated earlier with the same prefix first')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.now = timezone.now()
+        statuses, weights = parse_status_mix(options['status_mix'])
+        try:
+            self.center = tuple(float(part) for part in options['center'].split(','))
+            lat, lng = self.center
+        except ValueError:
+            raise CommandError('--center must be "lat,lng"')
+        self.spread = options['city_km'] / 2 / KM_PER_DEGREE
+
+        if options['clear']:
+            self._clear()
+        elif User.objects.filter(email__startswith=f'{self.prefix}-').exists():
+            raise CommandError(
+                f'Users with prefix {self.prefix!r} already exist; '
+                'pass --clear or choose another --prefix'
+            )
+
+        # PBKDF2 is deliberately slow, so hash the shared password only once
+        password = make_password(options['password'])
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL synchronous_commit = off')
+            rider_ids = self._timed('riders', lambda: self._users(
+                'rider', options['riders'], password))
+            driver_user_ids = self._timed('driver users', lambda: self._users(
+                'driver', options['drivers'], password))
+            driver_ids = self._timed('driver profiles', lambda: self._drivers(
+                driver_user_ids))
+            self._timed('vehicles', lambda: self._vehicles(driver_ids))
+            self._timed('trips', lambda: self._trips(
+                options['trips'], rider_ids, driver_ids, statuses, weights,
+                options['days']))
+            self._timed('trip events', lambda: self._trip_events(options['seed']))
+            # COPY bypasses the receivers that keep trip statistics
+            self._timed('trip statistics', trip_stats.rebuild)
+
+        with connection.cursor() as cursor:
+            for model in (User, DriverProfile, Vehicle, Trip, TripStats, TripEvent):
+                cursor.execute(f'ANALYZE {model._meta.db_table}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Done. Log in as {self.prefix}-r0@example.com / {options["password"]}'
+        ))
+
+    def _point(self):
+        """A position around the city centre, denser downtown"""
+        lat = self.center[0] + self.rng.gauss(0, self.spread)
+        lng = self.center[1] + self.rng.gauss(0, self.spread) / math.cos(math.radians(lat))
+        return round(lat, 6), round(lng, 6)
+
+    def _timed(self, label, generate):
+        started = time.perf_counter()
+        result = generate()
+        elapsed = time.perf_counter() - started
+        count = len(result) if isinstance(result, list) else result
+        self.stdout.write(f'{label}: {count} rows in {elapsed:.1f}s')
+        return result
+
+    def _users(self, role, count, password):
+        tag = f'{self.prefix}-{role[0]}'
+        rng = self.rng
+
+        def rows():
+            for i in range(count):
+                joined = self.now - timedelta(seconds=rng.randrange(2 * 365 * 86400))
+                yield (
+                    password, False, f'{tag}{i}', rng.choice(FIRST_NAMES),
+                    rng.choice(LAST_NAMES), f'{tag}{i}@example.com', False, True,
+                    joined, f'+1{rng.randrange(10 ** 9, 10 ** 10)}', role, 0,
+                )
+
+        copy_rows(User, [
+            'password', 'is_superuser', 'username', 'first_name', 'last_name',
+            'email', 'is_staff', 'is_active', 'date_joined', 'phone', 'role',
+            'principal_version',
+        ], rows())
+        return list(
+            User.objects.filter(email__startswith=tag, role=role)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def _drivers(self, user_ids):
+        rng = self.rng
+
+        def rows():
+            for i, user_id in enumerate(user_ids):
+                created = self.now - timedelta(seconds=rng.randrange(365 * 86400))
+                lat, lng = self._point()
+                seen = self.now - timedelta(seconds=rng.randrange(3600))
+                yield (
+                    user_id, f'{self.prefix}-DL{i}', '',
+                    f'{self.prefix}-{i}', rng.choice(CAR_MODELS),
+                    # Seeded ratings have no history; reconcile_driver_ratings
+                    # leaves drivers with no ratings alone
+                    Decimal(rng.randrange(350, 501)) / 100, 0, 0, '{}', lat, lng,
+                    grid_cell(lat, lng), seen, '{}', created, created,
+                )
+
+        copy_rows(DriverProfile, [
+            'user', 'license_number', 'description', 'car_number', 'car_model',
+            'rating', 'rating_count', 'rating_sum', 'recent_ratings',
+            'last_lat', 'last_lng', 'location_cell', 'location_updated_at',
+            'photo_variants', 'created_at', 'updated_at',
+        ], rows())
+        return list(
+            DriverProfile.objects.filter(user_id__in=user_ids)
+            .order_by('pk').values_list('pk', flat=True)
+        )
+
+    def _vehicles(self, driver_ids):
+        rng = self.rng
+
+        def rows():
+            for i, driver_id in enumerate(driver_ids):
+                created = self.now - timedelta(seconds=rng.randrange(365 * 86400))
+                yield (
+                    driver_id, f'{self.prefix}-{i}', rng.choice(CAR_MODELS),
+                    rng.choice((4, 4, 4, 6, 7)), rng.randrange(2012, 2025),
+                    rng.choice(COLORS), True, '{}', created, created,
+                )
+
+        return copy_rows(Vehicle, [
+            'driver', 'car_number', 'car_model', 'seats', 'year', 'color',
+            'is_active', 'photo_variants', 'created_at', 'updated_at',
+        ], rows())
+
+    def _trips(self, count, rider_ids, driver_ids, statuses, weights, days):
+        if count and not rider_ids:
+            raise CommandError('Trips need at least one rider')
+        if count and not driver_ids and set(statuses) - {'requested'}:
+            raise CommandError('Assigned trips need at least one driver')
+        rng = self.rng
+        span = days * 86400
+        hours = range(24)
+
+        def rows():
+            status_draws = rng.choices(statuses, weights, k=count)
+            hour_draws = rng.choices(hours, HOURLY_DEMAND, k=count)
+            for i in range(count):
+                status = status_draws[i]
+                if status == 'requested':
+                    # Open requests are fresh; nobody waits for a cab for days
+                    created = self.now - timedelta(seconds=rng.randrange(1800))
+                else:
+                    day = self.now - timedelta(seconds=rng.randrange(span))
+                    created = day.replace(hour=hour_draws[i], minute=rng.randrange(60))
+                    if created > self.now:
+                        created -= timedelta(days=1)
+                # A few frequent riders and busy drivers, like real traffic
+                rider_id = rider_ids[int(len(rider_ids) * rng.random() ** 2)]
+                driver_id = None
+                if status != 'requested' and not (status == 'cancelled' and rng.random() < 0.5):
+                    driver_id = driver_ids[int(len(driver_ids) * rng.random() ** 1.5)]
+                minutes = rng.randrange(5, 60)
+                price = (
+                    Decimal(250 + minutes * rng.randrange(40, 90)) / 100
+                    if status == 'completed' else None
+                )
+                updated = created if status == 'requested' else created + timedelta(minutes=minutes)
+                origin_lat, origin_lng = self._point()
+                destination_lat, destination_lng = self._point()
+                yield (
+                    rider_id, driver_id,
+                    f'{rng.randrange(1, 999)} {rng.choice(STREETS)}, {rng.choice(DISTRICTS)}',
+                    f'{rng.randrange(1, 999)} {rng.choice(STREETS)}, {rng.choice(DISTRICTS)}',
+                    status, rng.choice(COMMENTS), price, created, min(updated, self.now),
+                    origin_lat, origin_lng, grid_cell(origin_lat, origin_lng),
+                    destination_lat, destination_lng,
+                )
+
+        if is_partitioned():
+            # Months without a partition would land in the default one
+            ensure_partitions(start=self.now - timedelta(days=days))
+        return copy_rows(Trip, [
+            'rider', 'driver', 'origin', 'destination', 'status', 'comment',
+            'price', 'created_at', 'updated_at', 'origin_lat', 'origin_lng',
+            'origin_cell', 'destination_lat', 'destination_lng',
+        ], rows())
+
+    def _trip_events(self, seed):
+        """The trips' events, written by the transitions in real use"""
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT setseed(%s)', [seed % 1000 / 1000])
+            cursor.execute(TRIP_EVENTS_SQL, [f'{self.prefix}-r%@example.com'])
+            return cursor.rowcount
+
+    def _clear(self):
+        """
+        Delete earlier generated rows with raw SQL; ORM cascades are too slow.
+        The trip event log is append-only and keeps their events.
+        """
+        pattern = f'{self.prefix}-%@example.com'
+        users = f'SELECT id FROM {User._meta.db_table} WHERE email LIKE %s'
+        drivers = f'SELECT id FROM {DriverProfile._meta.db_table} WHERE user_id IN ({users})'
+        statements = [
+            (f'DELETE FROM {TripStats._meta.db_table} WHERE user_id IN ({users})', [pattern]),
+            (f'DELETE FROM {TripRating._meta.db_table} WHERE rider_id IN ({users}) '
+             f'OR driver_id IN ({drivers})', [pattern, pattern]),
+            (f'DELETE FROM {Trip._meta.db_table} WHERE rider_id IN ({users}) '
+             f'OR driver_id IN ({drivers})', [pattern, pattern]),
+            (f'DELETE FROM {Vehicle._meta.db_table} WHERE driver_id IN ({drivers})', [pattern]),
+            (f'DELETE FROM {DriverActivity._meta.db_table} WHERE driver_id IN ({drivers})',
+             [pattern]),
+            (f'DELETE FROM {DriverProfile._meta.db_table} WHERE user_id IN ({users})', [pattern]),
+            (f'DELETE FROM {User._meta.db_table} WHERE email LIKE %s', [pattern]),
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+                self.stdout.write(f'cleared {cursor.rowcount} rows: {sql.split(" WHERE")[0]}')
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driverprofile',
+            name='last_lat',
+            field=models.FloatField(blank=True, null=True, verbose_name='Last Latitude'),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='last_lng',
+            field=models.FloatField(blank=True, null=True, verbose_name='Last Longitude'),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='location_cell',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='location_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Location Updated At'),
+        ),
+        migrations.AddIndex(
+            model_name='driverprofile',
+            index=models.Index(fields=['location_cell'], name='driver_location_cell_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:03
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_driver_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='driverprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Ratings'),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='rating_sum',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Rating Sum'),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='recent_rating',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=3, null=True, verbose_name='Recent Rating'),
+        ),
+        migrations.AddField(
+            model_name='driverprofile',
+            name='recent_ratings',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(), blank=True, default=list, editable=False, size=None),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_driver_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='driverprofile',
+            index=models.Index(fields=['-created_at', '-id'], name='driver_created_idx'),
+        ),
+    ]
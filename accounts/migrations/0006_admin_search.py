@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:50
+
+from django.db import migrations
+
+from taxi_project.trigram import create_trigram_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_photo_variants'),
+    ]
+
+    operations = [
+        create_trigram_indexes('accounts_user', ['email']),
+        create_trigram_indexes(
+            'accounts_driverprofile', ['license_number', 'car_number', 'car_model']
+        ),
+    ]
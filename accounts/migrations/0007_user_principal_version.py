@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_admin_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='principal_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
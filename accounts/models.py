@@ -1,5 +1,10 @@
-﻿from django.contrib.auth.models import AbstractUser
-from django.db import models
+﻿from django.conf import settings
+from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.fields import ArrayField
+from django.db import connections, models
+from django.utils import timezone
+
+from trips.geo import grid_cell
 
 
 class User(AbstractUser):
@@ -18,6 +23,9 @@ class User(AbstractUser):
         default='rider',
         verbose_name='Role'
     )
+    # Bumped when the user's driver profile or vehicles change: part of the
+    # key of their cached principal (accounts.principal)
+    principal_version = models.PositiveIntegerField(default=0, editable=False)
     
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -29,6 +37,17 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
     
+    def save(self, *args, **kwargs):
+        # principal_version only moves by F() increments: writing back the
+        # value loaded with the instance would undo a concurrent bump
+        if not self._state.adding and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'principal_version'
+            ]
+        super().save(*args, **kwargs)
+    
     def is_driver(self):
         return self.role == 'driver'
     
@@ -36,6 +55,43 @@ class User(AbstractUser):
         return self.role == 'rider'
 
 
+# One rating folded into a driver's counters: the overall mean from count and
+# sum, and the recent-window mean from the last scores, newest first. SET
+# expressions all see the row as it was before the UPDATE.
+RECORD_RATING_SQL = '''
+    UPDATE {table} SET
+        rating_count = rating_count + 1,
+        rating_sum = rating_sum + %(score)s,
+        rating = round((rating_sum + %(score)s)::numeric / (rating_count + 1), 2),
+        recent_ratings = (ARRAY[%(score)s]::smallint[] || recent_ratings)[1:%(window)s],
+        recent_rating = (
+            SELECT round(avg(score), 2)
+            FROM unnest((ARRAY[%(score)s]::smallint[] || recent_ratings)[1:%(window)s]) AS score
+        ),
+        updated_at = %(now)s
+    WHERE id = %(pk)s
+'''
+
+
+class DriverProfileQuerySet(models.QuerySet):
+    """Queryset with the driver rating counters"""
+    
+    def record_rating(self, pk, score):
+        """
+        Add one score to a driver's rating counters in O(1); call inside the
+        transaction that stores the rating
+        """
+        sql = RECORD_RATING_SQL.format(table=self.model._meta.db_table)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, {
+                'pk': pk,
+                'score': score,
+                'window': settings.DRIVER_RATING_WINDOW,
+                'now': timezone.now(),
+            })
+            return cursor.rowcount == 1
+
+
 class DriverProfile(models.Model):
     """Driver profile with additional information"""
     
@@ -59,18 +115,67 @@ class DriverProfile(models.Model):
         null=True,
         verbose_name='Photo'
     )
+    # Resized copies of photo, built by taxi_project.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     rating = models.DecimalField(
         max_digits=3,
         decimal_places=2,
         default=5.00,
         verbose_name='Rating'
     )
+    # Maintained by DriverProfileQuerySet.record_rating(), checked against
+    # the trip ratings by the reconcile_driver_ratings command
+    rating_count = models.PositiveIntegerField(default=0, verbose_name='Ratings')
+    rating_sum = models.PositiveBigIntegerField(default=0, verbose_name='Rating Sum')
+    recent_ratings = ArrayField(
+        models.PositiveSmallIntegerField(), default=list, blank=True, editable=False
+    )
+    recent_rating = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        verbose_name='Recent Rating'
+    )
+    last_lat = models.FloatField(null=True, blank=True, verbose_name='Last Latitude')
+    last_lng = models.FloatField(null=True, blank=True, verbose_name='Last Longitude')
+    location_cell = models.BigIntegerField(null=True, editable=False)
+    location_updated_at = models.DateTimeField(
+        null=True, blank=True, verbose_name='Location Updated At'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = DriverProfileQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Driver Profile'
         verbose_name_plural = 'Driver Profiles'
+        indexes = [
+            # Drivers near a point, see trips.geo
+            models.Index(fields=['location_cell'], name='driver_location_cell_idx'),
+            # Keyset pages of the drivers API, newest first
+            models.Index(fields=['-created_at', '-id'], name='driver_created_idx'),
+        ]
     
     def __str__(self):
-        return f'{self.user.email} - {self.car_model}'
+        return f'{self.user.email} - {self.car_model}'
+    
+    def save(self, *args, **kwargs):
+        self.location_cell = grid_cell(self.last_lat, self.last_lng)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'last_lat', 'last_lng'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'location_cell'}
+        super().save(*args, **kwargs)
+    
+    def set_location(self, lat, lng):
+        """Store the driver's last known position with a single UPDATE"""
+        self.last_lat, self.last_lng = lat, lng
+        self.location_cell = grid_cell(lat, lng)
+        self.location_updated_at = timezone.now()
+        DriverProfile.objects.filter(pk=self.pk).update(
+            last_lat=lat,
+            last_lng=lng,
+            location_cell=self.location_cell,
+            location_updated_at=self.location_updated_at,
+        )
@@ -0,0 +1,97 @@
+"""
+The identity of the user behind a request, cached across requests.
+
+Views need the user's role and, for drivers, the ids of their profile and
+active vehicle. ``user.driver_profile`` costs a query on every request, so
+``get_principal()`` resolves them with one query the first time and keeps
+them in the default cache; later requests only pay for the session and
+user lookups Django makes anyway.
+
+Entries are keyed on the user's role and ``principal_version``, both read
+with ``request.user``: saving or deleting their driver profile or one of
+their vehicles bumps the version in the same transaction (an UPDATE of
+``F() + 1``; ``User.save()`` never writes the column back). A change is
+seen by the next request of every process, whatever the cache backend
+(the default one is per process), and stale entries just expire.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from vehicles.models import Vehicle
+
+from .models import DriverProfile, User
+
+
+class Principal(namedtuple('Principal', ['user_id', 'role', 'driver_id', 'vehicle_id'])):
+    """Who is asking: ids and role only, no model instances"""
+    __slots__ = ()
+
+    @property
+    def is_driver(self):
+        return self.driver_id is not None
+
+    @property
+    def driver(self):
+        """A DriverProfile holding only its ids, enough to filter or assign by"""
+        if self.driver_id is None:
+            return None
+        return DriverProfile(pk=self.driver_id, user_id=self.user_id)
+
+
+def principal_key(user):
+    return f'principal:{user.pk}:{user.role}:{user.principal_version}'
+
+
+def load_principal(user_id):
+    """Resolve a user's principal from the database in one query"""
+    active_vehicle = (
+        Vehicle.objects.filter(driver=OuterRef('driver_profile'), is_active=True)
+        .order_by('-created_at').values('id')[:1]
+    )
+    role, driver_id, vehicle_id = (
+        User.objects.filter(pk=user_id)
+        .values_list('role', 'driver_profile', Subquery(active_vehicle))
+        .get()
+    )
+    return Principal(user_id, role, driver_id if role == 'driver' else None, vehicle_id)
+
+
+def get_principal(request):
+    """The principal of request.user (None if anonymous), memoized on request"""
+    principal = getattr(request, '_principal', None)
+    if principal is not None:
+        return principal
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    key = principal_key(user)
+    cached = cache.get(key)
+    if cached is None:
+        principal = load_principal(user.pk)
+        cache.set(key, tuple(principal), settings.PRINCIPAL_CACHE_TIMEOUT)
+    else:
+        principal = Principal(*cached)
+    request._principal = principal
+    return principal
+
+
+def invalidate(users):
+    """Retire the cached principals of a User queryset"""
+    users.update(principal_version=F('principal_version') + 1)
+
+
+@receiver(post_save, sender=DriverProfile)
+@receiver(post_delete, sender=DriverProfile)
+def invalidate_driver(sender, instance, **kwargs):
+    invalidate(User.objects.filter(pk=instance.user_id))
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+def invalidate_vehicle_owner(sender, instance, **kwargs):
+    invalidate(User.objects.filter(driver_profile=instance.driver_id))
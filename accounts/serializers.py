@@ -0,0 +1,17 @@
+from rest_framework import serializers
+
+from taxi_project.api import ValuesSerializer
+
+
+class DriverProfileSerializer(ValuesSerializer):
+    """Public side of a driver profile row of DriverProfileViewSet"""
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    car_model = serializers.CharField()
+    car_number = serializers.CharField()
+    rating = serializers.DecimalField(max_digits=3, decimal_places=2)
+    recent_rating = serializers.DecimalField(max_digits=3, decimal_places=2)
+    rating_count = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
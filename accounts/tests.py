@@ -1,7 +1,19 @@
-﻿from django.test import TestCase
+﻿from io import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import RequestFactory, TestCase
 from django.urls import reverse
 
+from taxi_project.testing import QueryBudgetMixin
+from trips.models import DriverActivity, Trip
+from vehicles.models import Vehicle
+
 from .models import DriverProfile, User
+from .principal import Principal, get_principal
 
 
 class UserModelTest(TestCase):
@@ -73,3 +85,208 @@ class RegistrationViewTest(TestCase):
         self.assertEqual(User.objects.count(), 1)
         user = User.objects.first()
         self.assertEqual(user.role, 'rider')
+
+
+class ProfileQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.client.login(username='driver@test.com', password='testpass123')
+
+    def add_drivers(self, count=5):
+        start = DriverProfile.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(
+                username=f'driver{i}x',
+                email=f'driver{i}x@test.com',
+                password='testpass123',
+                role='driver'
+            )
+            DriverProfile.objects.create(
+                user=user, license_number=f'DL{i}x', car_number=f'C-{i}',
+                car_model='Kia'
+            )
+
+    def test_profile_query_budget(self):
+        # Session, user, trip statistics, driver profile
+        self.assertPageQueryBudget(reverse('accounts:profile'), 4, self.add_drivers)
+
+    def test_profile_update_query_budget(self):
+        self.assertPageQueryBudget(
+            reverse('accounts:profile_update'), 3, self.add_drivers
+        )
+
+
+class GenerateLoadDataTest(TestCase):
+    def generate(self, **options):
+        call_command(
+            'generate_load_data', riders=5, drivers=3, trips=50, prefix='t',
+            stdout=StringIO(), **options
+        )
+
+    def test_generates_requested_volume(self):
+        self.generate()
+        self.assertEqual(User.objects.filter(role='rider').count(), 5)
+        self.assertEqual(DriverProfile.objects.count(), 3)
+        self.assertEqual(Vehicle.objects.count(), 3)
+        self.assertEqual(Trip.objects.count(), 50)
+        self.assertTrue(
+            self.client.login(username='t-r0@example.com', password='password123')
+        )
+
+    def test_status_mix(self):
+        self.generate(status_mix='requested=1')
+        self.assertFalse(Trip.objects.exclude(status='requested').exists())
+        self.assertFalse(Trip.objects.filter(driver__isnull=False).exists())
+
+        self.generate(status_mix='completed=1', clear=True)
+        self.assertEqual(Trip.objects.filter(status='completed').count(), 50)
+        self.assertFalse(Trip.objects.filter(price__isnull=True).exists())
+
+    def test_same_seed_same_data(self):
+        self.generate(seed=7)
+        first = list(Trip.objects.order_by('pk').values_list('origin', 'status'))
+        self.generate(seed=7, clear=True)
+        second = list(Trip.objects.order_by('pk').values_list('origin', 'status'))
+        self.assertEqual(first, second)
+
+    def test_clear_deletes_driver_activity(self):
+        self.generate()
+        DriverActivity.objects.create(driver=DriverProfile.objects.first(), day='2026-01-01')
+        self.generate(clear=True)
+        self.assertFalse(DriverActivity.objects.exists())
+        connection.check_constraints()
+
+    def test_existing_prefix_requires_clear(self):
+        self.generate()
+        with self.assertRaises(CommandError):
+            self.generate()
+
+
+class DriverApiTest(TestCase):
+    def test_driver_list(self):
+        for i in range(3):
+            user = User.objects.create_user(
+                username=f'driver{i}',
+                email=f'driver{i}@test.com',
+                password='testpass123',
+                first_name='Driver',
+                last_name=str(i),
+                role='driver'
+            )
+            DriverProfile.objects.create(
+                user=user, license_number=f'DL{i}', car_number=f'ABC-{i}', car_model='Camry'
+            )
+        self.client.login(username='driver0@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:driver-list'), {'fields': 'name,rating'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'name': 'Driver 2', 'rating': '5.00'},
+            {'name': 'Driver 1', 'rating': '5.00'},
+            {'name': 'Driver 0', 'rating': '5.00'},
+        ])
+
+
+class PrincipalTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.request = RequestFactory().get('/')
+        self.request.user = self.driver_user
+
+    def test_resolved_once(self):
+        with self.assertNumQueries(1):
+            principal = get_principal(self.request)
+        self.assertEqual(
+            principal, Principal(self.driver_user.pk, 'driver', self.driver_profile.pk, None)
+        )
+        self.assertEqual(principal.driver.pk, self.driver_profile.pk)
+
+        request = RequestFactory().get('/')
+        request.user = self.driver_user
+        with self.assertNumQueries(0):
+            self.assertEqual(get_principal(request), principal)
+
+    def test_riders_and_anonymous_users(self):
+        rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123', role='rider'
+        )
+        self.request.user = rider
+        principal = get_principal(self.request)
+        self.assertFalse(principal.is_driver)
+        self.assertIsNone(principal.driver)
+        self.request = RequestFactory().get('/')
+        self.request.user = AnonymousUser()
+        self.assertIsNone(get_principal(self.request))
+
+    def principal(self):
+        """The principal of a new request, with the user loaded like a session does"""
+        request = RequestFactory().get('/')
+        request.user = User.objects.get(pk=self.driver_user.pk)
+        return get_principal(request)
+
+    def test_vehicle_changes_invalidate(self):
+        self.principal()
+        vehicle = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-123', car_model='Camry', year=2020
+        )
+        self.assertEqual(self.principal().vehicle_id, vehicle.pk)
+
+        vehicle.is_active = False
+        vehicle.save()
+        self.assertIsNone(self.principal().vehicle_id)
+
+    def test_role_and_profile_changes_miss_every_cached_entry(self):
+        # Nothing is deleted from the cache: another process keeps its entry
+        self.assertEqual(self.principal().driver_id, self.driver_profile.pk)
+        self.driver_profile.delete()
+        self.assertIsNone(self.principal().driver_id)
+        profile = DriverProfile.objects.create(
+            user=self.driver_user, license_number='DL2', car_number='ABC-2', car_model='Golf'
+        )
+        self.assertEqual(self.principal().driver_id, profile.pk)
+        User.objects.filter(pk=self.driver_user.pk).update(role='rider')
+        self.assertFalse(self.principal().is_driver)
+
+    def test_user_saves_keep_the_version(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        stale = User.objects.get(pk=self.driver_user.pk)
+        self.assertEqual(self.principal().driver_id, self.driver_profile.pk)
+        self.driver_profile.delete()
+        stale.phone = '555-0100'
+        stale.save()
+        self.assertIsNone(self.principal().driver_id)
+        response = self.client.post(reverse('accounts:update_info'), {
+            'username': 'driver1', 'email': 'driver@test.com', 'phone': '555-0101',
+        })
+        self.assertRedirects(response, reverse('accounts:profile'))
+        self.assertIsNone(self.principal().driver_id)
+        self.assertEqual(User.objects.get(pk=self.driver_user.pk).phone, '555-0101')
+
+    def test_driver_trip_list_makes_no_identity_query(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        self.client.get(reverse('trips:trip_list'))
+        # session, user, trips
+        with self.assertNumQueries(3):
+            self.client.get(reverse('trips:trip_list'))
@@ -6,8 +6,11 @@ from django.contrib.auth.views import LoginView, LogoutView
 from django.db import transaction
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.views.generic import UpdateView
 
+from trips.models import TripStats
+
 from .forms import DriverProfileForm, UserRegistrationForm, UserUpdateForm
 from .models import DriverProfile
 
@@ -55,7 +58,9 @@ def register(request):
 @login_required
 def profile(request):
     """User profile view"""
-    return render(request, 'accounts/profile.html')
+    # One row kept up to date by trips.stats, not an aggregate over trips
+    stats = TripStats.objects.filter(user=request.user, role=request.user.role).first()
+    return render(request, 'accounts/profile.html', {'stats': stats})
 
 
 class ProfileUpdateView(LoginRequiredMixin, UpdateView):
@@ -80,6 +85,9 @@ def update_user_info(request):
         form = UserUpdateForm(request.POST, instance=request.user)
         if form.is_valid():
             form.save()
+            # Trip pages show a driver's contact details and are revalidated
+            # against the profile's updated_at
+            DriverProfile.objects.filter(user=request.user).update(updated_at=timezone.now())
             messages.success(request, 'Information updated successfully!')
             return redirect('accounts:profile')
     else:
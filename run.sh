@@ -21,6 +21,11 @@ if [ $? -ne 0 ]; then
     python manage.py migrate
 fi
 
+# Start the background task worker (photo variants), stopped with the server
+python manage.py run_tasks &
+WORKER_PID=$!
+trap 'kill $WORKER_PID 2>/dev/null' EXIT
+
 # Start development server
 echo "Starting Taxi Service..."
 echo "Access at: http://localhost:8000"
@@ -0,0 +1,41 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'name', 'status', 'attempts', 'max_attempts',
+        'run_at', 'locked_by', 'finished_at'
+    ]
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = [
+        'name', 'args', 'attempts', 'locked_at', 'locked_by',
+        'last_error', 'created_at', 'finished_at'
+    ]
+    actions = ['retry']
+
+    fieldsets = (
+        ('Task', {
+            'fields': ('name', 'args')
+        }),
+        ('Status', {
+            'fields': ('status', ('attempts', 'max_attempts'), 'run_at', 'last_error')
+        }),
+        ('Worker', {
+            'fields': ('locked_at', 'locked_by')
+        }),
+        ('Timestamps', {
+            'fields': ('created_at', 'finished_at')
+        }),
+    )
+
+    @admin.action(description='Run the selected failed tasks again')
+    def retry(self, request, queryset):
+        count = queryset.filter(status='failed').update(
+            status='queued', attempts=0, run_at=timezone.now(), finished_at=None
+        )
+        self.message_user(request, f'{count} tasks queued again.')
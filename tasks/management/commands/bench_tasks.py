@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.models import Task
+from tasks.queue import task
+from tasks.worker import Worker
+
+
+@task
+def bench_task(sleep_ms):
+    """Stands in for an I/O-bound side effect"""
+    time.sleep(sleep_ms / 1000)
+
+
+class Command(BaseCommand):
+    help = (
+        'Queue --tasks tasks of --sleep-ms each and time a burst worker '
+        'running them at each --concurrency, in threads or processes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000)
+        parser.add_argument('--sleep-ms', type=float, default=5)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+
+    def handle(self, *args, **options):
+        for concurrency in options['concurrency']:
+            Task.objects.bulk_create([
+                Task(name=bench_task.task_name, args=[options['sleep_ms']])
+                for _ in range(options['tasks'])
+            ])
+            worker = Worker(concurrency=concurrency, pool=options['pool'],
+                            log=lambda line: None)
+            started = time.perf_counter()
+            processed = worker.run(burst=True)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'concurrency={concurrency} pool={options["pool"]}: {processed} tasks '
+                f'in {elapsed:.2f}s, {processed / elapsed:.0f} tasks/s'
+            )
+        Task.objects.filter(name=bench_task.task_name).delete()
@@ -0,0 +1,45 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks in a pool of threads or processes, '
+        'until stopped or, with --burst, until the queue is empty'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            default=settings.TASK_WORKER_CONCURRENCY,
+                            help='Tasks run at the same time')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Run tasks in threads, or in processes for CPU-bound work')
+        parser.add_argument('--batch', type=int, default=None,
+                            help='Tasks claimed per query (default: --concurrency)')
+        parser.add_argument('--poll-interval', type=float, default=settings.TASK_POLL_SECONDS,
+                            help='Seconds between queue checks when no NOTIFY arrives')
+        parser.add_argument('--stats-interval', type=float, default=60,
+                            help='Seconds between throughput reports')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no task is ready')
+        parser.add_argument('--max-tasks', type=int, default=None,
+                            help='Exit after running this many tasks')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'], pool=options['pool'],
+            batch=options['batch'], poll_interval=options['poll_interval'],
+            stats_interval=options['stats_interval'], log=self.stdout.write,
+        )
+        # Running tasks are finished and recorded before exiting
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.stdout.write(
+            f'Worker {worker.name}: {worker.concurrency} {options["pool"]}s'
+        )
+        processed = worker.run(burst=options['burst'], max_tasks=options['max_tasks'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} tasks.'))
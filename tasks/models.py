@@ -0,0 +1,56 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """A queued call of a background task function (see tasks.queue)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200, verbose_name='Task')
+    args = models.JSONField(default=list, blank=True, verbose_name='Arguments')
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default='queued',
+        verbose_name='Status'
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name='Attempts')
+    max_attempts = models.PositiveIntegerField(default=5, verbose_name='Max Attempts')
+    run_at = models.DateTimeField(default=timezone.now, verbose_name='Run At')
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name='Locked At')
+    locked_by = models.CharField(max_length=100, blank=True, verbose_name='Locked By')
+    last_error = models.TextField(blank=True, verbose_name='Last Error')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Finished At')
+
+    class Meta:
+        verbose_name = 'Task'
+        verbose_name_plural = 'Tasks'
+        ordering = ['-id']
+        # Workers only ever scan the small queued and running subsets
+        indexes = [
+            models.Index(
+                fields=['run_at', 'id'],
+                condition=Q(status='queued'),
+                name='task_ready_idx',
+            ),
+            models.Index(
+                fields=['locked_at'],
+                condition=Q(status='running'),
+                name='task_lease_idx',
+            ),
+            models.Index(
+                fields=['finished_at'],
+                condition=Q(status='done'),
+                name='task_done_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Task #{self.id}: {self.name} ({self.status})'
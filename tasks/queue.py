@@ -0,0 +1,100 @@
+"""
+Background tasks stored in Postgres, run by ``manage.py run_tasks``.
+
+A function decorated with ``@task`` is queued with ``func.enqueue(*args)``.
+The ``tasks_task`` row is inserted in the caller's transaction, so workers
+see it exactly when that transaction commits and never see it if it rolls
+back: the side effect cannot run against data that was not saved, nor be
+lost after data that was. Arguments are stored as JSON, so pass ids rather
+than model instances. A ``NOTIFY`` sent with the insert (also delivered on
+commit) wakes idle workers; see ``tasks.worker`` for claiming and retries.
+"""
+import importlib
+import signal
+import time
+import traceback
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+NOTIFY_CHANNEL = 'tasks'
+
+REGISTRY = {}
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register func as a background task, named after its module and
+    function unless name is given, and give it an enqueue() method
+    """
+    def register(func):
+        task_name = name or f'{func.__module__}.{func.__qualname__}'
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.enqueue = lambda *args, **options: enqueue(task_name, *args, **options)
+        REGISTRY[task_name] = func
+        return func
+    return register(func) if func is not None else register
+
+
+def resolve(name):
+    """The function registered as name, importing its module if needed"""
+    if name not in REGISTRY:
+        try:
+            importlib.import_module(name.rpartition('.')[0])
+        except ImportError:
+            pass
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise LookupError(f'Unknown task {name!r}') from None
+
+
+def enqueue(name, *args, delay=0, max_attempts=None, using='default'):
+    """
+    Queue a call of the task name (or a @task function) with args, to run
+    delay seconds from now; return the Task. Workers only see it once the
+    current transaction commits.
+    """
+    from .models import Task
+
+    name = getattr(name, 'task_name', name)
+    func = resolve(name)
+    queued = Task.objects.using(using).create(
+        name=name,
+        args=list(args),
+        max_attempts=max_attempts or func.max_attempts or settings.TASK_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    if not delay:
+        with connections[using].cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [NOTIFY_CHANNEL, name])
+    return queued
+
+
+def execute(name, args):
+    """
+    Run a task in the calling thread or process; return the traceback of
+    its exception ('' on success) and its run time in seconds
+    """
+    started = time.perf_counter()
+    error = ''
+    try:
+        resolve(name)(*args)
+    except Exception:
+        error = traceback.format_exc()
+        # A failed task may have left its connection broken; the next one reconnects
+        for conn in connections.all(initialized_only=True):
+            if not conn.in_atomic_block and not conn.is_usable():
+                conn.close()
+    return error, time.perf_counter() - started
+
+
+def init_process():
+    """Initializer of the run_tasks process pool, whose processes are spawned"""
+    # Ctrl+C reaches the whole process group; the parent lets running tasks finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    django.setup()
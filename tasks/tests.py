@@ -0,0 +1,137 @@
+import io
+import threading
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .models import Task
+from .queue import enqueue, task
+from .worker import Metrics, claim, finish, reclaim_expired, run_pending
+
+CALLS = []
+
+
+@task
+def record(value):
+    CALLS.append(value)
+
+
+@task(max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASK_RETRY_BASE_SECONDS=10, TASK_RETRY_MAX_SECONDS=60)
+class TaskQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_and_run(self):
+        queued = record.enqueue('a')
+        self.assertEqual((queued.name, queued.args, queued.status), ('tasks.tests.record', ['a'], 'queued'))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(CALLS, ['a'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('done', 1))
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_rolled_back_enqueue_never_runs(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                record.enqueue('lost')
+                raise ValueError
+        self.assertEqual(run_pending(), 0)
+        self.assertEqual(CALLS, [])
+
+    def test_unknown_task(self):
+        with self.assertRaises(LookupError):
+            enqueue('tasks.tests.missing')
+
+    def test_delayed_task_waits(self):
+        record.enqueue('later', delay=60)
+        self.assertEqual(run_pending(), 0)
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_pending(), 1)
+
+    def test_failure_is_retried_with_backoff_then_fails(self):
+        queued = explode.enqueue()
+        before = timezone.now()
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        # Half to all of the 10s base delay
+        self.assertGreaterEqual(queued.run_at, before + timedelta(seconds=5))
+        self.assertLessEqual(queued.run_at, timezone.now() + timedelta(seconds=10))
+        self.assertEqual(run_pending(), 0)
+
+        Task.objects.update(run_at=timezone.now())
+        run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('failed', 2))
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_expired_lease_is_reclaimed(self):
+        queued = record.enqueue('again')
+        [claimed] = claim(10, 'dead-worker')
+        self.assertEqual(claim(10, 'other-worker'), [])
+        Task.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(reclaim_expired(), 1)
+        # The dead worker's late result no longer counts
+        finish([(claimed, 'late failure')], 'dead-worker')
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.last_error), ('queued', ''))
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(CALLS, ['again'])
+
+    def test_metrics_report(self):
+        metrics = Metrics()
+        metrics.record('done', 0.002)
+        metrics.record('retried', 0.004)
+        line = metrics.report(3, 1.5)
+        self.assertIn('2 tasks in', line)
+        self.assertIn('1 done, 1 retried, 0 failed', line)
+        self.assertIn('p95=4.0ms', line)
+        self.assertIn('3 ready, oldest waiting 1.5s', line)
+        self.assertEqual(metrics.durations_ms, [])
+
+
+class TaskWorkerTest(TransactionTestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_claims_skip_locked_rows(self):
+        for value in range(10):
+            record.enqueue(value)
+        other = {}
+
+        def claim_elsewhere():
+            try:
+                other['tasks'] = claim(10, 'worker-b')
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            mine = claim(4, 'worker-a')
+            # Runs while worker-a's rows are still locked, without waiting on them
+            thread = threading.Thread(target=claim_elsewhere)
+            thread.start()
+            thread.join(timeout=10)
+        self.assertEqual(len(mine), 4)
+        self.assertEqual(len(other['tasks']), 6)
+        self.assertFalse({task.pk for task in mine} & {task.pk for task in other['tasks']})
+
+    def test_run_tasks_burst(self):
+        for value in range(20):
+            record.enqueue(value)
+        explode.enqueue()
+        out = io.StringIO()
+        call_command('run_tasks', '--burst', '--concurrency', '4', stdout=out)
+        self.assertEqual(sorted(CALLS), list(range(20)))
+        self.assertEqual(Task.objects.filter(status='done').count(), 20)
+        self.assertEqual(Task.objects.get(name=explode.task_name).status, 'queued')
+        self.assertIn('20 done, 1 retried, 0 failed', out.getvalue())
+        self.assertIn('Ran 21 tasks.', out.getvalue())
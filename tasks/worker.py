@@ -0,0 +1,296 @@
+"""
+Claiming and running the tasks queued by ``tasks.queue``.
+
+``claim()`` takes ready rows in one statement whose subquery locks them
+``FOR UPDATE SKIP LOCKED``: concurrent workers skip each other's rows
+instead of waiting on them, so each row goes to exactly one worker. A
+claimed row is ``running`` under a lease of ``TASK_LEASE_SECONDS``; if its
+worker dies, ``reclaim_expired()`` queues it again, so a task may run more
+than once and should be idempotent. ``finish()`` marks tasks done, queues a
+failed one again after an exponential backoff with jitter, or marks it
+failed once it has run ``max_attempts`` times.
+
+``Worker`` is the loop behind ``manage.py run_tasks``: it keeps up to
+``concurrency`` tasks running in a thread or process pool, waits on
+``LISTEN`` while the queue is empty and reports its throughput.
+"""
+import logging
+import multiprocessing
+import os
+import random
+import select
+import socket
+import time
+import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from taxi_project.benchmarks import percentile
+
+from .models import Task
+from .queue import NOTIFY_CHANNEL, execute, init_process
+
+logger = logging.getLogger(__name__)
+
+TABLE = Task._meta.db_table
+
+CLAIM_SQL = f'''
+    UPDATE {TABLE}
+    SET status = 'running', attempts = attempts + 1, locked_at = %s, locked_by = %s
+    WHERE id IN (
+        SELECT id FROM {TABLE}
+        WHERE status = 'queued' AND run_at <= %s
+        ORDER BY run_at, id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *
+'''
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(limit, worker, using='default'):
+    """Lock up to limit ready tasks for worker; return them, oldest first"""
+    # Python's clock, not now(): that is the start of the caller's transaction
+    now = timezone.now()
+    claimed = Task.objects.using(using).raw(CLAIM_SQL, [now, worker, now, limit])
+    return sorted(claimed, key=lambda task: (task.run_at, task.id))
+
+
+def retry_delay(attempts):
+    """Seconds before the next run of a task that failed attempts times"""
+    delay = min(
+        settings.TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+        settings.TASK_RETRY_MAX_SECONDS,
+    )
+    # Spreads out the retries of tasks that failed together
+    return delay * random.uniform(0.5, 1)
+
+
+def finish(results, worker, using='default'):
+    """
+    Record the outcome of claimed tasks, given as (task, error) pairs;
+    return 'done', 'retried' or 'failed' for each
+    """
+    now = timezone.now()
+    tasks = Task.objects.using(using)
+    succeeded = [task.pk for task, error in results if not error]
+    if succeeded:
+        tasks.filter(pk__in=succeeded, status='running', locked_by=worker).update(
+            status='done', finished_at=now, locked_at=None, last_error=''
+        )
+    outcomes = []
+    for task, error in results:
+        if not error:
+            outcomes.append('done')
+            continue
+        # Unless its lease expired and another worker took it over
+        current = tasks.filter(pk=task.pk, status='running', locked_at=task.locked_at)
+        if task.attempts < task.max_attempts:
+            current.update(
+                status='queued', locked_at=None, last_error=error,
+                run_at=now + timedelta(seconds=retry_delay(task.attempts)),
+            )
+            outcomes.append('retried')
+        else:
+            current.update(status='failed', finished_at=now, locked_at=None, last_error=error)
+            outcomes.append('failed')
+    return outcomes
+
+
+def reclaim_expired(using='default'):
+    """Queue again the running tasks whose lease expired; return how many"""
+    now = timezone.now()
+    expired = Task.objects.using(using).filter(
+        status='running', locked_at__lt=now - timedelta(seconds=settings.TASK_LEASE_SECONDS)
+    )
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(
+        status='failed', finished_at=now, locked_at=None,
+        last_error='Lease expired: the worker running it stopped or timed out',
+    )
+    return failed + expired.update(status='queued', run_at=now, locked_at=None, locked_by='')
+
+
+def purge_finished(using='default'):
+    """Delete the done tasks older than TASK_KEEP_DONE_DAYS; return how many"""
+    cutoff = timezone.now() - timedelta(days=settings.TASK_KEEP_DONE_DAYS)
+    deleted, _ = Task.objects.using(using).filter(status='done', finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def queue_depth(using='default'):
+    """Number of ready tasks and the seconds the oldest one has waited"""
+    now = timezone.now()
+    ready = Task.objects.using(using).filter(status='queued', run_at__lte=now).aggregate(
+        count=Count('id'), oldest=Min('run_at')
+    )
+    lag = (now - ready['oldest']).total_seconds() if ready['oldest'] else 0.0
+    return ready['count'], lag
+
+
+def run_pending(limit=None, worker='inline', using='default'):
+    """
+    Run ready tasks one by one in this thread until none is left (or limit
+    have run); return how many ran. For tests and one-off scripts.
+    """
+    count = 0
+    while limit is None or count < limit:
+        claimed = claim(1, worker, using=using)
+        if not claimed:
+            break
+        task = claimed[0]
+        error, _ = execute(task.name, task.args)
+        finish([(task, error)], worker, using=using)
+        count += 1
+    return count
+
+
+class Metrics:
+    """Outcomes and run times of a worker's tasks since the last report"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.outcomes = {'done': 0, 'retried': 0, 'failed': 0}
+        self.durations_ms = []
+
+    def record(self, outcome, seconds):
+        self.outcomes[outcome] += 1
+        self.durations_ms.append(seconds * 1000)
+
+    def report(self, ready, lag):
+        """One line of throughput, outcomes, run times and backlog; starts a new period"""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        finished = len(self.durations_ms)
+        line = (
+            f'{finished} tasks in {elapsed:.1f}s ({finished / elapsed:.1f}/s): '
+            f"{self.outcomes['done']} done, {self.outcomes['retried']} retried, "
+            f"{self.outcomes['failed']} failed; "
+            f'run p50={percentile(self.durations_ms, 50):.1f}ms '
+            f'p95={percentile(self.durations_ms, 95):.1f}ms; '
+            f'{ready} ready, oldest waiting {lag:.1f}s'
+        )
+        self.reset()
+        return line
+
+
+class Worker:
+    """Runs queued tasks in a pool of concurrency threads or processes"""
+
+    def __init__(self, concurrency=None, pool='thread', batch=None, poll_interval=None,
+                 stats_interval=60, name=None, log=None):
+        if pool not in ('thread', 'process'):
+            raise ValueError(f'Unknown pool {pool!r}')
+        self.concurrency = concurrency or settings.TASK_WORKER_CONCURRENCY
+        self.pool = pool
+        self.batch = batch or self.concurrency
+        self.poll_interval = poll_interval or settings.TASK_POLL_SECONDS
+        self.stats_interval = stats_interval
+        self.name = name or worker_name()
+        self.log = log or logger.info
+        self.metrics = Metrics()
+        self.stopping = False
+        self._listening_on = None
+        # Written to by stop() to end a wait for work early
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def stop(self, *args):
+        """Finish the running tasks and return from run(); usable as a signal handler"""
+        self.stopping = True
+        os.write(self._wakeup_write, b'.')
+
+    def _executor(self):
+        if self.pool == 'process':
+            # Spawned, not forked: a child must not share the parent's connections
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_process,
+            )
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='task')
+
+    def _wait_for_work(self, timeout):
+        """Sleep until a task is queued (NOTIFY), stop() is called or timeout passes"""
+        connection.ensure_connection()
+        conn = connection.connection
+        if conn is not self._listening_on:
+            with connection.cursor() as cursor:
+                cursor.execute(f'LISTEN {NOTIFY_CHANNEL}')
+            self._listening_on = conn
+        readable, _, _ = select.select([conn, self._wakeup_read], [], [], timeout)
+        if conn in readable:
+            conn.poll()
+            conn.notifies.clear()
+
+    def _collect(self, running, timeout):
+        """Record the tasks of running that complete within timeout; return how many"""
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        results, durations = [], []
+        for future in done:
+            task = running.pop(future)
+            try:
+                error, seconds = future.result()
+            except Exception:  # the pool broke, e.g. a process was killed
+                error, seconds = traceback.format_exc(), 0.0
+            results.append((task, error))
+            durations.append(seconds)
+        for outcome, seconds in zip(finish(results, self.name), durations):
+            self.metrics.record(outcome, seconds)
+        return len(done)
+
+    def _maintain(self):
+        reclaimed = reclaim_expired()
+        if reclaimed:
+            self.log(f'Queued {reclaimed} tasks again after their lease expired')
+        purge_finished()
+        self.log(self.metrics.report(*queue_depth()))
+
+    def run(self, burst=False, max_tasks=None):
+        """
+        Run tasks until stop() (with burst, until the queue is empty; with
+        max_tasks, until that many have run); return how many ran
+        """
+        processed = 0
+        running = {}
+        next_report = time.monotonic() + self.stats_interval
+        executor = self._executor()
+        try:
+            while running or not self.stopping:
+                capacity = self.concurrency - len(running)
+                if max_tasks is not None:
+                    capacity = min(capacity, max_tasks - processed - len(running))
+                claimed = []
+                if capacity > 0 and not self.stopping:
+                    claimed = claim(min(capacity, self.batch), self.name)
+                for task in claimed:
+                    running[executor.submit(execute, task.name, task.args)] = task
+                if running:
+                    processed += self._collect(running, self.poll_interval)
+                elif burst or (max_tasks is not None and processed >= max_tasks):
+                    break
+                elif not self.stopping:
+                    self._wait_for_work(
+                        min(self.poll_interval, max(next_report - time.monotonic(), 0))
+                    )
+                if time.monotonic() >= next_report:
+                    self._maintain()
+                    next_report = time.monotonic() + self.stats_interval
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        self.log(self.metrics.report(*queue_depth()))
+        return processed
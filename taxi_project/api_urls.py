@@ -0,0 +1,17 @@
+"""
+Version 1 of the REST API, included under ``/api/v1/`` as namespace ``v1``.
+"""
+from rest_framework.routers import DefaultRouter
+
+from accounts.api import DriverProfileViewSet
+from trips.api import TripViewSet
+from vehicles.api import VehicleViewSet
+
+app_name = 'api'
+
+router = DefaultRouter()
+router.register('trips', TripViewSet, basename='trip')
+router.register('vehicles', VehicleViewSet, basename='vehicle')
+router.register('drivers', DriverProfileViewSet, basename='driver')
+
+urlpatterns = router.urls
@@ -2,15 +2,61 @@
 ASGI config for taxi_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. ``uvicorn taxi_project.asgi:application``)
+to enable the live trip feeds under ``/trips/.../feed/``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'taxi_project.settings')
 
-application = get_asgi_application()
+
+class StreamDisconnectMiddleware:
+    """
+    Cancel long-lived streaming responses when the client disconnects.
+
+    Django 4.2 stops reading ``receive`` once the request body is consumed,
+    so an open Server-Sent Events stream would otherwise outlive its client.
+    """
+
+    def __init__(self, app, path_suffix='/feed/'):
+        self.app = app
+        self.path_suffix = path_suffix
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not scope['path'].endswith(self.path_suffix):
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+
+        async def app_receive():
+            message = await receive()
+            if message['type'] != 'http.request' or not message.get('more_body'):
+                body_read.set()
+            return message
+
+        app_task = asyncio.ensure_future(self.app(scope, app_receive, send))
+
+        async def watch_disconnect():
+            await body_read.wait()
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            app_task.cancel()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not watcher.done():
+                raise
+        finally:
+            watcher.cancel()
+
+
+application = StreamDisconnectMiddleware(get_asgi_application())
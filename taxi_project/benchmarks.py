@@ -0,0 +1,68 @@
+"""
+Small helpers shared by the ``bench_*`` management commands.
+"""
+import math
+import os
+import resource
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of samples (nearest-rank method)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(samples_ms):
+    """Summarize a list of latencies in milliseconds"""
+    return {
+        'count': len(samples_ms),
+        'mean_ms': round(sum(samples_ms) / len(samples_ms), 3) if samples_ms else 0.0,
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'max_ms': round(max(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+def format_summary(summary):
+    """Render a latency summary as a single human readable line"""
+    return (
+        'n={count} mean={mean_ms}ms p50={p50_ms}ms p95={p95_ms}ms '
+        'p99={p99_ms}ms max={max_ms}ms'.format(**summary)
+    )
+
+
+def compare_results(baseline, current, metrics=('p95_ms', 'queries_per_request', 'rps')):
+    """
+    Diff two {name: summary} mappings; return [(name, metric, old, new, pct)].
+
+    pct is the relative change in percent, or None when the baseline is zero
+    or the metric is missing on either side.
+    """
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        old_summary = baseline.get(name, {})
+        new_summary = current.get(name, {})
+        for metric in metrics:
+            old = old_summary.get(metric)
+            new = new_summary.get(metric)
+            pct = None
+            if old and new is not None:
+                pct = round((new - old) / old * 100, 1)
+            rows.append((name, metric, old, new, pct))
+    return rows
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (peak where /proc is missing)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # ru_maxrss is in KB on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (2 ** 20 if os.uname().sysname == 'Darwin' else 2 ** 10)
@@ -0,0 +1,56 @@
+"""
+Bulk loading helpers for PostgreSQL.
+
+``copy_rows`` streams rows into a model's table with ``COPY ... FROM STDIN``
+in batches, which is several times faster than ``bulk_create`` and keeps
+memory flat however many rows are generated.
+"""
+import io
+from datetime import date, datetime
+
+from django.db import connections
+
+COPY_BATCH_SIZE = 50000
+
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_value(value):
+    """Render value in COPY text format"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value).translate(_ESCAPES)
+
+
+def copy_rows(model, fields, rows, using='default', batch_size=COPY_BATCH_SIZE):
+    """COPY an iterable of value tuples into model's table; return the row count"""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    opts = model._meta
+    columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+    sql = f'COPY {quote(opts.db_table)} ({columns}) FROM STDIN'
+
+    count = 0
+    buffer = io.StringIO()
+    with connection.cursor() as cursor:
+        for row in rows:
+            buffer.write('\t'.join(map(copy_value, row)))
+            buffer.write('\n')
+            count += 1
+            if count % batch_size == 0:
+                _flush(cursor, sql, buffer)
+                buffer = io.StringIO()
+        if buffer.tell():
+            _flush(cursor, sql, buffer)
+    return count
+
+
+def _flush(cursor, sql, buffer):
+    buffer.seek(0)
+    cursor.copy_expert(sql, buffer)
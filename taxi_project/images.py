@@ -0,0 +1,99 @@
+"""
+Resized variants of uploaded photos, built off the request path.
+
+An upload is stored as is and the request returns; ``schedule_variants()``
+queues a ``build_photo_variants`` task with the save (``tasks.queue``), run
+by a ``manage.py run_tasks`` worker once the transaction commits. Each size
+in ``IMAGE_VARIANT_SIZES`` is written as WebP and as a JPEG fallback under
+``<upload dir>/variants/``, named after a hash of its content so the files
+can be cached forever. The names land in the
+model's ``photo_variants`` JSON, recorded against the original they were
+built from, and ``{% picture %}`` (``taxi_project.templatetags.images``)
+serves the variant a template asks for.
+"""
+import hashlib
+import io
+from pathlib import PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from tasks.queue import task
+
+# (Pillow format, file extension, save options)
+FORMATS = [
+    ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+
+
+def build_variants(name, storage=default_storage):
+    """Write the variants of the image stored as name; return its photo_variants"""
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    path = PurePosixPath(name)
+    folder = path.parent / 'variants'
+
+    variants = {'source': name}
+    for label, size in settings.IMAGE_VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt, extension, options in FORMATS:
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt, **options)
+            data = buffer.getvalue()
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            target = str(folder / f'{path.stem}-{label}-{digest}.{extension}')
+            # Same name, same bytes: an earlier run already wrote it
+            if not storage.exists(target):
+                storage.save(target, ContentFile(data))
+            entry[extension] = target
+        variants[label] = entry
+    return variants
+
+
+def process_photo(model, pk):
+    """Build the variants of a row's current photo and store them on the row"""
+    names = list(model.objects.filter(pk=pk).values_list('photo', flat=True))
+    if not names:
+        return
+    name = names[0] or ''
+    variants = build_variants(name) if name else {}
+    current = model.objects.filter(pk=pk)
+    # Unless another upload replaced the photo meanwhile; it has its own job
+    current = current.filter(photo=name) if name else current.filter(photo__in=['', None])
+    # updated_at changes too: pages showing the photo are revalidated by it
+    current.update(photo_variants=variants, updated_at=timezone.now())
+
+
+@task
+def build_photo_variants(model_label, pk):
+    """Background task: process_photo() of the row pk of the model 'app_label.Model'"""
+    process_photo(apps.get_model(model_label), pk)
+
+
+def schedule_variants(sender, instance, update_fields=None, **kwargs):
+    """post_save receiver: queue a rebuild of the variants when the photo changes"""
+    if update_fields is not None and 'photo' not in update_fields:
+        return
+    name = instance.photo.name or ''
+    if name == (instance.photo_variants or {}).get('source', ''):
+        return
+    build_photo_variants.enqueue(sender._meta.label, instance.pk)
+
+
+def variant(instance, label):
+    """The variant entry of instance's current photo, or None if not built yet"""
+    variants = instance.photo_variants or {}
+    if not instance.photo or variants.get('source') != instance.photo.name:
+        return None
+    return variants.get(label)
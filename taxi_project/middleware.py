@@ -0,0 +1,179 @@
+"""
+Per-request instrumentation: SQL query count and time, template render time
+and the remaining view time, reported as a ``Server-Timing`` header and a
+structured log line.
+
+Hooks are installed once per process (a database execute wrapper added as
+connections open, and a wrapper around Django template rendering) and do
+nothing but a context variable lookup outside an instrumented request, so
+the middleware is cheap enough to leave on in production.
+"""
+import contextvars
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+logger = logging.getLogger('taxi_project.request_metrics')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+_installed = False
+
+
+class RequestMetrics:
+    """Counters collected while serving one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def duplicates(self, threshold):
+        """Statements executed at least threshold times, most repeated first"""
+        return [
+            (sql, count) for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_seconds += time.perf_counter() - started
+        metrics.queries += 1
+        # Parameters are separate, so the same statement text with different
+        # ids is exactly the N+1 signature
+        metrics.statements[sql] += 1
+
+
+def _add_execute_wrapper(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return render(self, context, request)
+        # Only the outermost render counts; nested renders are part of it
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_seconds += time.perf_counter() - started
+
+    wrapper.__wrapped__ = render
+    return wrapper
+
+
+def install():
+    """Install the process-wide query and template hooks (idempotent)"""
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(_add_execute_wrapper)
+    for connection in connections.all(initialized_only=True):
+        _add_execute_wrapper(None, connection)
+    Template.render = _timed_render(Template.render)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure SQL, template and view time per request.
+
+    Place first in MIDDLEWARE so the numbers include the other middleware.
+    ``view`` is the time left after SQL and template rendering.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, 'REQUEST_METRICS_SERVER_TIMING', True)
+        self.duplicate_threshold = getattr(
+            settings, 'REQUEST_METRICS_DUPLICATE_THRESHOLD', 3
+        )
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.report(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.report(request, response, metrics)
+        return response
+
+    def report(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        sql_ms = metrics.sql_seconds * 1000
+        template_ms = metrics.template_seconds * 1000
+        view_ms = max(total_ms - sql_ms - template_ms, 0.0)
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        duplicates = metrics.duplicates(self.duplicate_threshold)
+
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={sql_ms:.2f};desc="{metrics.queries} queries"',
+                f'tpl;dur={template_ms:.2f}',
+                f'view;dur={view_ms:.2f}',
+                f'total;dur={total_ms:.2f}',
+            ])
+
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'sql_ms': round(sql_ms, 2),
+            'template_ms': round(template_ms, 2),
+            'view_ms': round(view_ms, 2),
+            'total_ms': round(total_ms, 2),
+            'duplicate_statements': len(duplicates),
+        }
+        logger.info(
+            ' '.join(f'{key}={value}' for key, value in fields.items()),
+            extra={'request_metrics': fields},
+        )
+        for sql, count in duplicates:
+            logger.warning(
+                'Duplicate SQL in view=%s: executed %d times: %s',
+                view_name, count, sql[:500],
+                extra={'request_metrics': {'view': view_name, 'count': count, 'sql': sql}},
+            )
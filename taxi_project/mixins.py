@@ -0,0 +1,68 @@
+"""
+View mixins shared by the project apps.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date
+
+
+class SingleObjectCacheMixin:
+    """Fetch the object once per request even if test_func also needs it"""
+
+    def get_object(self, queryset=None):
+        if queryset is None and getattr(self, '_cached_object', None) is not None:
+            return self._cached_object
+        obj = super().get_object(queryset)
+        if queryset is None:
+            self._cached_object = obj
+        return obj
+
+
+class ConditionalPageMixin:
+    """
+    Answer GET with 304 Not Modified while the client's copy is current.
+
+    ``get_last_modified()`` says when what the page shows last changed,
+    from a lookup cheap enough to make before the object is loaded or the
+    template rendered; ``None`` (not found, nothing to show) renders as
+    usual. The ETag also covers ``get_etag_parts()``, the URL and the
+    parts of the page that depend on the visitor: the user in the navbar
+    and the CSRF secret behind the forms. Pages with flash messages are
+    always rendered, or the messages would never be seen.
+    """
+
+    def get_last_modified(self):
+        return None
+
+    def get_etag_parts(self):
+        return []
+
+    def get(self, request, *args, **kwargs):
+        last_modified = self.get_last_modified()
+        if last_modified is None or len(get_messages(request)):
+            return super().get(request, *args, **kwargs)
+
+        user = request.user
+        key = repr([
+            last_modified.isoformat(), self.get_etag_parts(), request.get_full_path(),
+            user.pk, user.get_username(), getattr(user, 'role', None),
+            request.META.get('CSRF_COOKIE'),
+        ])
+        etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+        timestamp = int(last_modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Cookie'])
+        return response
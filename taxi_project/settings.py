@@ -39,9 +39,11 @@ INSTALLED_APPS = [
     'accounts',
     'trips',
     'vehicles',
+    'tasks',
 ]
 
 MIDDLEWARE = [
+    'taxi_project.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +67,9 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'libraries': {
+                'images': 'taxi_project.templatetags.images',
+            },
         },
     },
 ]
@@ -83,6 +88,20 @@ DATABASES = {
     }
 }
 
+# REST API (taxi_project.api_urls): versioned by URL namespace, paged by
+# (created_at, id) keyset cursors like the HTML lists
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.NamespaceVersioning',
+    'ALLOWED_VERSIONS': ['v1'],
+    'DEFAULT_PAGINATION_CLASS': 'trips.pagination.KeysetCursorPagination',
+    'PAGE_SIZE': 20,
+}
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -117,6 +136,24 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploaded photos (taxi_project.images): variants, by longest side in
+# pixels, built as WebP and JPEG by a background task
+IMAGE_VARIANT_SIZES = {'thumb': 320, 'display': 960}
+
+# Background tasks (tasks.queue), run by manage.py run_tasks. A failed task
+# is retried after a backoff doubling from the base up to the max, until it
+# has run TASK_MAX_ATTEMPTS times; a task running longer than the lease is
+# taken to be lost with its worker and queued again. Idle workers wake on
+# NOTIFY, or poll every TASK_POLL_SECONDS; done tasks are kept for
+# TASK_KEEP_DONE_DAYS days.
+TASK_WORKER_CONCURRENCY = int(os.getenv('TASK_WORKER_CONCURRENCY', '4'))
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_BASE_SECONDS = 10
+TASK_RETRY_MAX_SECONDS = 60 * 60
+TASK_LEASE_SECONDS = 15 * 60
+TASK_POLL_SECONDS = 5
+TASK_KEEP_DONE_DAYS = 7
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -124,6 +161,120 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
+# Live trip feed (Server-Sent Events, served under ASGI). The Postgres
+# broadcaster fans events out across processes via LISTEN/NOTIFY; use
+# 'trips.live.LocalBroadcaster' for a single-process deployment.
+TRIP_FEED_BROADCASTER = os.getenv(
+    'TRIP_FEED_BROADCASTER', 'trips.live.PostgresBroadcaster'
+)
+
+# Radius search for drivers (trips.views.NearbyTripsView), in kilometres
+TRIP_NEARBY_RADIUS_KM = 5
+TRIP_NEARBY_MAX_RADIUS_KM = 50
+
+# Driver ratings: the recent rating is the mean of this many latest scores
+DRIVER_RATING_WINDOW = 20
+
+# Monthly partitions of trips_trip (trips.partitions): months created ahead
+# of time, and where archive_trip_partitions moves detached months
+TRIP_PARTITION_MONTHS_AHEAD = 3
+TRIP_ARCHIVE_SCHEMA = 'trips_archive'
+
+# Cached identity of request users (accounts.principal), in seconds. Keyed
+# on a version in the user row, so a per-process cache is never stale
+PRINCIPAL_CACHE_TIMEOUT = 60 * 60
+
+# Rendered trip-list rows (trips.row_cache) are kept in the default cache for
+# this many seconds; saves and status changes drop them earlier
+TRIP_ROW_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Trip history search (TripListView ?q=, trips.search): best matches shown
+TRIP_SEARCH_RESULTS = 50
+
+# Read models of the trip event log (trips.projections): events applied per
+# transaction when catching up, and per statement when replaying the log
+TRIP_PROJECTION_BATCH = 10000
+TRIP_PROJECTION_REPLAY_BATCH = 500000
+TRIP_PROJECTION_INTERVAL_SECONDS = 10
+
+# Admin changelists of large tables (taxi_project.admin): result counts are
+# exact up to this many rows and planner estimates above; a search matching
+# more related rows (e.g. user emails) than the limit filters by subquery
+ADMIN_EXACT_COUNT_LIMIT = 10000
+ADMIN_SEARCH_RELATED_LIMIT = 1000
+
+# Trip exports (trips.export) are read and streamed this many rows at a time
+TRIP_EXPORT_CHUNK_SIZE = 2000
+
+# Address autocomplete (trips.addresses): addresses of the last
+# ADDRESS_HISTORY_DAYS used by at least ADDRESS_MIN_RIDERS different riders
+# (so one rider's home is not suggested to others), most used first, after the
+# rider's own ADDRESS_RECENTS latest ones. Each process rebuilds its index
+# every ADDRESS_INDEX_TTL seconds, or ADDRESS_INDEX_RETRY seconds after a
+# failed build; prefixes of more than ADDRESS_SCAN_LIMIT entries are ranked
+# in advance.
+ADDRESS_HISTORY_DAYS = 365
+ADDRESS_MIN_RIDERS = 3
+ADDRESS_SUGGESTIONS = 8
+ADDRESS_RECENTS = 5
+ADDRESS_RECENT_RIDERS = 10000
+ADDRESS_INDEX_TTL = 3600
+ADDRESS_INDEX_RETRY = 300
+ADDRESS_SCAN_LIMIT = 256
+
+# Fare quotes (trips.fares): road distance is the straight line times the
+# route factor, driven at the average speed; compiled tariffs are reloaded
+# from the database at least every FARE_TABLE_TTL seconds
+FARE_ROUTE_FACTOR = 1.3
+FARE_AVERAGE_SPEED_KMH = 25
+FARE_TABLE_TTL = 60
+
+# Geocoding of trip addresses (trips.geocoding), which fares are quoted from:
+# a Nominatim search endpoint by default (point TRIP_GEOCODER_URL at your
+# own instance under load); 'trips.geocoding.NullGeocoder' leaves trips
+# unpriced. Located addresses are cached for TRIP_GEOCODER_CACHE_TIMEOUT.
+TRIP_GEOCODER = os.getenv('TRIP_GEOCODER', 'trips.geocoding.NominatimGeocoder')
+TRIP_GEOCODER_URL = os.getenv(
+    'TRIP_GEOCODER_URL', 'https://nominatim.openstreetmap.org/search'
+)
+TRIP_GEOCODER_USER_AGENT = 'taxi-service'
+TRIP_GEOCODER_TIMEOUT = 3
+TRIP_GEOCODER_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Batch dispatch (trips.dispatch): every tick, requested trips are assigned
+# to free drivers whose location is at most DRIVER_MAX_AGE seconds old.
+# Costs are in km of pickup distance: a minute of waiting is worth
+# WAIT_WEIGHT km, each rating star below 5 costs RATING_WEIGHT km.
+TRIP_DISPATCH_TICK_SECONDS = 5
+TRIP_DISPATCH_MAX_PICKUP_KM = 5
+TRIP_DISPATCH_WAIT_WEIGHT = 0.2
+TRIP_DISPATCH_RATING_WEIGHT = 1.0
+TRIP_DISPATCH_DRIVER_MAX_AGE = 300
+
+# Per-request metrics (taxi_project.middleware): query count, SQL, template
+# and view time as a Server-Timing header and a log line per request.
+# Statements repeated this many times in one request are logged as N+1.
+REQUEST_METRICS_SERVER_TIMING = os.getenv('REQUEST_METRICS_SERVER_TIMING', 'True') == 'True'
+REQUEST_METRICS_DUPLICATE_THRESHOLD = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'taxi_project.request_metrics': {
+            'handlers': ['console'],
+            # runserver already logs every request in development
+            'level': os.getenv(
+                'REQUEST_METRICS_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'
+            ),
+            'propagate': False,
+        },
+    },
+}
+
 # Login/Logout URLs
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'home'
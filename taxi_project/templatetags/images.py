@@ -0,0 +1,30 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from taxi_project.images import variant
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(instance, label, alt='', css_class='', style=''):
+    """
+    The photo of instance at the variant label: WebP with a JPEG fallback,
+    or the original until its variants are built
+    """
+    if not instance.photo:
+        return ''
+    entry = variant(instance, label)
+    if entry is None:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy">',
+            instance.photo.url, alt, css_class, style,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" width="{}" height="{}" alt="{}" class="{}" style="{}" loading="lazy">'
+        '</picture>',
+        default_storage.url(entry['webp']), default_storage.url(entry['jpg']),
+        entry['width'], entry['height'], alt, css_class, style,
+    )
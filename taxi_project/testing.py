@@ -0,0 +1,39 @@
+"""
+Test helpers shared by the project apps.
+"""
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    """Assertions that fail when a code path exceeds its query allowance"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget):
+        """Fail if the block runs more than budget queries"""
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > budget:
+            statements = '\n'.join(
+                f'{i}. {query["sql"]}'
+                for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(
+                f'{executed} queries executed, budget is {budget}:\n{statements}'
+            )
+
+    def assertPageQueryBudget(self, url, budget, grow, status_code=200):
+        """
+        Request url before and after calling grow() to add more rows and fail
+        if either request exceeds budget, i.e. if query count scales with data.
+        """
+        for attempt in range(2):
+            if attempt:
+                grow()
+            with self.assertQueryBudget(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status_code)
+        return response
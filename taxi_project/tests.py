@@ -0,0 +1,102 @@
+import asyncio
+import re
+from unittest import mock
+
+from django.db import connection
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from accounts.models import User
+
+from . import trigram
+from .middleware import RequestMetricsMiddleware
+
+SERVER_TIMING_RE = re.compile(
+    r'db;dur=[\d.]+;desc="(\d+) queries", tpl;dur=([\d.]+), '
+    r'view;dur=[\d.]+, total;dur=[\d.]+'
+)
+
+
+class RequestMetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.factory = RequestFactory()
+
+    def request(self):
+        request = self.factory.get('/trips/')
+        request.resolver_match = resolve('/trips/')
+        return request
+
+    def test_server_timing_counts_queries(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('trips:trip_list'))
+        match = SERVER_TIMING_RE.fullmatch(response['Server-Timing'])
+        self.assertIsNotNone(match, response['Server-Timing'])
+        self.assertEqual(int(match.group(1)), len(queries))
+        self.assertGreater(float(match.group(2)), 0)
+
+    def test_duplicate_statements_logged_with_view_name(self):
+        def n_plus_one(request):
+            for _ in range(3):
+                User.objects.filter(pk=self.user.pk).exists()
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(n_plus_one)
+        with self.assertLogs('taxi_project.request_metrics', 'WARNING') as logs:
+            middleware(self.request())
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('view=trips:trip_list', logs.output[0])
+        self.assertIn('executed 3 times', logs.output[0])
+
+    def test_log_line_is_structured(self):
+        def view(request):
+            return render(request, 'base.html')
+
+        middleware = RequestMetricsMiddleware(view)
+        with self.assertLogs('taxi_project.request_metrics', 'INFO') as logs:
+            middleware(self.request())
+        fields = logs.records[0].request_metrics
+        self.assertEqual(fields['view'], 'trips:trip_list')
+        self.assertEqual(fields['status'], 200)
+        self.assertEqual(fields['queries'], 0)
+        self.assertGreater(fields['template_ms'], 0)
+
+    def test_async_requests(self):
+        async def view(request):
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        response = asyncio.run(middleware(self.request()))
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+
+class TrigramIndexTest(TestCase):
+    def check(self):
+        return trigram.check_trigram_indexes(None, databases=['default'])
+
+    def test_check_passes_with_the_extension(self):
+        with mock.patch.object(trigram, 'trigram_installed', return_value=True):
+            self.assertEqual(self.check(), [])
+
+    def test_check_reports_skipped_indexes(self):
+        with mock.patch.object(trigram, 'trigram_installed', return_value=False):
+            warnings = self.check()
+        self.assertEqual([warning.id for warning in warnings], ['taxi_project.W001'])
+        self.assertIn('trips.0009_admin_search', warnings[0].msg)
+
+    def test_skipped_indexes_are_logged(self):
+        operation = trigram.create_trigram_indexes('accounts_user', ['email'])
+        with mock.patch.object(trigram, 'trigram_available', return_value=False), \
+                self.assertLogs('taxi_project.trigram', 'WARNING') as logs, \
+                connection.schema_editor() as schema_editor:
+            operation.code(None, schema_editor)
+        self.assertIn('accounts_user (email)', logs.output[0])
@@ -0,0 +1,91 @@
+"""
+Trigram (pg_trgm) indexes for substring search.
+
+Django's ``icontains`` compiles to ``UPPER(column::text) LIKE UPPER(%s)``,
+which no B-tree index can serve. A GIN index on that same expression with
+``gin_trgm_ops`` can, so the admin searches become bitmap index scans.
+pg_trgm ships with postgresql-contrib; where it is not available the
+migrations below skip the indexes, log a warning, and searches keep
+scanning the tables. The ``taxi_project.W001`` system check (``manage.py
+check --database default``, also run by ``migrate``) reports such a
+database until the extension is installed and each ``*_admin_search``
+migration has run again, e.g. ``migrate --fake trips 0008``, ``migrate
+trips 0009``, then ``migrate --fake trips`` for the migrations after it.
+"""
+import logging
+
+from django.core.checks import Tags, Warning, register
+from django.db import connections, migrations
+from django.db.migrations.recorder import MigrationRecorder
+
+logger = logging.getLogger(__name__)
+
+
+def trigram_available(connection):
+    """Whether the pg_trgm extension can be created in this database"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def trigram_installed(connection):
+    """Whether the pg_trgm extension is installed in this database"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def index_name(table, column):
+    return f'{table}_{column}_trgm'
+
+
+def create_trigram_indexes(table, columns):
+    """Migration operation adding a trigram index on each column of table, if it can"""
+    def forwards(apps, schema_editor):
+        if not trigram_available(schema_editor.connection):
+            logger.warning(
+                'pg_trgm is not available: trigram indexes on %s (%s) not created',
+                table, ', '.join(columns),
+            )
+            return
+        quote = schema_editor.quote_name
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for column in columns:
+            expression = f'UPPER({quote(column)}::text)'
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {quote(index_name(table, column))} '
+                f'ON {quote(table)} USING gin (({expression}) gin_trgm_ops)'
+            )
+
+    def backwards(apps, schema_editor):
+        quote = schema_editor.quote_name
+        for column in columns:
+            schema_editor.execute(
+                f'DROP INDEX IF EXISTS {quote(index_name(table, column))}'
+            )
+
+    return migrations.RunPython(forwards, backwards)
+
+
+@register(Tags.database)
+def check_trigram_indexes(app_configs, databases=None, **kwargs):
+    """Warn about databases whose admin search migrations skipped the indexes"""
+    warnings = []
+    for alias in databases or []:
+        connection = connections[alias]
+        applied = [
+            f'{app}.{name}'
+            for app, name in MigrationRecorder(connection).applied_migrations()
+            if name.endswith('_admin_search')
+        ]
+        if not applied or trigram_installed(connection):
+            continue
+        warnings.append(Warning(
+            f'pg_trgm is not installed in the {alias!r} database: '
+            f'{", ".join(sorted(applied))} created no trigram indexes',
+            hint='Install postgresql-contrib and apply those migrations again '
+                 '(see taxi_project.trigram); until then admin searches scan '
+                 'the tables.',
+            id='taxi_project.W001',
+        ))
+    return warnings
@@ -11,6 +11,7 @@ urlpatterns = [
     path('accounts/', include('accounts.urls')),
     path('trips/', include('trips.urls')),
     path('vehicles/', include('vehicles.urls')),
+    path('api/v1/', include('taxi_project.api_urls', namespace='v1')),
 ]
 
 # Serve media files in development
@@ -0,0 +1,316 @@
+"""
+Address autocomplete from past trip origins and destinations.
+
+``AddressIndex`` holds every address used by at least ``ADDRESS_MIN_RIDERS``
+riders in the last ``ADDRESS_HISTORY_DAYS``, once per normalized key
+(case-folded words, see ``normalize``), weighted by its trips and shown in
+its most used spelling. Every word of an address starts an entry of a
+sorted list, so "main st" finds "12 Main Street": the entries starting
+with a prefix are one run found by bisection. The best addresses of the
+prefixes with more than ``ADDRESS_SCAN_LIMIT`` entries are ranked when the
+index is built, so a keystroke never ranks more than that many.
+
+Each process builds its index in the background on first use, suggesting
+only the rider's recent addresses meanwhile, and rebuilds it every
+``ADDRESS_INDEX_TTL`` seconds; a build that fails is retried after
+``ADDRESS_INDEX_RETRY`` seconds, not on the next keystroke. Trips created
+in this process add to the weights of the addresses already indexed at
+once; addresses that are new wait for the next build (and are only shared
+once enough riders use them). Each rider's own latest addresses come
+first: they are read from their trip history on their first keystroke and
+kept for the ``ADDRESS_RECENT_RIDERS`` riders seen last.
+"""
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Trip
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r'\w+')
+# Sorts after every character of an address: the end of a prefix's run
+LAST_CHARACTER = '\U0010ffff'
+
+
+def normalize(address):
+    """Key of an address: its words, case-folded, separated by single spaces"""
+    return ' '.join(WORD_RE.findall(address.casefold()))
+
+
+def _word_starts(key):
+    """The suffixes of key starting at each of its words"""
+    words = key.split(' ')
+    return [' '.join(words[start:]) for start in range(len(words))]
+
+
+def _matches(key, prefix):
+    """Whether a word of key starts with prefix"""
+    return f' {key}'.find(f' {prefix}') >= 0
+
+
+class AddressIndex:
+    """Prefix index of addresses, most used first"""
+
+    def __init__(self, addresses, size=10, scan_limit=256):
+        """Index (spelling, trips) pairs; keep the size best per prefix"""
+        self.size = size
+        self.scan_limit = scan_limit
+        self._lock = threading.Lock()
+        # address id -> weight, spelling; key -> address id
+        self._weights, self._spellings, self._ids = [], [], {}
+        spelling_trips = []
+        for spelling, trips in addresses:
+            key = normalize(spelling)
+            if not key:
+                continue
+            address_id = self._ids.get(key)
+            if address_id is None:
+                address_id = self._ids[key] = len(self._weights)
+                self._weights.append(0)
+                self._spellings.append(spelling)
+                spelling_trips.append(0)
+            self._weights[address_id] += trips
+            if trips > spelling_trips[address_id]:
+                self._spellings[address_id] = spelling
+                spelling_trips[address_id] = trips
+        entries = sorted(
+            (start, address_id)
+            for key, address_id in self._ids.items()
+            for start in _word_starts(key)
+        )
+        self._entries = [entry for entry, _ in entries]
+        self._entry_ids = [address_id for _, address_id in entries]
+        # prefix -> best address ids, for the prefixes of many entries
+        self._ranked = {}
+        self._rank_common_prefixes()
+
+    def __len__(self):
+        return len(self._weights)
+
+    def _run(self, prefix):
+        """Bounds of the entries starting with prefix"""
+        return (
+            bisect.bisect_left(self._entries, prefix),
+            bisect.bisect_right(self._entries, prefix + LAST_CHARACTER),
+        )
+
+    def _best(self, start, end):
+        """Ids of the size most used addresses of entries[start:end]"""
+        address_ids = dict.fromkeys(self._entry_ids[start:end])
+        return heapq.nlargest(self.size, address_ids, key=self._weights.__getitem__)
+
+    def _rank_common_prefixes(self):
+        # Breadth first: only the prefixes of a common prefix can be common
+        prefixes = ['']
+        while prefixes:
+            common = []
+            for prefix in prefixes:
+                start, end = self._run(prefix)
+                length = len(prefix) + 1
+                while start < end:
+                    if len(self._entries[start]) < length:
+                        start += 1
+                        continue
+                    child = self._entries[start][:length]
+                    child_end = bisect.bisect_right(
+                        self._entries, child + LAST_CHARACTER, start, end
+                    )
+                    if child_end - start > self.scan_limit:
+                        self._ranked[child] = self._best(start, child_end)
+                        common.append(child)
+                    start = child_end
+            prefixes = common
+
+    def suggest(self, prefix, limit=None):
+        """Spellings of the most used addresses with a word starting with prefix"""
+        if not prefix:
+            return []
+        address_ids = self._ranked.get(prefix)
+        if address_ids is None:
+            address_ids = self._best(*self._run(prefix))
+        return [self._spellings[address_id] for address_id in address_ids[:limit]]
+
+    def add(self, address):
+        """Count one more trip of address, if it is indexed"""
+        key = normalize(address)
+        address_id = self._ids.get(key)
+        if address_id is None:
+            return
+        with self._lock:
+            self._weights[address_id] += 1
+            weight = self._weights[address_id]
+            for start in _word_starts(key):
+                for length in range(1, len(start) + 1):
+                    prefix = start[:length]
+                    ranked = self._ranked.get(prefix)
+                    if ranked is None:
+                        # Prefixes of rare prefixes are rare too
+                        break
+                    if address_id in ranked:
+                        ranked = list(ranked)
+                    elif len(ranked) < self.size or self._weights[ranked[-1]] < weight:
+                        ranked = ranked + [address_id]
+                    else:
+                        continue
+                    ranked.sort(key=self._weights.__getitem__, reverse=True)
+                    # Replaced, not changed in place: readers take no lock
+                    self._ranked[prefix] = ranked[:self.size]
+
+
+class RecentAddresses:
+    """Each rider's latest distinct addresses, for the riders seen last"""
+
+    def __init__(self, size=5, riders=10000):
+        self.size = size
+        self.riders = riders
+        self._lock = threading.Lock()
+        # rider id -> [(key, spelling)], latest first
+        self._recents = OrderedDict()
+
+    def get(self, rider_id):
+        """The latest addresses of a rider, read from their trips if not kept"""
+        with self._lock:
+            recents = self._recents.get(rider_id)
+            if recents is not None:
+                self._recents.move_to_end(rider_id)
+                return recents
+        trips = (
+            Trip.objects.for_rider(rider_id).order_by('-created_at')
+            .values_list('destination', 'origin')[:self.size]
+        )
+        recents = self._latest([address for trip in trips for address in trip])
+        with self._lock:
+            self._recents[rider_id] = recents
+            while len(self._recents) > self.riders:
+                self._recents.popitem(last=False)
+        return recents
+
+    def add(self, rider_id, addresses):
+        """Put addresses first among a rider's recents, if they are kept"""
+        with self._lock:
+            recents = self._recents.get(rider_id)
+            if recents is not None:
+                self._recents[rider_id] = self._latest(
+                    addresses + [spelling for _, spelling in recents]
+                )
+
+    def _latest(self, addresses):
+        recents = {}
+        for spelling in addresses:
+            key = normalize(spelling)
+            if key and key not in recents:
+                recents[key] = spelling
+        return list(recents.items())[:self.size]
+
+    def clear(self):
+        with self._lock:
+            self._recents.clear()
+
+
+def build_index():
+    """AddressIndex of the addresses used by enough riders lately"""
+    since = timezone.now() - timedelta(days=settings.ADDRESS_HISTORY_DAYS)
+    trips = Trip.objects.filter(created_at__gte=since).order_by()
+    addresses = []
+    for field in ('origin', 'destination'):
+        addresses.extend(
+            trips.values_list(field)
+            .annotate(trips=Count('id'), riders=Count('rider', distinct=True))
+            .filter(riders__gte=settings.ADDRESS_MIN_RIDERS)
+            .values_list(field, 'trips')
+        )
+    return AddressIndex(
+        addresses,
+        size=settings.ADDRESS_SUGGESTIONS,
+        scan_limit=settings.ADDRESS_SCAN_LIMIT,
+    )
+
+
+_cache = {'index': None, 'loaded': 0.0, 'retry_at': 0.0}
+_building = threading.Lock()
+recents = RecentAddresses(settings.ADDRESS_RECENTS, settings.ADDRESS_RECENT_RIDERS)
+
+
+def get_index():
+    """
+    The process's AddressIndex, or None until it is first built. Builds and
+    rebuilds run in a background thread: the trip history is too large to
+    aggregate on a keystroke.
+    """
+    index = _cache['index']
+    now = time.monotonic()
+    stale = index is None or now - _cache['loaded'] > settings.ADDRESS_INDEX_TTL
+    if stale and now >= _cache['retry_at'] and _building.acquire(blocking=False):
+        threading.Thread(target=_rebuild, daemon=True).start()
+    return index
+
+
+def load_index():
+    """Build the AddressIndex now and use it from here on"""
+    index = build_index()
+    _cache.update(index=index, loaded=time.monotonic())
+    return index
+
+
+def _rebuild():
+    try:
+        load_index()
+    except Exception:
+        # Keep serving the old index (or recents only) until the retry
+        logger.exception('Could not build the address index')
+        _cache['retry_at'] = time.monotonic() + settings.ADDRESS_INDEX_RETRY
+    finally:
+        connection.close()
+        _building.release()
+
+
+def invalidate():
+    """Drop the index and the recents so the next keystroke reloads them"""
+    _cache.update(index=None, retry_at=0.0)
+    recents.clear()
+
+
+def suggest(text, rider_id=None, limit=None):
+    """Addresses completing text: the rider's recent ones, then the most used"""
+    limit = limit or settings.ADDRESS_SUGGESTIONS
+    prefix = normalize(text)
+    if not prefix:
+        return []
+    suggestions = {}
+    if rider_id is not None:
+        for key, spelling in recents.get(rider_id):
+            if _matches(key, prefix):
+                suggestions[key] = spelling
+    index = get_index()
+    for spelling in index.suggest(prefix) if index is not None else []:
+        if len(suggestions) >= limit:
+            break
+        suggestions.setdefault(normalize(spelling), spelling)
+    return list(suggestions.values())[:limit]
+
+
+def _record(trip):
+    index = _cache['index']
+    if index is not None:
+        index.add(trip.origin)
+        index.add(trip.destination)
+    recents.add(trip.rider_id, [trip.destination, trip.origin])
+
+
+@receiver(post_save, sender=Trip)
+def record_created_trip(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: _record(instance))
@@ -1,16 +1,31 @@
 ﻿from django.contrib import admin
 
-from .models import Trip
+from taxi_project.admin import LargeTableAdmin
+
+from .models import (
+    DriverActivity,
+    ProjectionOffset,
+    Tariff,
+    Trip,
+    TripEvent,
+    TripRating,
+    TripStats,
+    WaitTimeBucket,
+)
 
 
 @admin.register(Trip)
-class TripAdmin(admin.ModelAdmin):
+class TripAdmin(LargeTableAdmin):
     list_display = [
         'id', 'rider', 'driver', 'origin', 'destination',
         'status', 'price', 'created_at'
     ]
     list_filter = ['status', 'created_at']
-    search_fields = ['rider__email', 'driver__user__email', 'origin', 'destination']
+    search_fields = ['origin', 'destination']
+    related_search_fields = {'rider': ['email'], 'driver': ['user__email']}
+    # Served by trip_created_idx (trip_open_feed_idx for requested trips)
+    ordering = ['-created_at', '-id']
+    sortable_by = ['id', 'created_at']
     readonly_fields = ['created_at', 'updated_at']
     list_editable = ['status']
     
@@ -18,6 +33,11 @@ class TripAdmin(admin.ModelAdmin):
         ('Trip Information', {
             'fields': ('rider', 'driver', 'origin', 'destination', 'comment')
         }),
+        ('Coordinates', {
+            'fields': (
+                ('origin_lat', 'origin_lng'), ('destination_lat', 'destination_lng')
+            )
+        }),
         ('Status & Price', {
             'fields': ('status', 'price')
         }),
@@ -28,4 +48,102 @@ class TripAdmin(admin.ModelAdmin):
     
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related('rider', 'driver', 'driver__user')
+        return qs.select_related('rider', 'driver', 'driver__user')
+
+
+@admin.register(TripRating)
+class TripRatingAdmin(admin.ModelAdmin):
+    # Read-only: driver counters only follow TripRating.objects.rate(), and
+    # a deleted rating is folded out by reconcile_driver_ratings --fix
+    list_display = ['trip', 'driver', 'rider', 'score', 'created_at']
+    list_filter = ['score', 'created_at']
+    search_fields = ['driver__user__email', 'rider__email']
+    list_select_related = ['trip', 'driver__user', 'rider']
+    raw_id_fields = ['trip', 'driver', 'rider']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(TripStats)
+class TripStatsAdmin(admin.ModelAdmin):
+    # Maintained by trips.stats; rebuild_trip_stats recomputes the table
+    list_display = [
+        'user', 'role', 'trips', 'open_trips', 'completed', 'cancelled',
+        'amount', 'updated_at'
+    ]
+    list_filter = ['role']
+    search_fields = ['user__email']
+    list_select_related = ['user']
+    ordering = ['-amount']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = [
+        'name', 'start_hour', 'end_hour', 'base_fare', 'per_km', 'per_minute',
+        'minimum_fare', 'is_active'
+    ]
+    list_filter = ['is_active']
+    list_editable = ['is_active']
+
+
+@admin.register(TripEvent)
+class TripEventAdmin(LargeTableAdmin):
+    # Append-only: the transitions and Trip.save() write it
+    list_display = ['id', 'trip', 'from_status', 'to_status', 'driver', 'actor', 'occurred_at']
+    list_filter = ['to_status']
+    list_select_related = ['trip', 'driver__user', 'actor']
+    raw_id_fields = ['trip', 'rider', 'driver', 'actor']
+    # Served by the primary key
+    ordering = ['-id']
+    sortable_by = ['id']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ProjectionAdmin(admin.ModelAdmin):
+    # Read models of trips.projections, rebuilt by trip_projections --replay
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ProjectionOffset)
+class ProjectionOffsetAdmin(ProjectionAdmin):
+    list_display = ['name', 'transaction_id', 'event_id', 'events', 'updated_at']
+
+
+@admin.register(WaitTimeBucket)
+class WaitTimeBucketAdmin(ProjectionAdmin):
+    list_display = ['day', 'minutes', 'trips']
+    list_filter = ['minutes']
+    date_hierarchy = 'day'
+
+
+@admin.register(DriverActivity)
+class DriverActivityAdmin(ProjectionAdmin):
+    list_display = ['driver', 'day', 'accepted', 'completed', 'cancelled', 'earned']
+    search_fields = ['driver__user__email']
+    list_select_related = ['driver__user']
+    raw_id_fields = ['driver']
+    date_hierarchy = 'day'
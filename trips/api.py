@@ -0,0 +1,50 @@
+from django.db.models import Q
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+
+from accounts.models import DriverProfile, User
+from accounts.principal import get_principal
+from taxi_project.api import ConditionalGetMixin, ValuesQuerysetMixin, full_names
+
+from .models import Trip
+from .serializers import TripSerializer
+
+
+class TripViewSet(ConditionalGetMixin, ValuesQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    The user's trip history, newest first; ``available/`` lists the open
+    trips for drivers. A trip can be read by its rider and driver, by
+    drivers while it is open, and by staff.
+    """
+    serializer_class = TripSerializer
+    related_values = {
+        'rider_name': ('rider', lambda ids: full_names(User.objects.filter(id__in=ids))),
+        'driver_name': (
+            'driver', lambda ids: full_names(DriverProfile.objects.filter(id__in=ids), 'user')
+        ),
+    }
+
+    def get_queryset(self):
+        user = self.request.user
+        trips = Trip.objects.all()
+        if self.action == 'available':
+            return trips.available()
+        if self.action == 'retrieve':
+            if user.is_staff:
+                return trips
+            visible = Q(rider=user) | Q(driver__user=user)
+            if user.is_driver():
+                visible |= Q(status='requested')
+            return trips.filter(visible)
+        if user.is_driver():
+            driver_id = get_principal(self.request).driver_id
+            # No profile, no trips: for_driver(None) is every unassigned trip
+            return trips.none() if driver_id is None else trips.for_driver(driver_id)
+        return trips.for_rider(user)
+
+    @action(detail=False)
+    def available(self, request, *args, **kwargs):
+        if not request.user.is_driver():
+            raise PermissionDenied('Only drivers can see the open trips.')
+        return self.list(request, *args, **kwargs)
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class TripsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trips'
+
+    def ready(self):
+        # Connect the signal receivers
+        from . import (  # noqa: F401
+            addresses,
+            fares,
+            live,
+            row_cache,
+            stats,
+        )
+        from .partitions import ensure_partitions_after_migrate
+
+        post_migrate.connect(ensure_partitions_after_migrate, sender=self)
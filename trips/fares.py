@@ -0,0 +1,160 @@
+"""
+Fare quoting from the Tariff table.
+
+Active tariffs are compiled into a ``FareTable``: one array per rate with an
+entry for each hour of the day, so pricing any number of trips is a handful
+of NumPy operations with the pickup hours as indexes. The compiled table is
+cached per process, dropped when a tariff is saved or deleted here and
+reloaded after ``FARE_TABLE_TTL`` seconds to pick up changes made by other
+processes.
+
+Distance is the great-circle distance times ``FARE_ROUTE_FACTOR`` (roads
+are not straight), duration that distance at ``FARE_AVERAGE_SPEED_KMH``.
+"""
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .geo import EARTH_RADIUS_KM, haversine_km
+from .models import Tariff
+
+HOURS = 24
+RATES = ['base_fare', 'per_km', 'per_minute', 'minimum_fare']
+
+FareTable = namedtuple('FareTable', RATES + ['tariff_ids'])
+
+_cache = {'table': None, 'loaded': 0.0}
+
+
+def _window(tariff):
+    """Hours of the day a tariff covers"""
+    if tariff.start_hour == tariff.end_hour:
+        return list(range(HOURS))
+    if tariff.start_hour < tariff.end_hour:
+        return list(range(tariff.start_hour, tariff.end_hour))
+    return list(range(tariff.start_hour, HOURS)) + list(range(tariff.end_hour))
+
+
+def compile_table(tariffs):
+    """Build a FareTable; hours no tariff covers are NaN"""
+    rates = {name: np.full(HOURS, np.nan) for name in RATES}
+    tariff_ids = np.zeros(HOURS, dtype=np.int64)
+    # Widest first, so narrower windows (night, rush hour) override
+    for tariff in sorted(tariffs, key=lambda tariff: (-len(_window(tariff)), tariff.pk)):
+        hours = _window(tariff)
+        for name in RATES:
+            rates[name][hours] = float(getattr(tariff, name))
+        tariff_ids[hours] = tariff.pk
+    return FareTable(tariff_ids=tariff_ids, **rates)
+
+
+def get_table():
+    """The compiled table of active tariffs, cached per process"""
+    table = _cache['table']
+    if table is None or time.monotonic() - _cache['loaded'] > settings.FARE_TABLE_TTL:
+        table = compile_table(Tariff.objects.filter(is_active=True))
+        _cache.update(table=table, loaded=time.monotonic())
+    return table
+
+
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+def invalidate(**kwargs):
+    """Drop the compiled table so the next quote reloads it"""
+    _cache['table'] = None
+
+
+def route_km(origin_lat, origin_lng, destination_lat, destination_lng):
+    """Estimated road distances between arrays of points"""
+    phi1, phi2 = np.radians(origin_lat), np.radians(destination_lat)
+    a = (
+        np.sin((phi2 - phi1) / 2) ** 2
+        + np.cos(phi1) * np.cos(phi2)
+        * np.sin(np.radians(np.subtract(destination_lng, origin_lng)) / 2) ** 2
+    )
+    straight = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return straight * settings.FARE_ROUTE_FACTOR
+
+
+def duration_minutes(distance_km):
+    """Estimated driving time for a road distance"""
+    return np.asarray(distance_km) / settings.FARE_AVERAGE_SPEED_KMH * 60
+
+
+def quote_many(distance_km, duration_min, hours, table=None):
+    """
+    Fares for arrays of distances (km), durations (minutes) and local
+    pickup hours, rounded to cents; NaN where no tariff covers the hour
+    """
+    table = table or get_table()
+    hours = np.asarray(hours, dtype=np.intp)
+    fare = (
+        table.base_fare[hours]
+        + table.per_km[hours] * distance_km
+        + table.per_minute[hours] * duration_min
+    )
+    return np.round(np.fmax(fare, table.minimum_fare[hours]), 2)
+
+
+def quote_one(distance_km, duration_min, hour, table=None):
+    """Fare of a single trip, the scalar twin of quote_many(); None if uncovered"""
+    table = table or get_table()
+    base = table.base_fare[hour]
+    if base != base:  # NaN
+        return None
+    fare = base + table.per_km[hour] * distance_km + table.per_minute[hour] * duration_min
+    return round(max(fare, table.minimum_fare[hour]), 2)
+
+
+def to_decimal(fare):
+    """A quoted fare as a Decimal price, or None"""
+    if fare is None or np.isnan(fare):
+        return None
+    return Decimal(f'{fare:.2f}')
+
+
+def quote_trips(trips, table=None):
+    """
+    Prices for trips with both coordinates, priced at their pickup time
+    (creation, or now for unsaved trips); None for the others
+    """
+    trips = list(trips)
+    priced = [
+        i for i, trip in enumerate(trips)
+        if None not in (trip.origin_lat, trip.origin_lng,
+                        trip.destination_lat, trip.destination_lng)
+    ]
+    prices = [None] * len(trips)
+    if not priced:
+        return prices
+    now = timezone.now()
+    points = np.array([
+        (trips[i].origin_lat, trips[i].origin_lng,
+         trips[i].destination_lat, trips[i].destination_lng)
+        for i in priced
+    ])
+    hours = [timezone.localtime(trips[i].created_at or now).hour for i in priced]
+    distance = route_km(*points.T)
+    fares = quote_many(distance, duration_minutes(distance), hours, table)
+    for i, fare in zip(priced, fares.tolist()):
+        prices[i] = to_decimal(fare)
+    return prices
+
+
+def quote_trip(trip, table=None):
+    """Price for one trip, or None without coordinates or a tariff"""
+    if None in (trip.origin_lat, trip.origin_lng, trip.destination_lat, trip.destination_lng):
+        return None
+    distance = haversine_km(
+        trip.origin_lat, trip.origin_lng, trip.destination_lat, trip.destination_lng
+    ) * settings.FARE_ROUTE_FACTOR
+    hour = timezone.localtime(trip.created_at or timezone.now()).hour
+    return to_decimal(quote_one(
+        distance, distance / settings.FARE_AVERAGE_SPEED_KMH * 60, hour, table
+    ))
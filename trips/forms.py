@@ -1,6 +1,6 @@
 ﻿from django import forms
 
-from .models import Trip
+from .models import Trip, TripRating
 
 
 class TripCreateForm(forms.ModelForm):
@@ -8,6 +8,7 @@ class TripCreateForm(forms.ModelForm):
     
     class Meta:
         model = Trip
+        # Coordinates are geocoded from the addresses (trips.geocoding)
         fields = ['origin', 'destination', 'comment']
         widgets = {
             'origin': forms.TextInput(attrs={
@@ -35,3 +36,51 @@ class TripUpdateForm(forms.ModelForm):
         widgets = {
             'comment': forms.Textarea(attrs={'rows': 3}),
         }
+
+
+class LocationForm(forms.Form):
+    """A driver's current position"""
+    
+    lat = forms.FloatField(min_value=-90, max_value=90)
+    lng = forms.FloatField(min_value=-180, max_value=180)
+
+
+class TripRatingForm(forms.ModelForm):
+    """A rider's rating of a completed trip"""
+    
+    class Meta:
+        model = TripRating
+        fields = ['score', 'comment']
+        widgets = {
+            'score': forms.RadioSelect(attrs={'class': 'form-check-input'}),
+            'comment': forms.Textarea(attrs={
+                'class': 'form-control',
+                'rows': 2,
+                'placeholder': 'How was your ride? (optional)'
+            }),
+        }
+
+
+class TripExportForm(forms.Form):
+    """Filters of a trip history export; only staff may pick rider and driver"""
+    
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('ndjson', 'NDJSON')], required=False)
+    status = forms.ChoiceField(choices=[('', 'Any')] + Trip.STATUS_CHOICES, required=False)
+    since = forms.DateField(required=False)
+    until = forms.DateField(required=False)
+    rider = forms.IntegerField(min_value=1, required=False)
+    driver = forms.IntegerField(min_value=1, required=False)
+    
+    def __init__(self, *args, staff=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not staff:
+            del self.fields['rider']
+            del self.fields['driver']
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        since, until = cleaned_data.get('since'), cleaned_data.get('until')
+        if since and until and since > until:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        cleaned_data['format'] = cleaned_data.get('format') or 'csv'
+        return cleaned_data
@@ -0,0 +1,96 @@
+"""
+Plain-Postgres spatial lookup for trips and drivers.
+
+Points are bucketed into a fixed grid of ``CELL_DEGREES`` cells numbered
+row-major, so the cells of one grid row are consecutive integers. A radius
+search turns into one ``BETWEEN`` per grid row on an ordinary btree index,
+and only the few candidates inside those ranges get an exact great-circle
+distance. No PostGIS required.
+"""
+import math
+
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+EARTH_RADIUS_KM = 6371.0088
+CELL_DEGREES = 0.01  # ~1.1 km of latitude
+ROWS = round(180 / CELL_DEGREES)
+COLUMNS = round(360 / CELL_DEGREES)
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def _row(lat):
+    return min(max(math.floor((lat + 90) / CELL_DEGREES), 0), ROWS - 1)
+
+
+def _column(lng):
+    return math.floor((lng + 180) / CELL_DEGREES) % COLUMNS
+
+
+def grid_cell(lat, lng):
+    """Grid cell number of a point, or None without coordinates"""
+    if lat is None or lng is None:
+        return None
+    return _row(lat) * COLUMNS + _column(lng)
+
+
+def cell_ranges(lat, lng, radius_km):
+    """
+    Return [(first, last)] cell number ranges covering a circle.
+
+    There is one range per grid row, two where the circle crosses the
+    antimeridian and a whole row near the poles.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = _row(lat - lat_delta), _row(lat + lat_delta)
+    # The circle is widest at the edge closest to a pole
+    widest = abs(lat) + lat_delta
+    if widest < 90:
+        lng_delta = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+
+    if widest >= 90 or lng_delta >= 180:
+        spans = [(0, COLUMNS - 1)]
+    else:
+        west, east = _column(lng - lng_delta), _column(lng + lng_delta)
+        if west <= east:
+            spans = [(west, east)]
+        else:
+            spans = [(west, COLUMNS - 1), (0, east)]
+
+    return [
+        (row * COLUMNS + first, row * COLUMNS + last)
+        for row in range(south, north + 1)
+        for first, last in spans
+    ]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def distance_km(lat_field, lng_field, lat, lng):
+    """Database expression for the haversine distance from (lat, lng) in km"""
+    lat_value = Value(float(lat), output_field=FloatField())
+    lng_value = Value(float(lng), output_field=FloatField())
+    half_dlat = Radians(F(lat_field) - lat_value) / 2
+    half_dlng = Radians(F(lng_field) - lng_value) / 2
+    a = (
+        Power(Sin(half_dlat), 2)
+        + Cos(Radians(lat_value)) * Cos(Radians(F(lat_field))) * Power(Sin(half_dlng), 2)
+    )
+    one = Value(1.0, output_field=FloatField())
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Least(Sqrt(a), one))
+
+
+def grid_cell_sql(lat_sql, lng_sql):
+    """SQL computing grid_cell() of two SQL expressions, for bulk statements"""
+    return (
+        f'(LEAST(GREATEST(floor(({lat_sql} + 90) / {CELL_DEGREES}), 0), {ROWS - 1})::bigint'
+        f' * {COLUMNS} + mod(floor(({lng_sql} + 180) / {CELL_DEGREES})::bigint, {COLUMNS}))'
+    )
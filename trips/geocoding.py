@@ -0,0 +1,81 @@
+"""
+Server-side geocoding of trip addresses.
+
+Trips are located and priced from coordinates the server looked up itself:
+``locate_trip()`` geocodes the origin and the destination with the
+``TRIP_GEOCODER`` backend and sets the four coordinate fields, so a rider
+cannot choose the points their fare is computed from. Backends have a
+``geocode(address)`` method returning ``(lat, lng)``, or None for an address
+they cannot place, and raise ``GeocodingError`` when the lookup fails.
+Answers are kept in the default cache for ``TRIP_GEOCODER_CACHE_TIMEOUT``
+seconds, as the same addresses come up again and again; failures are not.
+"""
+import hashlib
+import json
+import logging
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .addresses import normalize
+
+logger = logging.getLogger(__name__)
+
+
+class GeocodingError(Exception):
+    """The geocoder could not be reached or gave an unreadable answer"""
+
+
+class NominatimGeocoder:
+    """Geocodes through a Nominatim search endpoint (TRIP_GEOCODER_URL)"""
+
+    def geocode(self, address):
+        query = urlencode({'q': address, 'format': 'jsonv2', 'limit': 1})
+        request = Request(
+            f'{settings.TRIP_GEOCODER_URL}?{query}',
+            headers={'User-Agent': settings.TRIP_GEOCODER_USER_AGENT},
+        )
+        try:
+            with urlopen(request, timeout=settings.TRIP_GEOCODER_TIMEOUT) as response:
+                places = json.load(response)
+            if not places:
+                return None
+            return float(places[0]['lat']), float(places[0]['lon'])
+        except (URLError, OSError, ValueError, LookupError, TypeError) as error:
+            raise GeocodingError(f'Geocoding {address!r} failed') from error
+
+
+class NullGeocoder:
+    """Locates nothing: trips are stored without coordinates or a price"""
+
+    def geocode(self, address):
+        return None
+
+
+def geocode(address):
+    """(lat, lng) of an address, or None if the geocoder cannot place it"""
+    key = normalize(address)
+    if not key:
+        return None
+    cache_key = 'geocode:' + hashlib.md5(key.encode()).hexdigest()
+    # Misses are cached too, as [] (None means not cached)
+    point = cache.get(cache_key)
+    if point is None:
+        try:
+            point = import_string(settings.TRIP_GEOCODER)().geocode(address) or []
+        except GeocodingError:
+            logger.warning('Trip address not located', exc_info=True)
+            return None
+        cache.set(cache_key, list(point), settings.TRIP_GEOCODER_CACHE_TIMEOUT)
+    return tuple(point) or None
+
+
+def locate_trip(trip):
+    """Set the coordinates of a trip from its origin and destination"""
+    unknown = (None, None)
+    trip.origin_lat, trip.origin_lng = geocode(trip.origin) or unknown
+    trip.destination_lat, trip.destination_lng = geocode(trip.destination) or unknown
@@ -0,0 +1,225 @@
+"""
+Live trip feed: fans trip events out to Server-Sent Events subscribers.
+
+Events are serialized once into an SSE frame when they are published, so
+delivering them to thousands of open connections costs a queue put per
+connection and no database work. ``LocalBroadcaster`` fans out within the
+process; ``PostgresBroadcaster`` publishes through ``pg_notify`` so every
+ASGI process sees events raised by any web worker.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator
+
+from .models import Trip
+from .signals import trip_status_changed
+
+logger = logging.getLogger(__name__)
+
+DRIVERS_CHANNEL = 'drivers'
+# Trip cards carry a preview of the comment: pg_notify payloads must stay
+# under 8000 bytes
+CARD_COMMENT_CHARS = 300
+
+
+def trip_channel(pk):
+    """Channel carrying status changes of a single trip"""
+    return f'trip-{pk}'
+
+
+def sse_frame(event, data):
+    """Serialize an event as a Server-Sent Events frame"""
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f'event: {event}\ndata: {payload}\n\n'
+
+
+class LocalBroadcaster:
+    """In-process publish/subscribe between sync publishers and async streams"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        # channel -> {event loop -> set of subscriber queues}
+        self._subscribers = defaultdict(lambda: defaultdict(set))
+
+    def publish(self, channel, frame):
+        """Deliver frame to every subscriber of channel; safe from any thread"""
+        self._fan_out(channel, frame)
+
+    def _fan_out(self, channel, frame):
+        with self._lock:
+            targets = [
+                (loop, tuple(queues))
+                for loop, queues in self._subscribers.get(channel, {}).items()
+            ]
+        # One wake-up per event loop, not per subscriber
+        for loop, queues in targets:
+            loop.call_soon_threadsafe(self._deliver, queues, frame)
+
+    @staticmethod
+    def _deliver(queues, frame):
+        for queue in queues:
+            if queue.full():
+                # Slow consumer: drop its oldest frame rather than block others
+                queue.get_nowait()
+            queue.put_nowait(frame)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, channels):
+        """Yield an asyncio.Queue receiving frames published on channels"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel][loop].add(queue)
+        self._subscribed()
+        try:
+            yield queue
+        finally:
+            with self._lock:
+                for channel in channels:
+                    loops = self._subscribers[channel]
+                    loops[loop].discard(queue)
+                    if not loops[loop]:
+                        del loops[loop]
+                    if not loops:
+                        del self._subscribers[channel]
+
+    def _subscribed(self):
+        """Hook run when a subscriber arrives"""
+
+
+class PostgresBroadcaster(LocalBroadcaster):
+    """
+    Publish with ``pg_notify`` and fan out from one LISTEN connection per
+    process, so a single database event reaches every process's streams.
+    """
+    notify_channel = 'trip_feed'
+
+    def __init__(self, queue_size=100):
+        super().__init__(queue_size)
+        self._listener = None
+
+    def publish(self, channel, frame):
+        payload = json.dumps({'channel': channel, 'frame': frame})
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.notify_channel, payload])
+
+    def _subscribed(self):
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(
+                    target=self._listen, name='trip-feed-listener', daemon=True
+                )
+                self._listener.start()
+
+    def _listen(self):
+        params = connection.get_connection_params()
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**params)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.notify_channel}')
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self._fan_out(message['channel'], message['frame'])
+            except psycopg2.Error:
+                logger.exception('Trip feed listener lost its connection; retrying')
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    """Return the process-wide broadcaster configured by TRIP_FEED_BROADCASTER"""
+    global _broadcaster
+    with _broadcaster_lock:
+        if _broadcaster is None:
+            _broadcaster = import_string(settings.TRIP_FEED_BROADCASTER)()
+        return _broadcaster
+
+
+def publish_on_commit(channel, event, data):
+    """Publish once the surrounding transaction commits"""
+    frame = sse_frame(event, data)
+    transaction.on_commit(lambda: _publish(channel, frame))
+
+
+def _publish(channel, frame):
+    # The write is committed: a lost event must not fail its request
+    try:
+        get_broadcaster().publish(channel, frame)
+    except DatabaseError:
+        logger.exception('Could not publish a trip feed event on %s', channel)
+
+
+def trip_card(trip):
+    """Fields the available-trips page needs to render a trip card"""
+    return {
+        'id': trip.pk,
+        'origin': trip.origin,
+        'destination': trip.destination,
+        'comment': Truncator(trip.comment).chars(CARD_COMMENT_CHARS),
+        'created_at': trip.created_at,
+    }
+
+
+@receiver(post_save, sender=Trip)
+def announce_trip_saved(sender, instance, created, **kwargs):
+    if instance.status != 'requested':
+        return
+    event = 'trip_created' if created else 'trip_updated'
+    publish_on_commit(DRIVERS_CHANNEL, event, trip_card(instance))
+
+
+@receiver(post_delete, sender=Trip)
+def announce_trip_deleted(sender, instance, **kwargs):
+    if instance.status == 'requested':
+        publish_on_commit(DRIVERS_CHANNEL, 'trip_removed', {'id': instance.pk})
+
+
+@receiver(trip_status_changed)
+def announce_status_change(sender, transition, **kwargs):
+    if transition.from_status == 'requested':
+        publish_on_commit(DRIVERS_CHANNEL, 'trip_removed', {'id': transition.trip_id})
+    publish_on_commit(trip_channel(transition.trip_id), 'trip_status', {
+        'id': transition.trip_id,
+        'status': transition.to_status,
+        'updated_at': transition.updated_at,
+    })
+
+
+async def event_stream(channels, keepalive=15):
+    """Async iterator of SSE frames for a StreamingHttpResponse"""
+    async with get_broadcaster().subscribe(channels) as queue:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from trips.partitions import (
+    add_months,
+    archive_partition,
+    is_partitioned,
+    list_partitions,
+    month_start,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Detach the monthly trip partitions older than --keep-months and '
+        'compact them in the archive schema, or drop them'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12,
+                            help='Months to keep attached, the current one included')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop old partitions instead of archiving them')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the partitions that would be archived')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('trips_trip is not partitioned; run migrate first')
+        if options['keep_months'] < 1:
+            raise CommandError('--keep-months must be at least 1')
+        cutoff = add_months(month_start(timezone.now()), 1 - options['keep_months'])
+        old = [partition for partition in list_partitions() if partition.month < cutoff]
+        if not old:
+            self.stdout.write('No partitions older than the kept months.')
+            return
+
+        for partition in old:
+            if options['dry_run']:
+                self.stdout.write(f'would archive {partition.name} (~{partition.rows} rows)')
+                continue
+            archived = archive_partition(partition, drop=options['drop'])
+            if archived is None:
+                self.stdout.write(f'dropped {partition.name}')
+                continue
+            # Rewrites the table without dead space; needs autocommit
+            with connection.cursor() as cursor:
+                cursor.execute(f'VACUUM (FULL, ANALYZE) {archived}')
+            self.stdout.write(f'archived {partition.name} to {archived}')
+        if not options['dry_run']:
+            # Archived trips still count in TripStats until it is rebuilt
+            self.stdout.write(self.style.SUCCESS(
+                f'Archived trips created before {cutoff:%Y-%m}; run rebuild_trip_stats '
+                f'to drop them from the statistics.'
+            ))
@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import DriverProfile, User
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire many simultaneous accepts at a single trip and check that '
+        'exactly one driver wins within a bounded latency'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=300,
+                            help='Number of competing drivers (one accept each)')
+        parser.add_argument('--workers', type=int, default=50,
+                            help='Concurrent threads / database connections')
+        parser.add_argument('--rounds', type=int, default=5,
+                            help='Number of trips to fight over')
+        parser.add_argument('--max-p99-ms', type=float, default=250.0,
+                            help='Fail if the p99 accept latency exceeds this')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated users and trips')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        rider, drivers = self._create_fixtures(tag, options['drivers'])
+        latencies = []
+        try:
+            for round_no in range(1, options['rounds'] + 1):
+                trip = Trip.objects.create(
+                    rider=rider, origin='Bench origin', destination='Bench destination'
+                )
+                winners, samples = self._race(trip, drivers, options['workers'])
+                latencies.extend(samples)
+                self.stdout.write(
+                    f'round {round_no}: trip #{trip.pk} winners={winners} '
+                    f'{format_summary(latency_summary(samples))}'
+                )
+                if winners != 1:
+                    raise CommandError(
+                        f'Expected exactly one winner for trip #{trip.pk}, got {winners}'
+                    )
+        finally:
+            if not options['keep']:
+                User.objects.filter(email__startswith=f'bench-accept-{tag}-').delete()
+
+        summary = latency_summary(latencies)
+        self.stdout.write(f'overall: {format_summary(summary)}')
+        if summary['p99_ms'] > options['max_p99_ms']:
+            raise CommandError(
+                f"p99 latency {summary['p99_ms']}ms exceeds {options['max_p99_ms']}ms"
+            )
+        self.stdout.write(self.style.SUCCESS('Exactly one winner per trip.'))
+
+    def _create_fixtures(self, tag, count):
+        password = make_password(None)
+        rider = User.objects.create(
+            username=f'bench-accept-{tag}-rider',
+            email=f'bench-accept-{tag}-rider@example.com',
+            password=password,
+            role='rider',
+        )
+        users = User.objects.bulk_create([
+            User(
+                username=f'bench-accept-{tag}-{i}',
+                email=f'bench-accept-{tag}-{i}@example.com',
+                password=password,
+                role='driver',
+            )
+            for i in range(count)
+        ])
+        drivers = DriverProfile.objects.bulk_create([
+            DriverProfile(
+                user=user,
+                license_number=f'BA-{tag}-{i}',
+                car_number=f'BA-{i}',
+                car_model='Bench',
+            )
+            for i, user in enumerate(users)
+        ])
+        return rider, drivers
+
+    def _race(self, trip, drivers, workers):
+        pending = queue.SimpleQueue()
+        for driver in drivers:
+            pending.put(driver)
+        workers = min(workers, len(drivers))
+        barrier = threading.Barrier(workers)
+        results = []
+        lock = threading.Lock()
+
+        def worker():
+            # Connect before the barrier so the race measures the UPDATE only
+            connection.ensure_connection()
+            barrier.wait()
+            try:
+                while True:
+                    try:
+                        driver = pending.get_nowait()
+                    except queue.Empty:
+                        return
+                    started = time.perf_counter()
+                    won = Trip.objects.accept(trip.pk, driver)
+                    elapsed = (time.perf_counter() - started) * 1000
+                    with lock:
+                        results.append((won, elapsed))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = sum(1 for won, _ in results if won)
+        return winners, [elapsed for _, elapsed in results]
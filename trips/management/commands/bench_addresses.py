@@ -0,0 +1,83 @@
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from taxi_project.benchmarks import format_summary, latency_summary, rss_mb
+from trips import addresses
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the address autocomplete index from the trip history, then time '
+        'keystroke suggestions against the GROUP BY query a database-backed '
+        'endpoint would run per keystroke'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--addresses', type=int, default=200,
+                            help='Addresses typed out, one keystroke at a time')
+        parser.add_argument('--baseline-requests', type=int, default=3,
+                            help='Database queries timed per prefix (0 to skip)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rss = rss_mb()
+        started = time.perf_counter()
+        index = addresses.load_index()
+        build_s = time.perf_counter() - started
+        if not len(index):
+            raise CommandError('No address is used by enough riders; run generate_load_data first')
+        self.stdout.write(
+            f'index: {len(index)} addresses, {len(index._entries)} entries, '
+            f'{len(index._ranked)} ranked prefixes, built in {build_s:.1f}s, '
+            f'+{rss_mb() - rss:.0f} MB'
+        )
+
+        busiest = (
+            Trip.objects.order_by().values('rider').annotate(trips=Count('id'))
+            .order_by('-trips').first()
+        )
+        typed = rng.sample(index._spellings, min(options['addresses'], len(index)))
+        keystrokes = [
+            addresses.normalize(spelling)[:end]
+            for spelling in typed
+            for end in range(1, len(addresses.normalize(spelling)) + 1)
+        ]
+        modes = [('index', None), (f'index + recents of rider {busiest["rider"]}', busiest['rider'])]
+        for mode, rider_id in modes:
+            addresses.suggest('a', rider_id=rider_id)
+            samples = []
+            for prefix in keystrokes:
+                started = time.perf_counter()
+                addresses.suggest(prefix, rider_id=rider_id)
+                samples.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'{mode}: {format_summary(latency_summary(samples))}')
+
+        if options['baseline_requests']:
+            self._baseline(typed[0], options['baseline_requests'])
+
+    def _baseline(self, spelling, count):
+        """Time the most used origins starting with prefixes of spelling, in SQL"""
+        since = timezone.now() - timedelta(days=settings.ADDRESS_HISTORY_DAYS)
+        for end in (1, 3, len(spelling)):
+            prefix = spelling[:end]
+            query = (
+                Trip.objects.filter(created_at__gte=since, origin__istartswith=prefix)
+                .order_by().values('origin').annotate(trips=Count('id'))
+                .order_by('-trips')[:settings.ADDRESS_SUGGESTIONS]
+            )
+            samples = []
+            for _ in range(count):
+                started = time.perf_counter()
+                list(query.all())
+                samples.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(
+                f'database {prefix!r}: {format_summary(latency_summary(samples))}'
+            )
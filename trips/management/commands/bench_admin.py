@@ -0,0 +1,121 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from accounts.models import DriverProfile, User
+from taxi_project.admin import estimate_count
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.models import Trip
+from vehicles.models import Vehicle
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the admin changelists of trips, vehicles and drivers (first and '
+        'deep pages, searches, filters) against stock ModelAdmin behaviour: '
+        'exact counts, joined searches and the default ordering'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10,
+                            help='Requests per page and mode')
+        parser.add_argument('--deep-page', type=int, default=200,
+                            help='Page number of the deep page scenario')
+        parser.add_argument('--street', default='Airport Terminal',
+                            help='Search term matching the trip addresses')
+        parser.add_argument('--email', default='big-r4242@',
+                            help='Search term matching a rider email')
+        parser.add_argument('--no-baseline', action='store_true',
+                            help='Only time the pages as configured')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        email = f'bench-admin-{tag}@example.com'
+        trips = reverse('admin:trips_trip_changelist')
+        vehicles = reverse('admin:vehicles_vehicle_changelist')
+        drivers = reverse('admin:accounts_driverprofile_changelist')
+        pages = [
+            ('trips', trips),
+            ('trips deep page', f'{trips}?p={options["deep_page"]}'),
+            ('trips by status', f'{trips}?status__exact=completed'),
+            ('trips search street', f'{trips}?q={options["street"]}'),
+            ('trips search email', f'{trips}?q={options["email"]}'),
+            ('vehicles', vehicles),
+            ('vehicles search', f'{vehicles}?q=Tesla'),
+            ('drivers', drivers),
+            ('drivers search', f'{drivers}?q={options["email"]}'),
+        ]
+        self.stdout.write(f'trips: ~{estimate_count(Trip.objects.all())} rows (estimate), '
+                          f'vehicles: {Vehicle.objects.count()}, '
+                          f'drivers: {DriverProfile.objects.count()}')
+        modes = [('large-table', self._as_configured)]
+        if not options['no_baseline']:
+            modes.append(('stock', self._stock))
+        try:
+            user = User.objects.create_superuser(username=email, email=email, password=None)
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            for name, url in pages:
+                for mode, setup in modes:
+                    with setup():
+                        summary, queries = self._time(client, url, options['requests'])
+                    self.stdout.write(f'{name} [{mode}]: {format_summary(summary)} '
+                                      f'queries={queries}')
+        finally:
+            User.objects.filter(email=email).delete()
+
+    def _time(self, client, url, count):
+        """Latencies of count requests of url (after one untimed), and queries per request"""
+        client.get(url)
+        samples = []
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url} returned {response.status_code}')
+        return latency_summary(samples), len(queries)
+
+    @contextmanager
+    def _as_configured(self):
+        yield
+
+    @contextmanager
+    def _stock(self):
+        """The registered admins with ModelAdmin's own counts, search and ordering"""
+        overrides = {}
+        for model in (Trip, Vehicle, DriverProfile):
+            model_admin = admin.site._registry[model]
+            search_fields = list(model_admin.search_fields) + [
+                f'{key}__{lookup}'
+                for key, lookups in model_admin.related_search_fields.items()
+                for lookup in lookups
+            ]
+            overrides[model_admin] = {
+                'paginator': Paginator,
+                'show_full_result_count': True,
+                'search_fields': search_fields,
+                'ordering': None,
+                'sortable_by': None,
+                'get_changelist': lambda request, **kwargs: ChangeList,
+                'get_search_results': admin.ModelAdmin.get_search_results.__get__(model_admin),
+            }
+        try:
+            for model_admin, attributes in overrides.items():
+                for name, value in attributes.items():
+                    setattr(model_admin, name, value)
+            yield
+        finally:
+            for model_admin, attributes in overrides.items():
+                for name in attributes:
+                    delattr(model_admin, name)
@@ -0,0 +1,114 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import DriverProfile, User
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.models import Trip
+from vehicles.models import Vehicle
+
+PAGE_SIZE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the /api/v1/ list endpoints against the HTML pages listing the '
+        'same rows, fresh and revalidated with If-None-Match, and check a '
+        'fresh API response is at least --min-speedup times faster'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint')
+        parser.add_argument('--trips', type=int, default=200,
+                            help='Trips in the benchmark rider history')
+        parser.add_argument('--min-speedup', type=float, default=1.0,
+                            help='Fail if an API endpoint is slower than this at the median')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated users and trips')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        prefix = f'bench-api-{tag}-'
+        try:
+            rider, driver = self._create_fixtures(prefix, tag, options['trips'])
+            api_page = f'?page_size={PAGE_SIZE}'
+            pairs = [
+                ('trip_history', rider, reverse('trips:trip_list'),
+                 reverse('v1:trip-list') + api_page),
+                ('available_trips', driver, reverse('trips:available_trips'),
+                 reverse('v1:trip-available') + api_page),
+                ('vehicles', driver, reverse('vehicles:vehicle_list'),
+                 reverse('v1:vehicle-list') + api_page),
+            ]
+            results = [
+                (name, self._time(user, html, options['requests']),
+                 self._time(user, api, options['requests']),
+                 self._time(user, api, options['requests'], revalidate=True))
+                for name, user, html, api in pairs
+            ]
+        finally:
+            if not options['keep']:
+                User.objects.filter(email__startswith=prefix).delete()
+
+        slow = []
+        for name, html, api, revalidated in results:
+            speedup = html['p50_ms'] / api['p50_ms'] if api['p50_ms'] else float('inf')
+            self.stdout.write(f'{name} html: {format_summary(html)}')
+            self.stdout.write(f'{name} api:  {format_summary(api)}')
+            self.stdout.write(f'{name} 304:  {format_summary(revalidated)}')
+            self.stdout.write(
+                f"{name}: api is {speedup:.1f}x faster at the median, "
+                f"{html['p50_ms'] / revalidated['p50_ms']:.1f}x when revalidated"
+            )
+            if speedup < options['min_speedup']:
+                slow.append(name)
+        if slow:
+            raise CommandError(
+                f"Less than {options['min_speedup']}x faster: {', '.join(slow)}"
+            )
+        self.stdout.write(self.style.SUCCESS('All API list endpoints are fast enough.'))
+
+    def _create_fixtures(self, prefix, tag, trips):
+        rider = User.objects.create_user(
+            username=f'{prefix}rider', email=f'{prefix}rider@example.com',
+            first_name='Bench', last_name='Rider', role='rider',
+        )
+        driver_user = User.objects.create_user(
+            username=f'{prefix}driver', email=f'{prefix}driver@example.com',
+            first_name='Bench', last_name='Driver', role='driver',
+        )
+        driver = DriverProfile.objects.create(
+            user=driver_user, license_number=f'BA-{tag}', car_number=f'BA-{tag}',
+            car_model='Bench',
+        )
+        Vehicle.objects.bulk_create([
+            Vehicle(driver=driver, car_number=f'BA-{tag}-{i}', car_model='Bench', year=2020)
+            for i in range(PAGE_SIZE)
+        ])
+        Trip.objects.bulk_create([
+            Trip(rider=rider, driver=driver if i % 4 else None,
+                 origin=f'{i} Bench Street', destination='Bench Avenue',
+                 status='completed' if i % 4 else 'requested', price=12 if i % 4 else None)
+            for i in range(trips)
+        ])
+        return rider, driver_user
+
+    def _time(self, user, path, count, revalidate=False):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        for _ in range(5):  # warm up caches and connections
+            response = client.get(path)
+        headers = {'HTTP_IF_NONE_MATCH': response['ETag']} if revalidate else {}
+        expected = 304 if revalidate else 200
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(path, **headers)
+            samples.append((time.perf_counter() - started) * 1000)
+            if response.status_code != expected:
+                raise CommandError(f'GET {path} returned {response.status_code}')
+        return latency_summary(samples)
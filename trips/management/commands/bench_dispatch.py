@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.dispatch import default_weights, solve
+from trips.geo import KM_PER_DEGREE, haversine_km
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the batch dispatch solver on synthetic trips and drivers and '
+        'check that one solve fits in a dispatch tick'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=10000)
+        parser.add_argument('--drivers', type=int, default=5000)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--city-km', type=float, default=15.0,
+                            help='Standard deviation of positions around the centre')
+        parser.add_argument('--center', default='40.7128,-74.0060',
+                            help='City centre as "lat,lng"')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--tick-ms', type=float,
+                            default=settings.TRIP_DISPATCH_TICK_SECONDS * 1000,
+                            help='Fail if the p99 solve time exceeds this')
+
+    def handle(self, *args, **options):
+        try:
+            lat, lng = (float(value) for value in options['center'].split(','))
+        except ValueError:
+            raise CommandError('--center must look like "40.71,-74.00"')
+        rng = np.random.default_rng(options['seed'])
+        weights = default_weights()
+        spread = options['city_km'] / KM_PER_DEGREE
+
+        def positions(count):
+            return (
+                rng.normal(lat, spread, count),
+                rng.normal(lng, spread / np.cos(np.radians(lat)), count),
+            )
+
+        samples = []
+        for round_no in range(1, options['rounds'] + 1):
+            trip_lat, trip_lng = positions(options['trips'])
+            driver_lat, driver_lng = positions(options['drivers'])
+            trips = {
+                'lat': trip_lat, 'lng': trip_lng,
+                'wait_min': rng.exponential(3.0, options['trips']),
+            }
+            drivers = {
+                'lat': driver_lat, 'lng': driver_lng,
+                'rating': np.clip(rng.normal(4.6, 0.3, options['drivers']), 1, 5),
+            }
+            started = time.perf_counter()
+            pairs = solve(trips, drivers, weights)
+            elapsed = (time.perf_counter() - started) * 1000
+            samples.append(elapsed)
+
+            trip_rows = np.array([trip for trip, _ in pairs], dtype=np.int64)
+            driver_rows = np.array([driver for _, driver in pairs], dtype=np.int64)
+            distance = np.array([
+                haversine_km(trip_lat[trip], trip_lng[trip], driver_lat[driver], driver_lng[driver])
+                for trip, driver in zip(trip_rows, driver_rows)
+            ])
+            self.stdout.write(
+                f'round {round_no}: solve={elapsed:.1f}ms assigned={len(pairs)} '
+                f'mean_pickup={distance.mean() if pairs else 0:.2f}km '
+                f'max_pickup={distance.max() if pairs else 0:.2f}km'
+            )
+
+        summary = latency_summary(samples)
+        self.stdout.write(
+            f"{options['trips']} trips x {options['drivers']} drivers: "
+            f'{format_summary(summary)}'
+        )
+        if summary['p99_ms'] > options['tick_ms']:
+            raise CommandError(
+                f"p99 solve time {summary['p99_ms']}ms exceeds the "
+                f"{options['tick_ms']}ms dispatch tick"
+            )
+        self.stdout.write(self.style.SUCCESS('Solver fits in a dispatch tick.'))
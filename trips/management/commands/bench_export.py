@@ -0,0 +1,107 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import User
+from taxi_project.benchmarks import rss_mb
+from trips.export import stream_trips
+from trips.models import Trip
+from trips.partitions import ensure_partitions, is_partitioned
+
+SEED_SQL = '''
+    INSERT INTO trips_trip
+        (rider_id, origin, destination, status, comment, price, created_at, updated_at)
+    SELECT %(rider)s, 'Export origin ' || g, 'Export destination ' || g, 'completed',
+           '', 5 + g %% 50, s.created_at, s.created_at
+    FROM generate_series(1, %(rows)s) AS g,
+         LATERAL (SELECT now() - random() * interval '365 days' AS created_at) AS s
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream a trip export to nowhere and check that the process RSS stays '
+        'flat however many rows are exported'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed-rows', type=int, default=0,
+                            help='Insert this many synthetic trips first and export only '
+                                 'those (e.g. 10000000); default: export the whole table')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='ndjson')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--max-growth-mb', type=float, default=32.0,
+                            help='Fail if RSS grows more than this after the first chunk')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded rider and trips')
+
+    def handle(self, *args, **options):
+        trips = Trip.objects.all()
+        rider = None
+        if options['seed_rows']:
+            rider = self._seed(options['seed_rows'])
+            trips = trips.filter(rider=rider)
+        try:
+            result = self._export(trips, options)
+        finally:
+            if rider is not None and not options['keep']:
+                self._clean(rider)
+
+        lines, mbytes, seconds, baseline, peak = result
+        growth = peak - baseline
+        self.stdout.write(
+            f'{lines} lines, {mbytes:.1f} MB in {seconds:.1f}s '
+            f'({lines / seconds:.0f} rows/s, {mbytes / seconds:.1f} MB/s)'
+        )
+        self.stdout.write(
+            f'RSS after the first chunk {baseline:.1f} MB, peak {peak:.1f} MB, '
+            f'growth {growth:.1f} MB'
+        )
+        if growth > options['max_growth_mb']:
+            raise CommandError(
+                f"RSS grew {growth:.1f} MB, more than {options['max_growth_mb']} MB"
+            )
+        self.stdout.write(self.style.SUCCESS('Memory stayed flat.'))
+
+    def _export(self, trips, options):
+        started = time.perf_counter()
+        lines = size = 0
+        baseline = peak = None
+        for chunk in stream_trips(trips, options['format'], options['chunk_size']):
+            lines += chunk.count('\n')
+            size += len(chunk.encode())
+            current = rss_mb()
+            if baseline is None:
+                # Measured once the cursor, buffers and imports are warm
+                baseline = peak = current
+            peak = max(peak, current)
+        if baseline is None:
+            raise CommandError('Nothing to export')
+        return lines, size / 2 ** 20, time.perf_counter() - started, baseline, peak
+
+    def _seed(self, rows):
+        tag = uuid.uuid4().hex[:8]
+        rider = User.objects.create(
+            username=f'bench-export-{tag}', email=f'bench-export-{tag}@example.com',
+            password=make_password(None), role='rider',
+        )
+        if is_partitioned():
+            ensure_partitions(start=timezone.now() - timedelta(days=365))
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('SET LOCAL synchronous_commit = off')
+            cursor.execute(SEED_SQL, {'rider': rider.pk, 'rows': rows})
+            cursor.execute('ANALYZE trips_trip')
+        self.stdout.write(f'Seeded {rows} trips in {time.perf_counter() - started:.1f}s')
+        return rider
+
+    def _clean(self, rider):
+        # Raw SQL: collecting millions of trips for the ORM cascade is slow
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute('DELETE FROM trips_trip WHERE rider_id = %s', [rider.pk])
+        rider.delete()
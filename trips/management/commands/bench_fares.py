@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.fares import compile_table, duration_minutes, quote_many, quote_one, route_km
+from trips.geo import KM_PER_DEGREE, haversine_km
+from trips.models import Tariff
+
+
+class Command(BaseCommand):
+    help = (
+        'Price synthetic trips with the vectorized fare engine and with a '
+        'per-trip Python loop, check they agree and compare the timings'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=100000)
+        parser.add_argument('--rounds', type=int, default=5)
+        parser.add_argument('--city-km', type=float, default=10.0,
+                            help='Standard deviation of positions around the centre')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        table = compile_table(Tariff.objects.filter(is_active=True))
+        if np.isnan(table.base_fare).any():
+            raise CommandError('Active tariffs must cover all 24 hours')
+        rng = np.random.default_rng(options['seed'])
+        count = options['trips']
+        spread = options['city_km'] / KM_PER_DEGREE
+        lat, lng = 40.7128, -74.0060
+        route_factor = settings.FARE_ROUTE_FACTOR
+        speed = settings.FARE_AVERAGE_SPEED_KMH
+
+        vectorized, looped = [], []
+        for round_no in range(1, options['rounds'] + 1):
+            points = (
+                rng.normal(lat, spread, count), rng.normal(lng, spread, count),
+                rng.normal(lat, spread, count), rng.normal(lng, spread, count),
+            )
+            hours = rng.integers(0, 24, count)
+
+            started = time.perf_counter()
+            distance = route_km(*points)
+            fares = quote_many(distance, duration_minutes(distance), hours, table)
+            vectorized.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            columns = [column.tolist() for column in points]
+            loop_fares = []
+            # What quote_trip() does for a single trip
+            for origin_lat, origin_lng, dest_lat, dest_lng, hour in zip(*columns, hours.tolist()):
+                trip_km = haversine_km(origin_lat, origin_lng, dest_lat, dest_lng) * route_factor
+                loop_fares.append(quote_one(trip_km, trip_km / speed * 60, hour, table))
+            looped.append((time.perf_counter() - started) * 1000)
+
+            mismatches = int(np.count_nonzero(np.abs(fares - np.array(loop_fares)) > 0.011))
+            self.stdout.write(
+                f'round {round_no}: vectorized={vectorized[-1]:.1f}ms '
+                f'loop={looped[-1]:.1f}ms mean_fare={fares.mean():.2f}'
+            )
+            if mismatches:
+                raise CommandError(f'{mismatches} fares differ between the two paths')
+
+        vector_summary, loop_summary = latency_summary(vectorized), latency_summary(looped)
+        self.stdout.write(f'vectorized ({count} trips): {format_summary(vector_summary)}')
+        self.stdout.write(f'loop ({count} trips): {format_summary(loop_summary)}')
+        self.stdout.write(self.style.SUCCESS(
+            f"Vectorized is {loop_summary['p50_ms'] / vector_summary['p50_ms']:.0f}x "
+            f'faster at the median.'
+        ))
@@ -0,0 +1,86 @@
+import re
+import time
+import uuid
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from accounts.models import DriverProfile, User
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.models import Trip
+from trips.row_cache import ROLES, row_key
+
+TEMPLATE_TIME_RE = re.compile(r'\btpl;dur=([\d.]+)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Time rendering the trip list of a rider with a long history with '
+        'every row rendered and with the rows read from the row cache'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trips', type=int, default=500,
+                            help='Trips in the benchmark rider history')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per mode')
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the generated users and trips')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        prefix = f'bench-rows-{tag}-'
+        try:
+            rider = self._create_fixtures(prefix, tag, options['trips'])
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(rider)
+            url = reverse('trips:trip_list')
+            trip_ids = Trip.objects.filter(rider=rider).values_list('id', flat=True)
+            keys = [row_key(trip_id, role) for trip_id in trip_ids for role in ROLES]
+
+            uncached = self._time(client, url, options['requests'], lambda: cache.delete_many(keys))
+            cached = self._time(client, url, options['requests'])
+        finally:
+            if not options['keep']:
+                User.objects.filter(email__startswith=prefix).delete()
+
+        for mode, (render, total) in [('uncached', uncached), ('cached', cached)]:
+            self.stdout.write(f'{mode} render: {format_summary(render)}')
+            self.stdout.write(f'{mode} request: {format_summary(total)}')
+        speedup = uncached[0]['p50_ms'] / cached[0]['p50_ms'] if cached[0]['p50_ms'] else 0
+        self.stdout.write(f'Page render is {speedup:.1f}x faster at the median with cached rows')
+
+    def _create_fixtures(self, prefix, tag, trips):
+        rider = User.objects.create_user(
+            username=f'{prefix}rider', email=f'{prefix}rider@example.com', role='rider',
+        )
+        driver_user = User.objects.create_user(
+            username=f'{prefix}driver', email=f'{prefix}driver@example.com', role='driver',
+        )
+        driver = DriverProfile.objects.create(
+            user=driver_user, license_number=f'BR-{tag}', car_number=f'BR-{tag}',
+            car_model='Bench',
+        )
+        Trip.objects.bulk_create([
+            Trip(rider=rider, driver=driver, origin=f'{i} Bench Street',
+                 destination='Bench Avenue', status='completed', price=12)
+            for i in range(trips)
+        ])
+        return rider
+
+    def _time(self, client, url, count, before=None):
+        """(template render, whole request) latencies; before() runs untimed"""
+        renders, totals = [], []
+        for _ in range(count):
+            if before is not None:
+                before()
+            started = time.perf_counter()
+            response = client.get(url)
+            totals.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'GET {url} returned {response.status_code}')
+            match = TEMPLATE_TIME_RE.search(response['Server-Timing'])
+            renders.append(float(match.group(1)))
+        return latency_summary(renders), latency_summary(totals)
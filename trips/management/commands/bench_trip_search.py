@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+
+from accounts.models import User
+from taxi_project.benchmarks import format_summary, latency_summary
+from trips.models import Trip, TripSearch
+from trips.search import RANKED_SQL, owner_prefix, parse_query
+
+TERMS = ['airport', 'main street', 'downtown', 'luggage', 'oak avenue uptown', '42 pine road']
+
+
+class Command(BaseCommand):
+    help = (
+        'Time full-text trip history searches of the rider and the driver with '
+        'the most trips against icontains filters on the same columns'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20,
+                            help='Searches per term and mode')
+        parser.add_argument('--term', action='append', dest='terms',
+                            help='Search term (repeatable; default: a fixed set)')
+        parser.add_argument('--explain', action='store_true',
+                            help='Print the plan of each ranking query')
+
+    def handle(self, *args, **options):
+        busiest = (
+            Trip.objects.order_by().values('rider').annotate(trips=Count('id'))
+            .order_by('-trips').first()
+        )
+        driver = (
+            Trip.objects.filter(driver__isnull=False).order_by().values('driver')
+            .annotate(trips=Count('id')).order_by('-trips').first()
+        )
+        if busiest is None or driver is None:
+            raise CommandError('No trips with a driver; run generate_load_data first')
+        rider = User.objects.get(pk=busiest['rider'])
+        owners = [
+            (f'rider ({busiest["trips"]} trips)', {'rider': rider}, Trip.objects.for_rider(rider)),
+            (f'driver ({driver["trips"]} trips)', {'driver': driver['driver']},
+             Trip.objects.for_driver(driver['driver'])),
+        ]
+        limit = settings.TRIP_SEARCH_RESULTS
+        for owner, search_owner, history in owners:
+            for term in options['terms'] or TERMS:
+                words = Q()
+                for field in ('origin', 'destination', 'comment'):
+                    words |= Q(**{f'{field}__icontains': term})
+                naive = history.filter(words).order_by('-created_at', '-id')[:limit]
+                modes = [
+                    ('tsvector', lambda: Trip.objects.search(term, **search_owner)),
+                    ('icontains', lambda: list(naive.all())),
+                ]
+                for mode, run in modes:
+                    summary, found = self._time(run, options['requests'])
+                    self.stdout.write(
+                        f'{owner} {term!r} [{mode}]: {found} rows, {format_summary(summary)}'
+                    )
+                if options['explain']:
+                    self.stdout.write(self._explain(term, search_owner))
+
+    def _time(self, run, count):
+        """Latencies of count calls of run (after one untimed), and the rows it returns"""
+        rows = len(run())
+        samples = []
+        for _ in range(count):
+            started = time.perf_counter()
+            run()
+            samples.append((time.perf_counter() - started) * 1000)
+        return latency_summary(samples), rows
+
+    def _explain(self, term, search_owner):
+        """Plan of the ranking query of a search"""
+        if 'rider' in search_owner:
+            prefix = owner_prefix(rider_id=search_owner['rider'].pk)
+        else:
+            prefix = owner_prefix(driver_id=search_owner['driver'])
+        query = parse_query(term, prefix)
+        sql = RANKED_SQL.format(table=TripSearch._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', [
+                query, query, settings.TRIP_SEARCH_RESULTS,
+            ])
+            return '\n'.join(row[0] for row in cursor.fetchall())
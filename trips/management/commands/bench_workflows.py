@@ -0,0 +1,400 @@
+import http.client
+import json
+import random
+import re
+import subprocess
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from taxi_project.benchmarks import compare_results, format_summary, latency_summary
+
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+AVAILABLE_TRIP_RE = re.compile(r'id="trip-(\d+)"')
+TRIP_LINK_RE = re.compile(r'href="/trips/(\d+)/"')
+# Emitted by taxi_project.middleware.RequestMetricsMiddleware
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+PASSWORD = 'Bench-workflow-2024!'
+
+
+class WorkflowError(Exception):
+    """A request in a simulated workflow failed; the iteration is abandoned"""
+
+
+class InProcessSession:
+    """Drives the site through Django's test client, counting SQL queries"""
+
+    def __init__(self, options):
+        self.client = Client(HTTP_HOST='localhost')
+
+    def request(self, method, path, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'POST':
+                response = self.client.post(path, data or {})
+            else:
+                response = self.client.get(path)
+        return (
+            response.status_code, response.content.decode(),
+            response.get('Location', ''), len(queries),
+        )
+
+    def close(self):
+        connection.close()
+
+
+class HttpSession:
+    """
+    Drives a running server over one keep-alive HTTP connection; queries are
+    read from the Server-Timing header
+    """
+
+    def __init__(self, options):
+        self.base_url = options['base_url'].rstrip('/')
+        parts = urlsplit(self.base_url)
+        connection_class = (
+            http.client.HTTPSConnection if parts.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        self.connection = connection_class(parts.netloc, timeout=options['timeout'])
+        self.prefix = parts.path
+        self.cookies = SimpleCookie()
+
+    def request(self, method, path, data=None):
+        headers = {'Referer': self.base_url + path}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(
+                f'{name}={morsel.value}' for name, morsel in self.cookies.items()
+            )
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (1, 2):
+            try:
+                self.connection.request(method, self.prefix + path, body, headers)
+                response = self.connection.getresponse()
+                content = response.read().decode(errors='replace')
+                break
+            except (http.client.HTTPException, ConnectionError):
+                # The server may drop idle keep-alive connections; retry once
+                self.connection.close()
+                if attempt == 2:
+                    raise
+        for header in response.headers.get_all('Set-Cookie') or []:
+            self.cookies.load(header)
+        # Query counts come from the server's Server-Timing header when enabled
+        match = SERVER_TIMING_QUERIES_RE.search(response.getheader('Server-Timing', ''))
+        queries = int(match.group(1)) if match else None
+        return response.status, content, response.getheader('Location', ''), queries
+
+    def close(self):
+        self.connection.close()
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency, query and error samples"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = Counter()
+        self.events = Counter()
+
+    def record(self, name, elapsed_ms, queries, ok):
+        with self._lock:
+            self.latencies[name].append(elapsed_ms)
+            if queries is not None:
+                self.queries[name].append(queries)
+            if not ok:
+                self.errors[name] += 1
+
+    def count(self, event):
+        with self._lock:
+            self.events[event] += 1
+
+    def results(self, duration):
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            queries = self.queries.get(name)
+            endpoints[name] = {
+                **latency_summary(samples),
+                'errors': self.errors[name],
+                'rps': round(len(samples) / duration, 2),
+                'queries_per_request': (
+                    round(sum(queries) / len(queries), 2) if queries else None
+                ),
+            }
+        everything = [ms for samples in self.latencies.values() for ms in samples]
+        totals = {
+            **latency_summary(everything),
+            'errors': sum(self.errors.values()),
+            'rps': round(len(everything) / duration, 2),
+        }
+        return endpoints, totals, dict(self.events)
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive concurrent simulated riders and drivers through the register, '
+        'create trip, list available, accept and complete workflows and '
+        'report per-endpoint latency, throughput and queries per request'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=10,
+                            help='Concurrent simulated riders')
+        parser.add_argument('--drivers', type=int, default=5,
+                            help='Concurrent simulated drivers')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Workflow iterations per simulated user')
+        parser.add_argument('--duration', type=float,
+                            help='Run for this many seconds instead of --iterations')
+        parser.add_argument('--think-ms', type=float, default=0,
+                            help='Pause between workflow steps')
+        parser.add_argument('--base-url',
+                            help='Benchmark a running server (e.g. http://localhost:8000) '
+                                 'instead of an in-process client on a test database')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='Reuse the test database between in-process runs')
+        parser.add_argument('--load-trips', type=int, default=0,
+                            help='Pre-fill the test database with generate_load_data')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to diff against')
+        parser.add_argument('--max-regression', type=float,
+                            help='Fail if any endpoint p95 or queries per request grew '
+                                 'by more than this percentage over --baseline')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.recorder = Recorder()
+        self.tag = uuid.uuid4().hex[:8]
+        if options['base_url']:
+            session_class = HttpSession
+            mode = 'http'
+        else:
+            session_class = InProcessSession
+            mode = 'in-process'
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False,
+                keepdb=options['keepdb'],
+            )
+        started_at = timezone.now()
+        try:
+            if options['load_trips'] and mode == 'in-process':
+                self._load_trips(options['load_trips'])
+            started = time.perf_counter()
+            self._run(session_class)
+            duration = time.perf_counter() - started
+        finally:
+            if mode == 'in-process':
+                connection.creation.destroy_test_db(
+                    old_name, verbosity=0, keepdb=options['keepdb']
+                )
+
+        endpoints, totals, events = self.recorder.results(duration)
+        results = {
+            'meta': {
+                'mode': mode,
+                'commit': self._commit(),
+                'started_at': started_at.isoformat(),
+                'duration_s': round(duration, 2),
+                'riders': options['riders'],
+                'drivers': options['drivers'],
+                'iterations': None if options['duration'] else options['iterations'],
+                'load_trips': options['load_trips'],
+            },
+            'totals': totals,
+            'endpoints': endpoints,
+            'events': events,
+        }
+        self._report(results)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2, sort_keys=True)
+            self.stdout.write(f'Results written to {options["output"]}')
+        if options['baseline']:
+            self._compare(results)
+
+    def _load_trips(self, trips):
+        call_command(
+            'generate_load_data', trips=trips, riders=max(trips // 50, 1),
+            drivers=max(trips // 500, 1), prefix='bench-load', clear=True,
+            stdout=self.stdout,
+        )
+
+    def _run(self, session_class):
+        options = self.options
+        users = (
+            [(self._rider, i) for i in range(options['riders'])]
+            + [(self._driver, i) for i in range(options['drivers'])]
+        )
+        self.deadline = (
+            time.perf_counter() + options['duration'] if options['duration'] else None
+        )
+
+        def simulate(workflow, index):
+            session = session_class(options)
+            rng = random.Random(f'{options["seed"]}-{workflow.__name__}-{index}')
+            try:
+                workflow(session, index, rng)
+            except WorkflowError as exc:
+                self.stderr.write(f'{workflow.__name__[1:]} {index} gave up: {exc}')
+            finally:
+                session.close()
+
+        threads = [
+            threading.Thread(target=simulate, args=user, daemon=True) for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _iterations(self):
+        if self.deadline is None:
+            return iter(range(self.options['iterations']))
+        return iter(lambda: time.perf_counter() < self.deadline, False)
+
+    def _call(self, session, name, method, path, data=None, expect=(200,)):
+        started = time.perf_counter()
+        try:
+            status, body, location, queries = session.request(method, path, data)
+        except (http.client.HTTPException, OSError) as exc:
+            self.recorder.record(name, (time.perf_counter() - started) * 1000, None, False)
+            raise WorkflowError(f'{name}: {exc}')
+        elapsed = (time.perf_counter() - started) * 1000
+        ok = status in expect
+        self.recorder.record(name, elapsed, queries, ok)
+        if not ok:
+            raise WorkflowError(f'{name}: HTTP {status}')
+        if self.options['think_ms']:
+            time.sleep(self.options['think_ms'] / 1000)
+        return body, location
+
+    def _post_form(self, session, name, path, data):
+        body, _ = self._call(session, f'{name} GET', 'GET', path)
+        match = CSRF_RE.search(body)
+        data = {'csrfmiddlewaretoken': match.group(1) if match else '', **data}
+        return self._call(session, f'{name} POST', 'POST', path, data, expect=(302,))
+
+    def _register(self, session, role, index):
+        username = f'bench-{self.tag}-{role}-{index}'
+        data = {
+            'username': username,
+            'email': f'{username}@example.com',
+            'phone': '',
+            'role': role,
+            'password1': PASSWORD,
+            'password2': PASSWORD,
+        }
+        if role == 'driver':
+            data.update(license_number=f'BW-{self.tag}-{index}',
+                        car_number=f'BW-{index}', car_model='Bench')
+        self._post_form(session, 'accounts:register', reverse('accounts:register'), data)
+
+    def _rider(self, session, index, rng):
+        self._register(session, 'rider', index)
+        for _ in self._iterations():
+            try:
+                self._post_form(session, 'trips:trip_create', reverse('trips:trip_create'), {
+                    'origin': f'{rng.randrange(1, 999)} Bench Street',
+                    'destination': f'{rng.randrange(1, 999)} Load Avenue',
+                    'comment': '',
+                })
+                self.recorder.count('trips_created')
+                body, _ = self._call(session, 'trips:trip_list', 'GET',
+                                     reverse('trips:trip_list'))
+                match = TRIP_LINK_RE.search(body)
+                if match:
+                    self._call(session, 'trips:trip_detail', 'GET',
+                               reverse('trips:trip_detail', args=[match.group(1)]))
+            except WorkflowError:
+                self.recorder.count('rider_iterations_failed')
+
+    def _driver(self, session, index, rng):
+        self._register(session, 'driver', index)
+        for _ in self._iterations():
+            try:
+                body, _ = self._call(session, 'trips:available_trips', 'GET',
+                                     reverse('trips:available_trips'))
+                open_trips = AVAILABLE_TRIP_RE.findall(body)
+                if not open_trips:
+                    self.recorder.count('no_trips_available')
+                    time.sleep(0.01)
+                    continue
+                pk = rng.choice(open_trips)
+                detail = reverse('trips:trip_detail', args=[pk])
+                _, location = self._call(session, 'trips:accept_trip', 'GET',
+                                         reverse('trips:accept_trip', args=[pk]),
+                                         expect=(302,))
+                if urlsplit(location).path != detail:
+                    self.recorder.count('accept_lost')
+                    continue
+                self.recorder.count('accepted')
+                self._call(session, 'trips:trip_detail', 'GET', detail)
+                self._call(session, 'trips:complete_trip', 'GET',
+                           reverse('trips:complete_trip', args=[pk]), expect=(302,))
+                self.recorder.count('completed')
+                self._call(session, 'vehicles:vehicle_list', 'GET',
+                           reverse('vehicles:vehicle_list'))
+                self._call(session, 'accounts:profile', 'GET', reverse('accounts:profile'))
+            except WorkflowError:
+                self.recorder.count('driver_iterations_failed')
+
+    def _report(self, results):
+        meta = results['meta']
+        self.stdout.write(
+            f'{meta["mode"]} run: {meta["riders"]} riders, {meta["drivers"]} drivers, '
+            f'{meta["duration_s"]}s'
+        )
+        for name, summary in results['endpoints'].items():
+            queries = summary['queries_per_request']
+            self.stdout.write(
+                f'{name}: {format_summary(summary)} rps={summary["rps"]} '
+                f'queries={"-" if queries is None else queries} errors={summary["errors"]}'
+            )
+        totals = results['totals']
+        self.stdout.write(f'total: {format_summary(totals)} rps={totals["rps"]} '
+                          f'errors={totals["errors"]}')
+        self.stdout.write(f'events: {json.dumps(results["events"], sort_keys=True)}')
+
+    def _compare(self, results):
+        with open(self.options['baseline']) as fh:
+            baseline = json.load(fh)
+        self.stdout.write(f'Compared with {self.options["baseline"]} '
+                          f'(commit {baseline["meta"].get("commit") or "unknown"}):')
+        limit = self.options['max_regression']
+        regressions = []
+        rows = compare_results(baseline['endpoints'], results['endpoints'])
+        for name, metric, old, new, pct in rows:
+            if pct is None:
+                continue
+            self.stdout.write(f'  {name} {metric}: {old} -> {new} ({pct:+}%)')
+            if limit is not None and metric != 'rps' and pct > limit:
+                regressions.append(f'{name} {metric} {pct:+}%')
+        if regressions:
+            raise CommandError('Regressions over baseline: ' + ', '.join(regressions))
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from trips.dispatch import dispatch_once
+
+
+class Command(BaseCommand):
+    help = (
+        'Assign requested trips to free nearby drivers in batches, once or '
+        'every dispatch tick'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single tick and exit')
+        parser.add_argument('--interval', type=float,
+                            default=settings.TRIP_DISPATCH_TICK_SECONDS,
+                            help='Seconds between the start of two ticks')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            result = dispatch_once()
+            self.stdout.write(
+                f'trips={result.trips} drivers={result.drivers} '
+                f'proposed={result.proposed} assigned={len(result.assigned)} '
+                f'solve={result.solve_ms}ms total={result.total_ms}ms'
+            )
+            if options['once']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
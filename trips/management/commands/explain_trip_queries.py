@@ -0,0 +1,119 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import DriverProfile, User
+from trips.geo import grid_cell_sql
+from trips.models import Trip
+from trips.partitions import ensure_partitions, is_partitioned
+from trips.query_plans import check_access_paths
+
+# Open trips are scattered over a ~30 km wide city around CITY_CENTER
+CITY_CENTER = (40.7128, -74.0060)
+
+SEED_SQL = '''
+    INSERT INTO trips_trip
+        (rider_id, driver_id, origin, destination, status, comment,
+         created_at, updated_at, origin_lat, origin_lng, origin_cell)
+    SELECT
+        (%(riders)s::bigint[])[1 + s.g %% %(rider_count)s],
+        CASE WHEN s.r < 0.02 THEN NULL
+             ELSE (%(drivers)s::bigint[])[1 + s.g %% %(driver_count)s] END,
+        'Origin ' || s.g, 'Destination ' || s.g,
+        CASE WHEN s.r < 0.02 THEN 'requested'
+             WHEN s.r < 0.05 THEN 'accepted'
+             WHEN s.r < 0.95 THEN 'completed'
+             ELSE 'cancelled' END,
+        '', s.created_at, s.created_at, s.lat, s.lng, {cell}
+    FROM (
+        SELECT g, random() AS r, now() - random() * interval '365 days' AS created_at,
+               %(lat)s + (random() - 0.5) * 0.3 AS lat,
+               %(lng)s + (random() - 0.5) * 0.4 AS lng
+        FROM generate_series(1, %(rows)s) AS g
+    ) AS s
+'''.format(cell=grid_cell_sql('s.lat', 's.lng'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large trips table and assert via EXPLAIN that every hot Trip '
+        'query is an index scan without a sort'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500000,
+                            help='Number of trips to seed before explaining')
+        parser.add_argument('--riders', type=int, default=2000)
+        parser.add_argument('--drivers', type=int, default=500)
+        parser.add_argument('--keep', action='store_true',
+                            help='Keep the seeded users and trips')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        prefix = f'explain-{tag}-'
+        try:
+            rider, driver = self._seed(prefix, options)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE trips_trip')
+            position = (
+                Trip.objects.for_rider(rider)
+                .order_by('-created_at', '-id')
+                .values_list('created_at', 'id')[options['rows'] // options['riders'] // 2]
+            )
+            results = check_access_paths(rider, driver, position, CITY_CENTER)
+        finally:
+            if not options['keep']:
+                User.objects.filter(email__startswith=prefix).delete()
+
+        failures = 0
+        for name, (plan, problems) in results.items():
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f'{name}: {", ".join(problems)}'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(f'{name}: ok')
+        if failures:
+            raise CommandError(f'{failures} access path(s) regressed')
+        self.stdout.write(self.style.SUCCESS('All access paths use their index.'))
+
+    def _seed(self, prefix, options):
+        password = make_password(None)
+        riders = User.objects.bulk_create([
+            User(username=f'{prefix}r{i}', email=f'{prefix}r{i}@example.com',
+                 password=password, role='rider')
+            for i in range(options['riders'])
+        ])
+        driver_users = User.objects.bulk_create([
+            User(username=f'{prefix}d{i}', email=f'{prefix}d{i}@example.com',
+                 password=password, role='driver')
+            for i in range(options['drivers'])
+        ])
+        drivers = DriverProfile.objects.bulk_create([
+            DriverProfile(user=user, license_number=f'{prefix}{i}',
+                          car_number=f'EX-{i}', car_model='Explain')
+            for i, user in enumerate(driver_users)
+        ])
+        if is_partitioned():
+            # The seeded year would otherwise land in the default partition
+            ensure_partitions(start=timezone.now() - timedelta(days=365))
+        started = time.perf_counter()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(SEED_SQL, {
+                'riders': [rider.pk for rider in riders],
+                'rider_count': len(riders),
+                'drivers': [driver.pk for driver in drivers],
+                'driver_count': len(drivers),
+                'rows': options['rows'],
+                'lat': CITY_CENTER[0],
+                'lng': CITY_CENTER[1],
+            })
+        self.stdout.write(
+            f'Seeded {options["rows"]} trips in {time.perf_counter() - started:.1f}s'
+        )
+        return riders[0], drivers[0]
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.export import filter_trips, stream_trips
+from trips.forms import TripExportForm
+from trips.models import Trip
+
+
+class Command(BaseCommand):
+    help = 'Stream trips as CSV or NDJSON to a file or stdout, in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--rider', type=int, help='Rider user id')
+        parser.add_argument('--driver', type=int, help='Driver profile id')
+        parser.add_argument('--status', choices=[value for value, _ in Trip.STATUS_CHOICES])
+        parser.add_argument('--since', help='First day, YYYY-MM-DD')
+        parser.add_argument('--until', help='Last day, YYYY-MM-DD')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--output', '-o', help='File to write (default: stdout)')
+
+    def handle(self, *args, **options):
+        names = ['format', 'rider', 'driver', 'status', 'since', 'until']
+        form = TripExportForm(
+            {name: options[name] for name in names if options[name] is not None},
+            staff=True,
+        )
+        if not form.is_valid():
+            raise CommandError(form.errors.as_text())
+        filters = form.cleaned_data
+        trips = filter_trips(
+            Trip.objects.all(), rider=filters['rider'], driver=filters['driver'],
+            status=filters['status'], since=filters['since'], until=filters['until'],
+        )
+        chunks = stream_trips(trips, filters['format'], options['chunk_size'])
+
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for chunk in chunks:
+                output.write(chunk)
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.partitions import ensure_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the monthly trip partitions for the coming months (run daily) '
+        'and list the partitions'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int,
+                            default=settings.TRIP_PARTITION_MONTHS_AHEAD)
+        parser.add_argument('--from', dest='start', default=None,
+                            help='Also create the months since this one (YYYY-MM)')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError('trips_trip is not partitioned; run migrate first')
+        start = None
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--from must look like 2024-01')
+        for name in ensure_partitions(start, options['months_ahead']):
+            self.stdout.write(f'created {name}')
+        for partition in list_partitions():
+            self.stdout.write(f'{partition.name}: ~{partition.rows} rows')
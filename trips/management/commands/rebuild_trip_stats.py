@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from trips.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every rider and driver TripStats row from the trips with '
+        'one set-based query'
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} trip statistics rows in {elapsed:.2f}s.'))
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import DriverProfile
+from trips.models import TripRating
+
+COUNTERS = ['rating_count', 'rating_sum', 'rating', 'recent_ratings', 'recent_rating']
+
+# Every driver's counters recomputed from the trip ratings in one pass.
+# Drivers never rated keep their seeded rating; drivers whose ratings were
+# all deleted go back to the default.
+EXPECTED_SQL = '''
+    WITH history AS (
+        SELECT driver_id, count(*) AS rating_count, sum(score) AS rating_sum,
+               (array_agg(score ORDER BY id DESC))[1:%(window)s] AS recent_ratings
+        FROM {rating_table}
+        GROUP BY driver_id
+    )
+    SELECT driver.id,
+           coalesce(history.rating_count, 0) AS rating_count,
+           coalesce(history.rating_sum, 0) AS rating_sum,
+           CASE WHEN history.driver_id IS NULL THEN %(default_rating)s
+                ELSE round(history.rating_sum::numeric / history.rating_count, 2)
+           END AS rating,
+           coalesce(history.recent_ratings, '{{}}')::smallint[] AS recent_ratings,
+           (SELECT round(avg(score), 2) FROM unnest(history.recent_ratings) AS score)
+               AS recent_rating
+    FROM {driver_table} AS driver
+    LEFT JOIN history ON history.driver_id = driver.id
+    WHERE (history.driver_id IS NOT NULL OR driver.rating_count > 0){only}
+'''
+
+DRIFT_SQL = '''
+    WITH expected AS ({expected})
+    SELECT driver.id, {stored}, {wanted}
+    FROM {driver_table} AS driver
+    JOIN expected ON expected.id = driver.id
+    WHERE ({stored}) IS DISTINCT FROM ({wanted})
+    ORDER BY driver.id
+'''
+
+FIX_SQL = '''
+    WITH expected AS ({expected})
+    UPDATE {driver_table} AS driver SET {assignments}
+    FROM expected
+    WHERE expected.id = driver.id
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute every driver rating from the trip ratings and report, or '
+        'with --fix repair, counters that drifted from the history'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Overwrite drifted counters with the recomputed values')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Print at most this many drifted drivers')
+
+    def handle(self, *args, **options):
+        drifted = self._drifted()
+        for row in drifted[:options['show']]:
+            pk, values = row[0], row[1:]
+            changes = ', '.join(
+                f'{name} {stored} -> {wanted}'
+                for name, stored, wanted in zip(
+                    COUNTERS, values[:len(COUNTERS)], values[len(COUNTERS):]
+                )
+                if stored != wanted
+            )
+            self.stdout.write(f'driver #{pk}: {changes}')
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All driver ratings match their history.'))
+            return
+        self.stdout.write(f'{len(drifted)} drivers drifted from their rating history.')
+        if options['fix']:
+            fixed = self._fix([row[0] for row in drifted])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} drivers.'))
+
+    def _expected(self, only=''):
+        return EXPECTED_SQL.format(
+            rating_table=TripRating._meta.db_table,
+            driver_table=DriverProfile._meta.db_table,
+            only=only,
+        )
+
+    def _params(self, **extra):
+        return {
+            'window': settings.DRIVER_RATING_WINDOW,
+            'default_rating': DriverProfile._meta.get_field('rating').default,
+            **extra,
+        }
+
+    def _drifted(self):
+        sql = DRIFT_SQL.format(
+            expected=self._expected(),
+            driver_table=DriverProfile._meta.db_table,
+            stored=', '.join(f'driver.{name}' for name in COUNTERS),
+            wanted=', '.join(f'expected.{name}' for name in COUNTERS),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, self._params())
+            return cursor.fetchall()
+
+    def _fix(self, ids):
+        table = DriverProfile._meta.db_table
+        sql = FIX_SQL.format(
+            expected=self._expected(only=' AND driver.id = ANY(%(ids)s)'),
+            driver_table=table,
+            assignments=', '.join(f'{name} = expected.{name}' for name in COUNTERS),
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Lock first: ratings committed while we waited are then part of
+            # the recomputed history, and later ones add onto the fixed values
+            cursor.execute(
+                f'SELECT id FROM {table} WHERE id = ANY(%s) ORDER BY id FOR UPDATE', [ids]
+            )
+            cursor.execute(sql, self._params(ids=ids))
+            return cursor.rowcount
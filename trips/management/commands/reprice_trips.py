@@ -0,0 +1,60 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models.functions import ExtractHour
+
+from trips.fares import duration_minutes, get_table, quote_many, route_km
+from trips.models import Trip
+
+UPDATE_SQL = '''
+    UPDATE {table} AS trip SET price = batch.price
+    FROM unnest(%s::bigint[], %s::numeric[]) AS batch(id, price)
+    WHERE trip.id = batch.id AND trip.id BETWEEN %s AND %s
+        AND trip.status = 'requested' AND trip.price IS DISTINCT FROM batch.price
+'''
+
+
+class Command(BaseCommand):
+    help = 'Re-quote the price of every open trip with the current tariffs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        table = get_table()
+        sql = UPDATE_SQL.format(table=Trip._meta.db_table)
+        trips = (
+            Trip.objects.available()
+            .exclude(origin_lat=None).exclude(origin_lng=None)
+            .exclude(destination_lat=None).exclude(destination_lng=None)
+            .order_by('id')
+        )
+        last_id, quoted, changed = 0, 0, 0
+        while True:
+            rows = np.array(
+                trips.filter(id__gt=last_id)
+                .annotate(hour=ExtractHour('created_at'))
+                .values_list('id', 'origin_lat', 'origin_lng', 'destination_lat',
+                             'destination_lng', 'hour')[:options['batch_size']],
+                dtype=np.float64,
+            ).reshape(-1, 6)
+            if not len(rows):
+                break
+            ids = rows[:, 0].astype(np.int64)
+            first_id, last_id = int(ids[0]), int(ids[-1])
+            distance = route_km(*rows[:, 1:5].T)
+            fares = quote_many(distance, duration_minutes(distance), rows[:, 5], table)
+            covered = ~np.isnan(fares)
+            quoted += int(covered.sum())
+            prices = [f'{fare:.2f}' for fare in fares[covered].tolist()]
+            with transaction.atomic(), connection.cursor() as cursor:
+                # The id range keeps the join on the primary key
+                cursor.execute(sql, [ids[covered].tolist(), prices, first_id, last_id])
+                changed += cursor.rowcount
+        self.stdout.write(self.style.SUCCESS(
+            f'Quoted {quoted} open trips, {changed} prices changed in '
+            f'{time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from trips.projections import PROJECTIONS, catch_up, replay
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply new trip events to the read models (trips.projections), once '
+        'or every --interval seconds, or rebuild them from the whole log with --replay'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='projection',
+                            help=f'Projections to run (default: all of {", ".join(PROJECTIONS)})')
+        parser.add_argument('--replay', action='store_true',
+                            help='Empty the read models and apply the whole log')
+        parser.add_argument('--follow', action='store_true',
+                            help='Keep applying new events every --interval seconds')
+        parser.add_argument('--interval', type=float,
+                            default=settings.TRIP_PROJECTION_INTERVAL_SECONDS)
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events per statement')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(PROJECTIONS)
+        if unknown:
+            raise CommandError(f'Unknown projections: {", ".join(sorted(unknown))}')
+        if options['replay'] and options['follow']:
+            raise CommandError('--replay and --follow cannot be combined')
+        projections = [PROJECTIONS[name] for name in options['names'] or PROJECTIONS]
+        run = replay if options['replay'] else catch_up
+
+        while True:
+            started = time.monotonic()
+            for projection in projections:
+                began = time.perf_counter()
+                count = run(projection, batch_size=options['batch_size'])
+                elapsed = time.perf_counter() - began
+                if count or not options['follow']:
+                    self.stdout.write(
+                        f'{projection.name}: {count} events in {elapsed:.2f}s '
+                        f'({count / elapsed if elapsed else 0:.0f} events/s)'
+                    )
+            if not options['follow']:
+                return
+            time.sleep(max(options['interval'] - (time.monotonic() - started), 0))
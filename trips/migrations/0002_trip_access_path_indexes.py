@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0001_initial'),
+        ('trips', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trip',
+            name='driver',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='driver_trips', to='accounts.driverprofile', verbose_name='Driver'),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='rider',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='trips', to=settings.AUTH_USER_MODEL, verbose_name='Rider'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('status', 'requested')), fields=['-created_at', '-id'], name='trip_open_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['rider', '-created_at', '-id'], name='trip_rider_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['driver', '-created_at', '-id'], name='trip_driver_history_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['-created_at', '-id'], name='trip_created_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:49
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0002_trip_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='destination_lat',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Destination Latitude'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='destination_lng',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Destination Longitude'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origin_cell',
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origin_lat',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)], verbose_name='Origin Latitude'),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='origin_lng',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)], verbose_name='Origin Longitude'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('status', 'requested')), fields=['origin_cell'], name='trip_open_cell_idx'),
+        ),
+    ]
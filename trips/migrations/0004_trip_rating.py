@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0003_driver_rating_counters'),
+        ('trips', '0003_trip_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripRating',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.PositiveSmallIntegerField(choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5')], verbose_name='Score')),
+                ('comment', models.TextField(blank=True, verbose_name='Comment')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('driver', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ratings', to='accounts.driverprofile', verbose_name='Driver')),
+                ('rider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trip_ratings', to=settings.AUTH_USER_MODEL, verbose_name='Rider')),
+                ('trip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating', to='trips.trip', verbose_name='Trip')),
+            ],
+            options={
+                'verbose_name': 'Trip Rating',
+                'verbose_name_plural': 'Trip Ratings',
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['driver', '-id'], name='trip_rating_driver_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='triprating',
+            constraint=models.CheckConstraint(check=models.Q(('score__gte', 1), ('score__lte', 5)), name='trip_rating_score_range'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Same as trips.stats.rebuild(), frozen here for existing trips
+POPULATE_SQL = '''
+    INSERT INTO trips_tripstats
+        (user_id, role, trips, open_trips, completed, cancelled, amount, updated_at)
+    SELECT user_id, role, count(*),
+           count(*) FILTER (WHERE status IN ('requested', 'accepted')),
+           count(*) FILTER (WHERE status = 'completed'),
+           count(*) FILTER (WHERE status = 'cancelled'),
+           coalesce(sum(price) FILTER (WHERE status = 'completed'), 0),
+           now()
+    FROM (
+        SELECT rider_id AS user_id, 'rider' AS role, status, price FROM trips_trip
+        UNION ALL
+        SELECT driver.user_id, 'driver', trip.status, trip.price
+        FROM trips_trip AS trip
+        JOIN accounts_driverprofile AS driver ON driver.id = trip.driver_id
+    ) AS party
+    GROUP BY user_id, role
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0003_driver_rating_counters'),
+        ('trips', '0004_trip_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('rider', 'Rider'), ('driver', 'Driver')], max_length=10, verbose_name='Role')),
+                ('trips', models.IntegerField(default=0, verbose_name='Trips')),
+                ('open_trips', models.IntegerField(default=0, verbose_name='Open')),
+                ('completed', models.IntegerField(default=0, verbose_name='Completed')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='Cancelled')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Amount')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='trip_stats', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Trip Statistics',
+                'verbose_name_plural': 'Trip Statistics',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tripstats',
+            constraint=models.UniqueConstraint(fields=('user', 'role'), name='trip_stats_user_role'),
+        ),
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:18
+
+import django.core.validators
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def create_standard_tariff(apps, schema_editor):
+    Tariff = apps.get_model('trips', 'Tariff')
+    Tariff.objects.create(
+        name='Standard',
+        base_fare=Decimal('2.50'),
+        per_km=Decimal('1.20'),
+        per_minute=Decimal('0.30'),
+        minimum_fare=Decimal('5.00'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0005_trip_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Name')),
+                ('start_hour', models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(23)], verbose_name='From Hour')),
+                ('end_hour', models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(23)], verbose_name='To Hour')),
+                ('base_fare', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Base Fare')),
+                ('per_km', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Per km')),
+                ('per_minute', models.DecimalField(decimal_places=2, max_digits=8, verbose_name='Per Minute')),
+                ('minimum_fare', models.DecimalField(decimal_places=2, default=0, max_digits=8, verbose_name='Minimum Fare')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Active')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Tariff',
+                'verbose_name_plural': 'Tariffs',
+                'ordering': ['start_hour', 'name'],
+            },
+        ),
+        migrations.RunPython(create_standard_tariff, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Rebuild trips_trip as a table partitioned by month of created_at. The
+# primary key has to include the partition key, so nothing can reference
+# trips_trip(id) with a foreign key any more: trip ratings keep the column
+# without the constraint. Months from the oldest trip through three months
+# ahead are created here; trips.partitions keeps adding them. Months are
+# UTC months there too, so the bounds match whatever the session time zone.
+PARTITION_SQL = '''
+    SET LOCAL TIME ZONE 'UTC';
+    ALTER TABLE trips_trip RENAME TO trips_trip_unpartitioned;
+    ALTER INDEX trips_trip_pkey RENAME TO trips_trip_unpartitioned_pkey;
+    ALTER INDEX trip_open_feed_idx RENAME TO trip_open_feed_idx_unpartitioned;
+    ALTER INDEX trip_rider_history_idx RENAME TO trip_rider_history_idx_unpartitioned;
+    ALTER INDEX trip_driver_history_idx RENAME TO trip_driver_history_idx_unpartitioned;
+    ALTER INDEX trip_created_idx RENAME TO trip_created_idx_unpartitioned;
+    ALTER INDEX trip_open_cell_idx RENAME TO trip_open_cell_idx_unpartitioned;
+
+    CREATE TABLE trips_trip (LIKE trips_trip_unpartitioned INCLUDING DEFAULTS)
+        PARTITION BY RANGE (created_at);
+    ALTER TABLE trips_trip ADD CONSTRAINT trips_trip_pkey PRIMARY KEY (id, created_at);
+    ALTER TABLE trips_trip ADD CONSTRAINT trips_trip_rider_id_f8a8505d_fk_accounts_user_id
+        FOREIGN KEY (rider_id) REFERENCES accounts_user (id) DEFERRABLE INITIALLY DEFERRED;
+    ALTER TABLE trips_trip
+        ADD CONSTRAINT trips_trip_driver_id_26500acf_fk_accounts_driverprofile_id
+        FOREIGN KEY (driver_id) REFERENCES accounts_driverprofile (id)
+        DEFERRABLE INITIALLY DEFERRED;
+
+    CREATE TABLE trips_trip_default PARTITION OF trips_trip DEFAULT;
+    DO $$
+    DECLARE
+        month date;
+    BEGIN
+        SELECT date_trunc('month', coalesce(min(created_at), now()))::date INTO month
+        FROM trips_trip_unpartitioned;
+        WHILE month <= date_trunc('month', now()) + interval '3 months' LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF trips_trip FOR VALUES FROM (%L) TO (%L)',
+                'trips_trip_p' || to_char(month, 'YYYY_MM'),
+                month::timestamptz, (month + interval '1 month')::timestamptz
+            );
+            month := month + interval '1 month';
+        END LOOP;
+    END
+    $$;
+
+    INSERT INTO trips_trip SELECT * FROM trips_trip_unpartitioned;
+    -- Check the copied rows now; indexes cannot be built with checks pending
+    SET CONSTRAINTS ALL IMMEDIATE;
+    DROP TABLE trips_trip_unpartitioned;
+    ALTER TABLE trips_trip ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+    SELECT setval(pg_get_serial_sequence('trips_trip', 'id'), coalesce(max(id), 0) + 1, false)
+    FROM trips_trip;
+
+    CREATE INDEX trip_open_feed_idx ON trips_trip (created_at DESC, id DESC)
+        WHERE status = 'requested';
+    CREATE INDEX trip_rider_history_idx ON trips_trip (rider_id, created_at DESC, id DESC);
+    CREATE INDEX trip_driver_history_idx ON trips_trip (driver_id, created_at DESC, id DESC);
+    CREATE INDEX trip_created_idx ON trips_trip (created_at DESC, id DESC);
+    CREATE INDEX trip_open_cell_idx ON trips_trip (origin_cell) WHERE status = 'requested';
+    ANALYZE trips_trip;
+'''
+
+# Back to a plain table with the same columns, keys and indexes as before.
+# Trips in archived (detached) months are not brought back.
+UNPARTITION_SQL = '''
+    ALTER TABLE trips_trip RENAME TO trips_trip_partitioned;
+    CREATE TABLE trips_trip (LIKE trips_trip_partitioned INCLUDING DEFAULTS);
+    INSERT INTO trips_trip SELECT * FROM trips_trip_partitioned;
+    DROP TABLE trips_trip_partitioned;
+
+    ALTER TABLE trips_trip ADD CONSTRAINT trips_trip_pkey PRIMARY KEY (id);
+    ALTER TABLE trips_trip ADD CONSTRAINT trips_trip_rider_id_f8a8505d_fk_accounts_user_id
+        FOREIGN KEY (rider_id) REFERENCES accounts_user (id) DEFERRABLE INITIALLY DEFERRED;
+    ALTER TABLE trips_trip
+        ADD CONSTRAINT trips_trip_driver_id_26500acf_fk_accounts_driverprofile_id
+        FOREIGN KEY (driver_id) REFERENCES accounts_driverprofile (id)
+        DEFERRABLE INITIALLY DEFERRED;
+    ALTER TABLE trips_trip ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+    SELECT setval(pg_get_serial_sequence('trips_trip', 'id'), coalesce(max(id), 0) + 1, false)
+    FROM trips_trip;
+
+    CREATE INDEX trip_open_feed_idx ON trips_trip (created_at DESC, id DESC)
+        WHERE status = 'requested';
+    CREATE INDEX trip_rider_history_idx ON trips_trip (rider_id, created_at DESC, id DESC);
+    CREATE INDEX trip_driver_history_idx ON trips_trip (driver_id, created_at DESC, id DESC);
+    CREATE INDEX trip_created_idx ON trips_trip (created_at DESC, id DESC);
+    CREATE INDEX trip_open_cell_idx ON trips_trip (origin_cell) WHERE status = 'requested';
+    ANALYZE trips_trip;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0006_tariff'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='triprating',
+            name='trip',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='rating', to='trips.trip', verbose_name='Trip'),
+        ),
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+    ]
@@ -0,0 +1,156 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+APPEND_ONLY_SQL = '''
+    CREATE FUNCTION trips_tripevent_append_only() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        RAISE EXCEPTION 'trips_tripevent is append-only';
+    END
+    $$;
+    CREATE TRIGGER trips_tripevent_append_only
+    BEFORE UPDATE OR DELETE ON trips_tripevent
+    FOR EACH STATEMENT EXECUTE FUNCTION trips_tripevent_append_only();
+'''
+DROP_APPEND_ONLY_SQL = '''
+    DROP TRIGGER trips_tripevent_append_only ON trips_tripevent;
+    DROP FUNCTION trips_tripevent_append_only();
+'''
+
+# The history of existing trips is lost: each gets its creation and, unless
+# still requested, a single change to its current status at updated_at
+BACKFILL_SQL = '''
+    INSERT INTO trips_tripevent
+        (trip_id, rider_id, driver_id, actor_id, from_status, to_status, price,
+         occurred_at, transaction_id)
+    SELECT * FROM (
+        SELECT id, rider_id, NULL::bigint, NULL::bigint, '', 'requested', price,
+               created_at, txid_current()
+        FROM trips_trip
+        UNION ALL
+        SELECT id, rider_id, driver_id, NULL, 'requested', status, price,
+               updated_at, txid_current()
+        FROM trips_trip WHERE status <> 'requested'
+    ) AS event
+    ORDER BY 8, 1
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0005_photo_variants'),
+        ('trips', '0007_partition_trips'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('accepted', models.IntegerField(default=0, verbose_name='Accepted')),
+                ('completed', models.IntegerField(default=0, verbose_name='Completed')),
+                ('cancelled', models.IntegerField(default=0, verbose_name='Cancelled')),
+                ('earned', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Earned')),
+            ],
+            options={
+                'verbose_name': 'Driver Activity',
+                'verbose_name_plural': 'Driver Activity',
+                'ordering': ['-day', 'driver'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectionOffset',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Projection')),
+                ('transaction_id', models.BigIntegerField(default=0, verbose_name='Transaction')),
+                ('event_id', models.BigIntegerField(default=0, verbose_name='Event')),
+                ('events', models.BigIntegerField(default=0, verbose_name='Events Applied')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Projection Offset',
+                'verbose_name_plural': 'Projection Offsets',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TripEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(blank=True, choices=[('requested', 'Requested'), ('accepted', 'Accepted'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20, verbose_name='From')),
+                ('to_status', models.CharField(choices=[('requested', 'Requested'), ('accepted', 'Accepted'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], max_length=20, verbose_name='To')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Price')),
+                ('occurred_at', models.DateTimeField(verbose_name='Occurred At')),
+                ('transaction_id', models.BigIntegerField(editable=False, verbose_name='Transaction')),
+            ],
+            options={
+                'verbose_name': 'Trip Event',
+                'verbose_name_plural': 'Trip Events',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='WaitTimeBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('minutes', models.PositiveIntegerField(verbose_name='Waited (min)')),
+                ('trips', models.IntegerField(default=0, verbose_name='Trips')),
+            ],
+            options={
+                'verbose_name': 'Wait Time Bucket',
+                'verbose_name_plural': 'Wait Time Histogram',
+                'ordering': ['-day', 'minutes'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='waittimebucket',
+            constraint=models.UniqueConstraint(fields=('day', 'minutes'), name='wait_time_bucket_day_minutes'),
+        ),
+        migrations.AddField(
+            model_name='tripevent',
+            name='actor',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Actor'),
+        ),
+        migrations.AddField(
+            model_name='tripevent',
+            name='driver',
+            field=models.ForeignKey(blank=True, db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='accounts.driverprofile', verbose_name='Driver'),
+        ),
+        migrations.AddField(
+            model_name='tripevent',
+            name='rider',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Rider'),
+        ),
+        migrations.AddField(
+            model_name='tripevent',
+            name='trip',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='trips.trip', verbose_name='Trip'),
+        ),
+        migrations.AddField(
+            model_name='driveractivity',
+            name='driver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='accounts.driverprofile', verbose_name='Driver'),
+        ),
+        migrations.AddIndex(
+            model_name='tripevent',
+            index=models.Index(fields=['trip', 'id'], name='trip_event_trip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tripevent',
+            index=models.Index(fields=['transaction_id', 'id'], name='trip_event_offset_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='driveractivity',
+            constraint=models.UniqueConstraint(fields=('driver', 'day'), name='driver_activity_driver_day'),
+        ),
+        migrations.RunSQL(APPEND_ONLY_SQL, DROP_APPEND_ONLY_SQL),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
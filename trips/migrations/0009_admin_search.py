@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:50
+
+from django.db import migrations
+
+from taxi_project.trigram import create_trigram_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0008_trip_events'),
+    ]
+
+    operations = [
+        # On the partitioned parent: Postgres creates the index on every partition
+        create_trigram_indexes('trips_trip', ['origin', 'destination']),
+    ]
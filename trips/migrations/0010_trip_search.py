@@ -0,0 +1,104 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:22
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The search document of each trip (see trips.search): its address and
+# comment words, once qualified by the rider ('#r<id>:word') and once by the
+# driver ('#d<id>:word'), so each posting list only holds one user's trips.
+# The qualified lexemes are written into the tsvector's text form, where
+# every lexeme starts with a quote at the start or after a space, keeping
+# the words' positions and weights for ranking. Triggers on trips_trip keep
+# trips_tripsearch in step, in the writing transaction; updates only
+# rewrite the document when one of its inputs or the trip's created_at changed.
+SEARCH_SQL = r"""
+    CREATE FUNCTION trips_trip_owned_words(owner text, words tsvector) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT regexp_replace(words::text, '(^| )''', '\1''' || owner, 'g')::tsvector
+    $$;
+
+    CREATE FUNCTION trips_trip_search_document(
+        origin text, destination text, comment text, rider_id bigint, driver_id bigint
+    ) RETURNS tsvector
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+        SELECT trips_trip_owned_words('#r' || rider_id || ':', words)
+            || coalesce(trips_trip_owned_words('#d' || driver_id || ':', words), '')
+        FROM (
+            SELECT setweight(to_tsvector('simple', origin), 'A')
+                || setweight(to_tsvector('simple', destination), 'B')
+                || setweight(to_tsvector('simple', comment), 'C') AS words
+        ) AS trip
+    $$;
+
+    CREATE FUNCTION trips_tripsearch_write() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            DELETE FROM trips_tripsearch WHERE trip_id = OLD.id;
+            RETURN NULL;
+        END IF;
+        INSERT INTO trips_tripsearch (trip_id, created_at, document)
+        VALUES (NEW.id, NEW.created_at, trips_trip_search_document(
+            NEW.origin, NEW.destination, NEW.comment, NEW.rider_id, NEW.driver_id
+        ))
+        ON CONFLICT (trip_id) DO UPDATE
+        SET created_at = EXCLUDED.created_at, document = EXCLUDED.document;
+        RETURN NULL;
+    END
+    $$;
+
+    CREATE TRIGGER trips_tripsearch_insert AFTER INSERT ON trips_trip
+    FOR EACH ROW EXECUTE FUNCTION trips_tripsearch_write();
+    CREATE TRIGGER trips_tripsearch_update AFTER UPDATE ON trips_trip
+    FOR EACH ROW WHEN (
+        (OLD.origin, OLD.destination, OLD.comment, OLD.rider_id, OLD.driver_id, OLD.created_at)
+        IS DISTINCT FROM
+        (NEW.origin, NEW.destination, NEW.comment, NEW.rider_id, NEW.driver_id, NEW.created_at)
+    )
+    EXECUTE FUNCTION trips_tripsearch_write();
+    CREATE TRIGGER trips_tripsearch_delete AFTER DELETE ON trips_trip
+    FOR EACH ROW EXECUTE FUNCTION trips_tripsearch_write();
+
+    INSERT INTO trips_tripsearch (trip_id, created_at, document)
+    SELECT id, created_at,
+           trips_trip_search_document(origin, destination, comment, rider_id, driver_id)
+    FROM trips_trip;
+"""
+DROP_SEARCH_SQL = '''
+    DROP TRIGGER trips_tripsearch_insert ON trips_trip;
+    DROP TRIGGER trips_tripsearch_update ON trips_trip;
+    DROP TRIGGER trips_tripsearch_delete ON trips_trip;
+    DROP FUNCTION trips_tripsearch_write();
+    DROP FUNCTION trips_trip_search_document(text, text, text, bigint, bigint);
+    DROP FUNCTION trips_trip_owned_words(text, tsvector);
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trips', '0009_admin_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TripSearch',
+            fields=[
+                ('trip', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='+', serialize=False, to='trips.trip', verbose_name='Trip')),
+                ('created_at', models.DateTimeField(verbose_name='Created At')),
+                ('document', django.contrib.postgres.search.SearchVectorField(verbose_name='Document')),
+            ],
+            options={
+                'verbose_name': 'Trip Search Document',
+                'verbose_name_plural': 'Trip Search Documents',
+            },
+        ),
+        migrations.RunSQL(SEARCH_SQL, DROP_SEARCH_SQL),
+        # After the backfill: building the index at once is much faster
+        migrations.AddIndex(
+            model_name='tripsearch',
+            index=django.contrib.postgres.indexes.GinIndex(fastupdate=False, fields=['document'], name='trip_search_idx'),
+        ),
+    ]
@@ -1,5 +1,346 @@
-﻿from django.conf import settings
-from django.db import models
+﻿from collections import namedtuple
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connections, models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .geo import cell_ranges, distance_km, grid_cell
+from .search import owner_prefix, parse_query, rank_trips
+from .signals import trip_status_changed
+
+LATITUDE_VALIDATORS = [MinValueValidator(-90), MaxValueValidator(90)]
+LONGITUDE_VALIDATORS = [MinValueValidator(-180), MaxValueValidator(180)]
+
+# First radius tried by TripQuerySet.nearest()
+NEAREST_START_KM = 0.5
+
+TripTransition = namedtuple('TripTransition', [
+    'trip_id', 'rider_id', 'driver_id', 'from_status', 'to_status',
+    'price', 'created_at', 'updated_at',
+])
+
+# What a trip contributes to TripStats, see trips.stats
+TripState = namedtuple('TripState', ['rider_id', 'driver_id', 'status', 'price'])
+STATS_FIELDS = {'rider', 'rider_id', 'driver', 'driver_id', 'status', 'price'}
+
+TRANSITION_SQL = '''
+    WITH current AS (
+        SELECT id, status FROM {table}
+        WHERE id = %s AND status IN %s{owner}
+        FOR UPDATE
+    ), changed AS (
+        UPDATE {table} AS trip
+        SET status = %s, updated_at = %s{assign}
+        FROM current
+        WHERE trip.id = current.id
+        RETURNING trip.id, trip.rider_id, trip.driver_id, current.status AS from_status,
+                  trip.status AS to_status, trip.price, trip.created_at, trip.updated_at
+    ){count}{events}
+    SELECT * FROM changed
+'''
+
+# Batch form of accept(): every pair whose trip is still requested and whose
+# driver is not on another trip is assigned; the others are skipped. Rows
+# are locked in id order so concurrent batches cannot deadlock.
+ASSIGN_SQL = '''
+    WITH batch AS (
+        SELECT * FROM unnest(%s::bigint[], %s::bigint[]) AS b(trip_id, driver_id)
+    ), current AS (
+        SELECT trip.id, trip.status, batch.driver_id FROM {table} AS trip
+        JOIN batch ON trip.id = batch.trip_id
+        WHERE trip.status = 'requested' AND NOT EXISTS (
+            SELECT 1 FROM {table} AS busy
+            WHERE busy.driver_id = batch.driver_id AND busy.status = 'accepted'
+        )
+        ORDER BY trip.id
+        FOR UPDATE OF trip
+    ), changed AS (
+        UPDATE {table} AS trip
+        SET status = 'accepted', driver_id = current.driver_id, updated_at = %s
+        FROM current
+        WHERE trip.id = current.id
+        RETURNING trip.id, trip.rider_id, trip.driver_id, current.status AS from_status,
+                  trip.status AS to_status, trip.price, trip.created_at, trip.updated_at
+    ){count}{events}
+    SELECT * FROM changed
+'''
+
+# Appended to the transition statements: folds the status changes into
+# TripStats in the same round trip (see trips.stats). A requested trip has
+# no driver yet, so its driver gains a trip rather than changing one.
+COUNT_CHANGES_SQL = '''
+    , party AS (
+        SELECT rider_id AS user_id, 'rider' AS role, 0 AS trips,
+               from_status, to_status, price, updated_at
+        FROM changed
+        UNION ALL
+        SELECT driver.user_id, 'driver', (from_status = 'requested')::int,
+               NULLIF(from_status, 'requested'), to_status, price, changed.updated_at
+        FROM changed JOIN {drivers} AS driver ON driver.id = changed.driver_id
+    ), delta AS (
+        SELECT user_id, role, sum(trips) AS trips,
+               sum((to_status IN ('requested', 'accepted'))::int
+                   - coalesce((from_status IN ('requested', 'accepted'))::int, 0)) AS open_trips,
+               sum((to_status = 'completed')::int
+                   - coalesce((from_status = 'completed')::int, 0)) AS completed,
+               sum((to_status = 'cancelled')::int
+                   - coalesce((from_status = 'cancelled')::int, 0)) AS cancelled,
+               sum(coalesce(price, 0) * ((to_status = 'completed')::int
+                   - coalesce((from_status = 'completed')::int, 0))) AS amount,
+               max(updated_at) AS updated_at
+        FROM party
+        GROUP BY user_id, role
+    ), counted AS (
+        INSERT INTO {stats} AS stats
+            (user_id, role, trips, open_trips, completed, cancelled, amount, updated_at)
+        SELECT * FROM delta
+        WHERE (trips, open_trips, completed, cancelled, amount) <> (0, 0, 0, 0, 0)
+        ORDER BY role, user_id
+        ON CONFLICT (user_id, role) DO UPDATE SET
+            trips = stats.trips + EXCLUDED.trips,
+            open_trips = stats.open_trips + EXCLUDED.open_trips,
+            completed = stats.completed + EXCLUDED.completed,
+            cancelled = stats.cancelled + EXCLUDED.cancelled,
+            amount = stats.amount + EXCLUDED.amount,
+            updated_at = EXCLUDED.updated_at
+    )
+'''
+
+
+# Appended to the transition statements after COUNT_CHANGES_SQL: the trip
+# event log gets its rows in the same statement (see TripEvent). Its one
+# parameter is the actor's id.
+RECORD_EVENTS_SQL = '''
+    , recorded AS (
+        INSERT INTO {events} ({event_columns})
+        SELECT id, rider_id, driver_id, %s::bigint, from_status, to_status, price,
+               updated_at, txid_current()
+        FROM changed
+    )
+'''
+EVENT_COLUMNS = (
+    'trip_id, rider_id, driver_id, actor_id, from_status, to_status, price, '
+    'occurred_at, transaction_id'
+)
+
+
+def _count_changes_sql():
+    return COUNT_CHANGES_SQL.format(
+        stats=TripStats._meta.db_table,
+        drivers=Trip._meta.get_field('driver').related_model._meta.db_table,
+    )
+
+
+def _record_events_sql():
+    return RECORD_EVENTS_SQL.format(
+        events=TripEvent._meta.db_table, event_columns=EVENT_COLUMNS
+    )
+
+
+class TripQuerySet(models.QuerySet):
+    """Queryset with the hot Trip access paths and status transitions"""
+    
+    def available(self):
+        """Open trips waiting for a driver (served by trip_open_feed_idx)"""
+        return self.filter(status='requested')
+    
+    def nearby(self, lat, lng, radius_km):
+        """
+        Open trips starting within radius_km of (lat, lng), nearest first,
+        annotated with ``distance_km`` (served by trip_open_cell_idx)
+        """
+        cells = Q()
+        for first, last in cell_ranges(lat, lng, radius_km):
+            cells |= Q(origin_cell__range=(first, last))
+        return (
+            self.available()
+            .filter(cells)
+            .annotate(distance_km=distance_km('origin_lat', 'origin_lng', lat, lng))
+            .filter(distance_km__lte=radius_km)
+            .order_by('distance_km', 'id')
+        )
+    
+    def nearest(self, lat, lng, radius_km, limit):
+        """
+        Up to limit open trips within radius_km of (lat, lng), nearest first.
+        
+        Searches a small circle first and doubles it until enough trips are
+        found, so downtown, where every cell is crowded, only the closest
+        cells are read.
+        """
+        search_km = min(NEAREST_START_KM, radius_km)
+        while True:
+            trips = list(self.nearby(lat, lng, search_km)[:limit])
+            if len(trips) >= limit or search_km >= radius_km:
+                return trips
+            search_km = min(search_km * 2, radius_km)
+    
+    def for_rider(self, user):
+        """Trip history of a rider (served by trip_rider_history_idx)"""
+        return self.filter(rider=user)
+    
+    def for_driver(self, driver):
+        """Trip history of a driver or driver id (served by trip_driver_history_idx)"""
+        return self.filter(driver=driver)
+    
+    def search(self, text, rider=None, driver=None, limit=None):
+        """
+        Up to limit (default TRIP_SEARCH_RESULTS) trips of rider, or of
+        driver (a profile or id), having every word of text, best match
+        first, each with a ``rank`` (served by trip_search_idx)
+        """
+        driver_id = getattr(driver, 'pk', driver)
+        if rider is None and driver_id is None:
+            return []
+        if rider is not None:
+            trips, query = self.for_rider(rider), parse_query(text, owner_prefix(rider_id=rider.pk))
+        else:
+            trips = self.for_driver(driver_id)
+            query = parse_query(text, owner_prefix(driver_id=driver_id))
+        if not query:
+            return []
+        ranked = rank_trips(
+            TripSearch._meta.db_table, query, limit or settings.TRIP_SEARCH_RESULTS, using=self.db
+        )
+        if not ranked:
+            return []
+        # created_at lets the lookup skip the months none of the trips are in
+        found = trips.filter(
+            pk__in=[trip_id for trip_id, _, _ in ranked],
+            created_at__in={created_at for _, created_at, _ in ranked},
+        ).in_bulk()
+        results = []
+        for trip_id, _, rank in ranked:
+            if trip_id in found:
+                found[trip_id].rank = rank
+                results.append(found[trip_id])
+        return results
+    
+    def accept(self, pk, driver, actor=None):
+        """Assign a requested trip to driver; return a TripTransition if it won"""
+        return self._transition(
+            pk, ['requested'], 'accepted', driver_id=driver.pk, actor=actor
+        )
+    
+    def complete(self, pk, driver, actor=None):
+        """Complete a trip accepted by driver; return a TripTransition or None"""
+        return self._transition(
+            pk, ['accepted'], 'completed', owner_driver_id=driver.pk, actor=actor
+        )
+    
+    def cancel(self, pk, user, driver=None, actor=None):
+        """Cancel an open trip owned by user (or driven by driver)"""
+        return self._transition(
+            pk, ['requested', 'accepted'], 'cancelled',
+            owner_rider_id=user.pk,
+            owner_driver_id=driver.pk if driver is not None else None,
+            actor=actor or user,
+        )
+    
+    def assign(self, pairs, actor=None):
+        """
+        Accept many (trip id, driver id) pairs in one statement; return the
+        TripTransitions of the pairs that won
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return []
+        trip_ids, driver_ids = zip(*pairs)
+        sql = ASSIGN_SQL.format(
+            table=self.model._meta.db_table,
+            count=_count_changes_sql(),
+            events=_record_events_sql(),
+        )
+        params = [list(trip_ids), list(driver_ids), timezone.now(), actor and actor.pk]
+        with transaction.atomic(using=self.db, savepoint=False):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, params)
+                changes = [TripTransition(*row) for row in cursor.fetchall()]
+            for change in changes:
+                trip_status_changed.send(
+                    sender=self.model, transition=change, actor=actor
+                )
+        return changes
+    
+    def _transition(self, pk, from_statuses, to_status, driver_id=None,
+                    owner_rider_id=None, owner_driver_id=None, actor=None):
+        # One statement: the CTE locks the row only if the status guard still
+        # holds, so concurrent callers race inside Postgres and exactly one
+        # wins, RETURNING hands back what changed without a second read, and
+        # the trip statistics and event log are updated along the way.
+        owners, params = [], [pk, tuple(from_statuses)]
+        if owner_rider_id is not None:
+            owners.append('rider_id = %s')
+            params.append(owner_rider_id)
+        if owner_driver_id is not None:
+            owners.append('driver_id = %s')
+            params.append(owner_driver_id)
+        params += [to_status, timezone.now()]
+        if driver_id is not None:
+            params.append(driver_id)
+        params.append(actor and actor.pk)
+        sql = TRANSITION_SQL.format(
+            table=self.model._meta.db_table,
+            count=_count_changes_sql(),
+            events=_record_events_sql(),
+            owner=f' AND ({" OR ".join(owners)})' if owners else '',
+            assign=', driver_id = %s' if driver_id is not None else '',
+        )
+        with transaction.atomic(using=self.db, savepoint=False):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            change = TripTransition(*row)
+            trip_status_changed.send(
+                sender=self.model, transition=change, actor=actor
+            )
+        return change
+
+
+# The rating is stored only if the trip is completed, was the rider's and
+# has a driver; ON CONFLICT makes a second rating of the same trip a no-op.
+RATE_SQL = '''
+    INSERT INTO {table} (trip_id, driver_id, rider_id, score, comment, created_at)
+    SELECT id, driver_id, rider_id, %s, %s, %s FROM {trip_table}
+    WHERE id = %s AND rider_id = %s AND status = 'completed'
+        AND driver_id IS NOT NULL
+    ON CONFLICT (trip_id) DO NOTHING
+    RETURNING id, trip_id, driver_id, rider_id, score, comment, created_at
+'''
+
+
+class TripRatingQuerySet(models.QuerySet):
+    """Queryset for rider ratings of completed trips"""
+    
+    def rate(self, trip_pk, rider, score, comment=''):
+        """
+        Rate a completed trip of rider's and fold the score into the driver's
+        rating in the same transaction; return the TripRating, or None if the
+        trip cannot be rated (not the rider's, not completed, already rated)
+        """
+        from accounts.models import DriverProfile
+
+        sql = RATE_SQL.format(
+            table=self.model._meta.db_table, trip_table=Trip._meta.db_table
+        )
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(sql, [score, comment, timezone.now(), trip_pk, rider.pk])
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            rating = self.model(
+                **dict(zip(['id', 'trip_id', 'driver_id', 'rider_id', 'score',
+                            'comment', 'created_at'], row))
+            )
+            DriverProfile.objects.using(self.db).record_rating(rating.driver_id, score)
+        return rating
 
 
 class Trip(models.Model):
@@ -16,7 +357,8 @@ class Trip(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
         related_name='trips',
-        verbose_name='Rider'
+        verbose_name='Rider',
+        db_index=False,  # covered by trip_rider_history_idx
     )
     driver = models.ForeignKey(
         'accounts.DriverProfile',
@@ -24,10 +366,28 @@ class Trip(models.Model):
         related_name='driver_trips',
         null=True,
         blank=True,
-        verbose_name='Driver'
+        verbose_name='Driver',
+        db_index=False,  # covered by trip_driver_history_idx
     )
     origin = models.CharField(max_length=255, verbose_name='Origin')
     destination = models.CharField(max_length=255, verbose_name='Destination')
+    origin_lat = models.FloatField(
+        null=True, blank=True, validators=LATITUDE_VALIDATORS,
+        verbose_name='Origin Latitude'
+    )
+    origin_lng = models.FloatField(
+        null=True, blank=True, validators=LONGITUDE_VALIDATORS,
+        verbose_name='Origin Longitude'
+    )
+    origin_cell = models.BigIntegerField(null=True, editable=False)
+    destination_lat = models.FloatField(
+        null=True, blank=True, validators=LATITUDE_VALIDATORS,
+        verbose_name='Destination Latitude'
+    )
+    destination_lng = models.FloatField(
+        null=True, blank=True, validators=LONGITUDE_VALIDATORS,
+        verbose_name='Destination Longitude'
+    )
     status = models.CharField(
         max_length=20,
         choices=STATUS_CHOICES,
@@ -45,14 +405,75 @@ class Trip(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
     
+    objects = TripQuerySet.as_manager()
+    
     class Meta:
         verbose_name = 'Trip'
         verbose_name_plural = 'Trips'
         ordering = ['-created_at']
+        # One index per hot access path; each matches the filter and the
+        # (created_at, id) keyset order so pages are read without a sort.
+        indexes = [
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=Q(status='requested'),
+                name='trip_open_feed_idx',
+            ),
+            models.Index(
+                fields=['rider', '-created_at', '-id'],
+                name='trip_rider_history_idx',
+            ),
+            models.Index(
+                fields=['driver', '-created_at', '-id'],
+                name='trip_driver_history_idx',
+            ),
+            # Also serves the admin status filter: walked in order, filtered
+            models.Index(fields=['-created_at', '-id'], name='trip_created_idx'),
+            # Radius search over open trips, see trips.geo
+            models.Index(
+                fields=['origin_cell'],
+                condition=Q(status='requested'),
+                name='trip_open_cell_idx',
+            ),
+        ]
     
     def __str__(self):
         return f'Trip #{self.id}: {self.origin} -> {self.destination}'
     
+    def save(self, *args, **kwargs):
+        self.origin_cell = grid_cell(self.origin_lat, self.origin_lng)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'origin_lat', 'origin_lng'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'origin_cell'}
+        if update_fields is not None and not STATS_FIELDS & set(update_fields):
+            super().save(*args, **kwargs)
+            return
+        # Direct saves (admin, forms) bypass the transition methods, so lock
+        # and read the previous state for the post_save TripStats receiver
+        # and the event log
+        using = kwargs.get('using') or router.db_for_write(Trip, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            previous = None
+            if not self._state.adding:
+                previous = (
+                    Trip.objects.using(using).select_for_update().filter(pk=self.pk)
+                    .values_list('rider_id', 'driver_id', 'status', 'price').first()
+                )
+                previous = previous and TripState(*previous)
+            created = self._state.adding
+            self._saved_from = previous
+            super().save(*args, **kwargs)
+            if created or (previous is not None and previous.status != self.status):
+                TripEvent.objects.using(using).append(
+                    self, previous.status if previous is not None else ''
+                )
+            if not created and previous is not None and previous.status != self.status:
+                # As the transition methods do, for the live feed and caches
+                trip_status_changed.send(sender=Trip, transition=TripTransition(
+                    self.pk, self.rider_id, self.driver_id, previous.status,
+                    self.status, self.price, self.created_at, self.updated_at,
+                ), actor=None)
+    
     def can_be_edited(self):
         """Check if trip can be edited by rider"""
         return self.status == 'requested'
@@ -67,4 +488,310 @@ class Trip(models.Model):
     
     def can_be_cancelled(self):
         """Check if trip can be cancelled"""
-        return self.status in ['requested', 'accepted']
+        return self.status in ['requested', 'accepted']
+
+
+class TripRating(models.Model):
+    """A rider's rating of a completed trip"""
+    
+    SCORE_CHOICES = [(score, str(score)) for score in range(1, 6)]
+    
+    trip = models.OneToOneField(
+        Trip,
+        on_delete=models.CASCADE,
+        related_name='rating',
+        verbose_name='Trip',
+        # trips_trip is partitioned: its primary key is (id, created_at)
+        db_constraint=False,
+    )
+    driver = models.ForeignKey(
+        'accounts.DriverProfile',
+        on_delete=models.CASCADE,
+        related_name='ratings',
+        verbose_name='Driver',
+        db_index=False,  # covered by trip_rating_driver_idx
+    )
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='trip_ratings',
+        verbose_name='Rider'
+    )
+    score = models.PositiveSmallIntegerField(choices=SCORE_CHOICES, verbose_name='Score')
+    comment = models.TextField(blank=True, verbose_name='Comment')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    
+    objects = TripRatingQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Trip Rating'
+        verbose_name_plural = 'Trip Ratings'
+        ordering = ['-id']
+        indexes = [
+            # A driver's ratings newest first, for the recent window
+            models.Index(fields=['driver', '-id'], name='trip_rating_driver_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                check=Q(score__gte=1, score__lte=5), name='trip_rating_score_range'
+            ),
+        ]
+    
+    def __str__(self):
+        return f'Trip #{self.trip_id}: {self.score}/5'
+
+
+class TripStats(models.Model):
+    """A user's trip totals as a rider or as a driver, kept by trips.stats"""
+    
+    ROLE_CHOICES = [
+        ('rider', 'Rider'),
+        ('driver', 'Driver'),
+    ]
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='trip_stats',
+        verbose_name='User',
+        db_index=False,  # covered by trip_stats_user_role
+    )
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name='Role')
+    trips = models.IntegerField(default=0, verbose_name='Trips')
+    open_trips = models.IntegerField(default=0, verbose_name='Open')
+    completed = models.IntegerField(default=0, verbose_name='Completed')
+    cancelled = models.IntegerField(default=0, verbose_name='Cancelled')
+    # Spent by a rider, earned by a driver, on completed trips
+    amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='Amount'
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+    
+    class Meta:
+        verbose_name = 'Trip Statistics'
+        verbose_name_plural = 'Trip Statistics'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'role'], name='trip_stats_user_role'),
+        ]
+    
+    def __str__(self):
+        return f'{self.user_id} as {self.role}: {self.trips} trips'
+
+
+class TripSearch(models.Model):
+    """
+    The search document of a trip, written by triggers on the trips table
+    whenever the words or the owners of the trip change (see trips.search)
+    """
+    
+    trip = models.OneToOneField(
+        Trip,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Trip',
+        db_constraint=False,
+    )
+    # The trip's, to find its partition and to drop archived months
+    created_at = models.DateTimeField(verbose_name='Created At')
+    document = SearchVectorField(verbose_name='Document')
+    
+    class Meta:
+        verbose_name = 'Trip Search Document'
+        verbose_name_plural = 'Trip Search Documents'
+        indexes = [
+            # No pending list: searches would scan it on every query
+            GinIndex(fields=['document'], fastupdate=False, name='trip_search_idx'),
+        ]
+
+
+APPEND_EVENT_SQL = f'''
+    INSERT INTO {{table}} ({EVENT_COLUMNS})
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, txid_current())
+'''
+
+
+class TripEventQuerySet(models.QuerySet):
+    """Queryset of the trip event log"""
+    
+    def append(self, trip, from_status, actor=None):
+        """Record that trip (as saved) moved from from_status ('' when created)"""
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(APPEND_EVENT_SQL.format(table=self.model._meta.db_table), [
+                trip.pk, trip.rider_id, trip.driver_id, actor and actor.pk,
+                from_status, trip.status, trip.price, trip.updated_at,
+            ])
+
+
+class TripEvent(models.Model):
+    """
+    A trip status change, appended in the transaction that made it: by the
+    transition methods of TripQuerySet in their own statement, by Trip.save()
+    for creation and direct edits. Rows are never updated or deleted (a
+    trigger refuses it) and outlive their trip; read models are built from
+    them by trips.projections.
+    
+    ``transaction_id`` is the writing transaction's txid_current(), which
+    orders the log for projections; rows are written with raw SQL for it.
+    """
+    
+    trip = models.ForeignKey(
+        Trip,
+        on_delete=models.DO_NOTHING,
+        related_name='events',
+        verbose_name='Trip',
+        db_constraint=False,
+        db_index=False,  # covered by trip_event_trip_idx
+    )
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        verbose_name='Rider',
+        db_constraint=False,
+        db_index=False,
+    )
+    driver = models.ForeignKey(
+        'accounts.DriverProfile',
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='Driver',
+        db_constraint=False,
+        db_index=False,
+    )
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        null=True,
+        blank=True,
+        verbose_name='Actor',
+        db_constraint=False,
+        db_index=False,
+    )
+    from_status = models.CharField(
+        max_length=20, choices=Trip.STATUS_CHOICES, blank=True, verbose_name='From'
+    )
+    to_status = models.CharField(max_length=20, choices=Trip.STATUS_CHOICES, verbose_name='To')
+    price = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, verbose_name='Price'
+    )
+    occurred_at = models.DateTimeField(verbose_name='Occurred At')
+    transaction_id = models.BigIntegerField(editable=False, verbose_name='Transaction')
+    
+    objects = TripEventQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Trip Event'
+        verbose_name_plural = 'Trip Events'
+        ordering = ['id']
+        indexes = [
+            # A trip's history, and the request preceding an acceptance
+            models.Index(fields=['trip', 'id'], name='trip_event_trip_idx'),
+            # Projections read the log in (transaction_id, id) order
+            models.Index(fields=['transaction_id', 'id'], name='trip_event_offset_idx'),
+        ]
+    
+    def __str__(self):
+        return f'Trip #{self.trip_id}: {self.from_status or "new"} -> {self.to_status}'
+
+
+class ProjectionOffset(models.Model):
+    """How far a projection of trips.projections has read the event log"""
+    
+    name = models.CharField(max_length=100, unique=True, verbose_name='Projection')
+    transaction_id = models.BigIntegerField(default=0, verbose_name='Transaction')
+    event_id = models.BigIntegerField(default=0, verbose_name='Event')
+    events = models.BigIntegerField(default=0, verbose_name='Events Applied')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+    
+    class Meta:
+        verbose_name = 'Projection Offset'
+        verbose_name_plural = 'Projection Offsets'
+        ordering = ['name']
+    
+    def __str__(self):
+        return f'{self.name} at {self.transaction_id}/{self.event_id}'
+
+
+class WaitTimeBucket(models.Model):
+    """Trips accepted on a day after waiting at least minutes, see trips.projections"""
+    
+    day = models.DateField(verbose_name='Day')
+    minutes = models.PositiveIntegerField(verbose_name='Waited (min)')
+    trips = models.IntegerField(default=0, verbose_name='Trips')
+    
+    class Meta:
+        verbose_name = 'Wait Time Bucket'
+        verbose_name_plural = 'Wait Time Histogram'
+        ordering = ['-day', 'minutes']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'minutes'], name='wait_time_bucket_day_minutes'),
+        ]
+    
+    def __str__(self):
+        return f'{self.day}: {self.trips} trips waited {self.minutes}+ min'
+
+
+class DriverActivity(models.Model):
+    """A driver's trips and earnings of a day, see trips.projections"""
+    
+    driver = models.ForeignKey(
+        'accounts.DriverProfile',
+        on_delete=models.CASCADE,
+        related_name='activity',
+        verbose_name='Driver',
+        db_index=False,  # covered by driver_activity_driver_day
+    )
+    day = models.DateField(verbose_name='Day')
+    accepted = models.IntegerField(default=0, verbose_name='Accepted')
+    completed = models.IntegerField(default=0, verbose_name='Completed')
+    cancelled = models.IntegerField(default=0, verbose_name='Cancelled')
+    earned = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='Earned')
+    
+    class Meta:
+        verbose_name = 'Driver Activity'
+        verbose_name_plural = 'Driver Activity'
+        ordering = ['-day', 'driver']
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'day'], name='driver_activity_driver_day'),
+        ]
+    
+    def __str__(self):
+        return f'{self.driver_id} on {self.day}: {self.completed} completed'
+
+
+class Tariff(models.Model):
+    """
+    Fare rates for the pickup hours from start_hour up to end_hour (local
+    time, wrapping past midnight; equal hours mean all day). Where windows
+    overlap the narrower one applies, see trips.fares.
+    """
+    
+    HOUR_VALIDATORS = [MinValueValidator(0), MaxValueValidator(23)]
+    
+    name = models.CharField(max_length=100, verbose_name='Name')
+    start_hour = models.PositiveSmallIntegerField(
+        default=0, validators=HOUR_VALIDATORS, verbose_name='From Hour'
+    )
+    end_hour = models.PositiveSmallIntegerField(
+        default=0, validators=HOUR_VALIDATORS, verbose_name='To Hour'
+    )
+    base_fare = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Base Fare')
+    per_km = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Per km')
+    per_minute = models.DecimalField(max_digits=8, decimal_places=2, verbose_name='Per Minute')
+    minimum_fare = models.DecimalField(
+        max_digits=8, decimal_places=2, default=0, verbose_name='Minimum Fare'
+    )
+    is_active = models.BooleanField(default=True, verbose_name='Active')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Updated At')
+    
+    class Meta:
+        verbose_name = 'Tariff'
+        verbose_name_plural = 'Tariffs'
+        ordering = ['start_hour', 'name']
+    
+    def __str__(self):
+        return f'{self.name} ({self.start_hour:02d}:00-{self.end_hour:02d}:00)'
@@ -0,0 +1,207 @@
+"""
+Keyset (cursor) pagination for trip lists.
+
+Pages are addressed by the ``(created_at, id)`` of the row they start after,
+so fetching page 500 costs the same index range scan as fetching page 1 and
+no ``COUNT(*)`` is ever issued.
+"""
+import base64
+from datetime import datetime
+
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from taxi_project.api import value
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, position=None):
+    """Encode a direction and optional (created_at, id) position"""
+    raw = direction
+    if position is not None:
+        created_at, pk = position
+        raw = f'{direction}|{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (direction, position); raise ValueError if invalid"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    direction, _, rest = raw.partition('|')
+    if direction not in (NEXT, PREVIOUS):
+        raise ValueError('Unknown cursor direction')
+    if not rest:
+        return direction, None
+    created_at, pk = rest.split('|')
+    return direction, (datetime.fromisoformat(created_at), int(pk))
+
+
+def rows_after(queryset, position=None):
+    """Rows older than position, newest first"""
+    queryset = queryset.order_by('-created_at', '-id')
+    if position is not None:
+        created_at, pk = position
+        # A range on created_at keeps the index usable; the exclude() is a
+        # cheap residual filter breaking ties on id.
+        queryset = queryset.filter(created_at__lte=created_at).exclude(
+            created_at=created_at, id__gte=pk
+        )
+    return queryset
+
+
+def rows_before(queryset, position=None):
+    """Rows newer than position, oldest first"""
+    queryset = queryset.order_by('created_at', 'id')
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(created_at__gte=created_at).exclude(
+            created_at=created_at, id__lte=pk
+        )
+    return queryset
+
+
+class KeysetPage:
+    """Page of results with cursors to its neighbours instead of page numbers"""
+
+    def __init__(self, object_list, next_position=None, previous_position=None):
+        self.object_list = object_list
+        self.next_position = next_position
+        self.previous_position = previous_position
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_position is not None
+
+    def has_previous(self):
+        return self.previous_position is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def next_cursor(self):
+        return encode_cursor(NEXT, self.next_position)
+
+    @property
+    def previous_cursor(self):
+        return encode_cursor(PREVIOUS, self.previous_position)
+
+    @property
+    def last_cursor(self):
+        return encode_cursor(PREVIOUS)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that pages newest-first on ``(created_at, id)``.
+
+    Templates get ``page_obj`` (a KeysetPage) and ``is_paginated`` as with
+    Django's paginator, but navigate with ``?cursor=`` links built from
+    ``page_obj.next_cursor`` / ``previous_cursor`` / ``last_cursor``.
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        try:
+            direction, position = decode_cursor(cursor) if cursor else (NEXT, None)
+        except (ValueError, UnicodeDecodeError):
+            raise Http404('Invalid cursor.')
+
+        if direction == NEXT:
+            page = page_after(queryset, position, page_size)
+        else:
+            page = page_before(queryset, position, page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class KeysetCursorPagination(BasePagination):
+    """
+    REST framework pagination over ``(created_at, id)``, newest first.
+
+    Uses the same ``?cursor=`` tokens and index range scans as
+    KeysetPaginationMixin; responses are ``{next, previous, results}``.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = request.query_params.get(self.cursor_query_param)
+        try:
+            direction, position = decode_cursor(cursor) if cursor else (NEXT, None)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor.')
+
+        page_size = self.get_page_size(request)
+        if direction == NEXT:
+            self.page = page_after(queryset, position, page_size)
+        else:
+            self.page = page_before(queryset, position, page_size)
+        return self.page.object_list
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        return min(max(requested, 1), self.max_page_size)
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.page.next_cursor) if self.page.has_next() else None
+
+    def get_previous_link(self):
+        return self._link(self.page.previous_cursor) if self.page.has_previous() else None
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+def _position(obj):
+    return value(obj, 'created_at'), value(obj, 'id')
+
+
+def page_after(queryset, position, page_size):
+    """The KeysetPage of page_size rows older than position"""
+    rows = list(rows_after(queryset, position)[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_position=_position(rows[-1]) if has_next else None,
+        previous_position=_position(rows[0]) if position is not None and rows else None,
+    )
+
+
+def page_before(queryset, position, page_size):
+    """The KeysetPage of page_size rows newer than position"""
+    rows = list(rows_before(queryset, position)[:page_size + 1])
+    has_previous = len(rows) > page_size
+    rows = rows[:page_size][::-1]
+    # Without a position this is the last (oldest) page: nothing follows it
+    return KeysetPage(
+        rows,
+        next_position=_position(rows[-1]) if position is not None and rows else None,
+        previous_position=_position(rows[0]) if has_previous else None,
+    )
@@ -0,0 +1,176 @@
+"""
+Monthly range partitions of the trips table.
+
+``trips_trip`` is partitioned by ``created_at``, one partition per calendar
+month (in UTC, whatever ``TIME_ZONE`` is) named ``trips_trip_pYYYY_MM``, so queries bounded by creation time
+(recent trips, the admin's date filter) only read the months they cover.
+A ``trips_trip_default`` partition catches rows outside every month; when
+the month is created later those rows are moved into it.
+
+``ensure_partitions()`` keeps ``TRIP_PARTITION_MONTHS_AHEAD`` future months
+in place; it runs after ``migrate`` and from the ``partition_trips``
+command, which should also run from cron. ``archive_partition()`` detaches
+an old month into the ``TRIP_ARCHIVE_SCHEMA`` schema, or drops it.
+"""
+import re
+from collections import namedtuple
+from datetime import date, datetime, time
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import Trip, TripSearch
+
+PARENT = Trip._meta.db_table
+SEARCH_TABLE = TripSearch._meta.db_table
+DEFAULT_PARTITION = f'{PARENT}_default'
+MONTH_RE = re.compile(rf'^{PARENT}_p(\d{{4}})_(\d{{2}})$')
+
+Partition = namedtuple('Partition', ['name', 'month', 'rows'])
+
+
+def month_start(value):
+    """First day of value's month (a date, or an aware datetime's UTC month)"""
+    if isinstance(value, datetime):
+        value = value.astimezone(dt_timezone.utc).date()
+    return value.replace(day=1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{PARENT}_p{month.year:04d}_{month.month:02d}'
+
+
+def _bound(month):
+    # UTC midnight, as in the migration that created the first months
+    return datetime.combine(month, time.min, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned(using='default'):
+    """Whether the trips table is partitioned (its migration has run)"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", [PARENT]
+        )
+        row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def list_partitions(using='default'):
+    """Monthly partitions, oldest first, with estimated row counts"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('''
+            SELECT child.relname, greatest(child.reltuples, 0)::bigint
+            FROM pg_inherits
+            JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = %s::regclass
+        ''', [PARENT])
+        rows = cursor.fetchall()
+    partitions = []
+    for name, estimate in rows:
+        match = MONTH_RE.match(name)
+        if match:
+            month = date(int(match.group(1)), int(match.group(2)), 1)
+            partitions.append(Partition(name, month, estimate))
+    return sorted(partitions, key=lambda partition: partition.month)
+
+
+def create_partition(month, using='default'):
+    """
+    Create the partition for month, moving any of its rows out of the
+    default partition; return False if it already existed
+    """
+    name = partition_name(month)
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    bounds = [_bound(month), _bound(add_months(month, 1))]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Serializes concurrent callers; inserts into other months go on
+        cursor.execute(f'LOCK TABLE {quote(DEFAULT_PARTITION)} IN EXCLUSIVE MODE')
+        cursor.execute('SELECT to_regclass(%s)', [name])
+        if cursor.fetchone()[0] is not None:
+            return False
+        in_month = 'created_at >= %s AND created_at < %s'
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {quote(DEFAULT_PARTITION)} WHERE {in_month})',
+            bounds,
+        )
+        stray = cursor.fetchone()[0]
+        if stray:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE trip_partition_move AS '
+                f'SELECT * FROM {quote(DEFAULT_PARTITION)} WHERE {in_month}', bounds
+            )
+            cursor.execute(f'DELETE FROM {quote(DEFAULT_PARTITION)} WHERE {in_month}', bounds)
+        cursor.execute(
+            f'CREATE TABLE {quote(name)} PARTITION OF {quote(PARENT)} '
+            f'FOR VALUES FROM (%s) TO (%s)', bounds
+        )
+        if stray:
+            cursor.execute(f'INSERT INTO {quote(PARENT)} SELECT * FROM trip_partition_move')
+            cursor.execute('DROP TABLE trip_partition_move')
+    return True
+
+
+def ensure_partitions(start=None, months_ahead=None, using='default'):
+    """
+    Create the monthly partitions from start's month (default: this month)
+    through months_ahead months from now; return the names created
+    """
+    if months_ahead is None:
+        months_ahead = settings.TRIP_PARTITION_MONTHS_AHEAD
+    current = month_start(timezone.now())
+    month = month_start(start) if start is not None else current
+    last = add_months(current, months_ahead)
+    created = []
+    while month <= last:
+        if create_partition(month, using=using):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(partition, drop=False, using='default'):
+    """
+    Detach a monthly partition. It is dropped, or moved to the archive
+    schema with only its primary key index left; compacting it
+    (VACUUM FULL) is up to the caller, outside a transaction.
+    Return the archived table name, or None if dropped.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    schema = settings.TRIP_ARCHIVE_SCHEMA
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f'ALTER TABLE {quote(PARENT)} DETACH PARTITION {quote(partition.name)}'
+        )
+        # Its trips leave without firing the triggers that drop their search documents
+        cursor.execute(
+            f'DELETE FROM {quote(SEARCH_TABLE)} WHERE created_at >= %s AND created_at < %s',
+            [_bound(partition.month), _bound(add_months(partition.month, 1))],
+        )
+        if drop:
+            cursor.execute(f'DROP TABLE {quote(partition.name)}')
+            return None
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {quote(schema)}')
+        cursor.execute('''
+            SELECT index_class.relname FROM pg_index
+            JOIN pg_class AS index_class ON index_class.oid = pg_index.indexrelid
+            WHERE pg_index.indrelid = %s::regclass AND NOT pg_index.indisprimary
+        ''', [partition.name])
+        for (index,) in cursor.fetchall():
+            cursor.execute(f'DROP INDEX {quote(index)}')
+        cursor.execute(f'ALTER TABLE {quote(partition.name)} SET SCHEMA {quote(schema)}')
+    return f'{schema}.{partition.name}'
+
+
+def ensure_partitions_after_migrate(sender, using='default', plan=None, **kwargs):
+    """post_migrate receiver: top up future months once the table is partitioned"""
+    if is_partitioned(using):
+        ensure_partitions(using=using)
@@ -0,0 +1,198 @@
+"""
+Read models built from the trip event log (``TripEvent``).
+
+A ``Projection`` folds a range of events into its tables with one
+set-based statement per range, so catching up on the last few events and
+replaying the whole log run the same SQL, only over ranges of different
+sizes. ``catch_up()`` applies the events appended since the projection's
+``ProjectionOffset`` in batches, each in a transaction with the new offset,
+so a read model never counts an event twice or misses one.
+
+Offsets are ``(transaction_id, id)`` pairs rather than event ids: an id is
+handed out when an event is inserted but the event only becomes visible
+when its transaction commits, possibly after events with higher ids.
+Transactions older than the snapshot's xmin have all ended, so the events
+up to there can no longer change and are the only ones read.
+
+``replay()`` empties a read model and applies the whole log, in batches of
+``TRIP_PROJECTION_REPLAY_BATCH`` events inside one transaction: readers
+keep seeing the old model until the new one is complete.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from accounts.models import DriverProfile
+
+from .models import DriverActivity, ProjectionOffset, TripEvent, WaitTimeBucket
+
+EVENTS = TripEvent._meta.db_table
+
+# The batch after an offset: its last event and its size. Events of
+# transactions still running (at or above xmin) are left for a later call.
+NEXT_BATCH_SQL = f'''
+    SELECT transaction_id, id, count(*) OVER ()
+    FROM (
+        SELECT transaction_id, id FROM {EVENTS}
+        WHERE (transaction_id, id) > (%s, %s)
+            AND transaction_id < txid_snapshot_xmin(txid_current_snapshot())
+        ORDER BY transaction_id, id
+        LIMIT %s
+    ) AS batch
+    ORDER BY transaction_id DESC, id DESC
+    LIMIT 1
+'''
+# Events after the first offset, up to and including the second
+IN_RANGE = (
+    '(event.transaction_id, event.id) > (%s, %s) '
+    'AND (event.transaction_id, event.id) <= (%s, %s)'
+)
+
+Batch = namedtuple('Batch', ['transaction_id', 'event_id', 'events'])
+
+PROJECTIONS = {}
+
+
+def register(cls):
+    """Class decorator: add an instance of a Projection to PROJECTIONS"""
+    PROJECTIONS[cls.name] = cls()
+    return cls
+
+
+class Projection:
+    """A read model maintained from the trip event log"""
+    name = None
+    # Emptied by reset()
+    models = []
+
+    def apply(self, cursor, after, upto):
+        """Fold the events after offset after, up to offset upto, into the read model"""
+        raise NotImplementedError
+
+    def reset(self, cursor):
+        """Empty the read model"""
+        # Not TRUNCATE: readers would wait for the replay instead of seeing the old rows
+        for model in self.models:
+            cursor.execute(f'DELETE FROM {cursor.db.ops.quote_name(model._meta.db_table)}')
+
+
+@register
+class WaitTimeProjection(Projection):
+    """
+    Histogram of how long trips waited for a driver: for each day, the
+    trips accepted after waiting from each WAIT_MINUTES bound up to the next
+    """
+    name = 'wait_times'
+    models = [WaitTimeBucket]
+    WAIT_MINUTES = [0, 1, 2, 3, 5, 10, 15, 30, 60]
+
+    SQL = f'''
+        INSERT INTO {WaitTimeBucket._meta.db_table} AS bucket (day, minutes, trips)
+        SELECT (event.occurred_at AT TIME ZONE %s)::date, bound.minutes, count(*)
+        FROM {EVENTS} AS event
+        CROSS JOIN LATERAL (
+            SELECT requested.occurred_at FROM {EVENTS} AS requested
+            WHERE requested.trip_id = event.trip_id AND requested.id < event.id
+                AND requested.to_status = 'requested'
+            ORDER BY requested.id DESC
+            LIMIT 1
+        ) AS requested
+        CROSS JOIN LATERAL (
+            SELECT coalesce(max(minutes), 0) AS minutes FROM unnest(%s::int[]) AS minutes
+            WHERE minutes * 60 <= extract(epoch FROM event.occurred_at - requested.occurred_at)
+        ) AS bound
+        WHERE event.to_status = 'accepted' AND {IN_RANGE}
+        GROUP BY 1, 2
+        ON CONFLICT (day, minutes) DO UPDATE SET trips = bucket.trips + EXCLUDED.trips
+    '''
+
+    def apply(self, cursor, after, upto):
+        cursor.execute(self.SQL, [settings.TIME_ZONE, self.WAIT_MINUTES, *after, *upto])
+
+
+@register
+class DriverActivityProjection(Projection):
+    """Per driver and day: trips accepted, completed and cancelled, and earnings"""
+    name = 'driver_activity'
+    models = [DriverActivity]
+
+    # Drivers deleted since have nothing left to count for
+    SQL = f'''
+        INSERT INTO {DriverActivity._meta.db_table} AS activity
+            (driver_id, day, accepted, completed, cancelled, earned)
+        SELECT event.driver_id, (event.occurred_at AT TIME ZONE %s)::date,
+               count(*) FILTER (WHERE event.to_status = 'accepted'),
+               count(*) FILTER (WHERE event.to_status = 'completed'),
+               count(*) FILTER (WHERE event.to_status = 'cancelled'),
+               coalesce(sum(event.price) FILTER (WHERE event.to_status = 'completed'), 0)
+        FROM {EVENTS} AS event
+        JOIN {DriverProfile._meta.db_table} AS driver ON driver.id = event.driver_id
+        WHERE event.to_status IN ('accepted', 'completed', 'cancelled') AND {IN_RANGE}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (driver_id, day) DO UPDATE SET
+            accepted = activity.accepted + EXCLUDED.accepted,
+            completed = activity.completed + EXCLUDED.completed,
+            cancelled = activity.cancelled + EXCLUDED.cancelled,
+            earned = activity.earned + EXCLUDED.earned
+    '''
+
+    def apply(self, cursor, after, upto):
+        cursor.execute(self.SQL, [settings.TIME_ZONE, *after, *upto])
+
+
+def _locked_offset(name, using):
+    """The projection's offset row, locked until the transaction ends"""
+    ProjectionOffset.objects.using(using).get_or_create(name=name)
+    return ProjectionOffset.objects.using(using).select_for_update().get(name=name)
+
+
+def _apply_batches(projection, offset, batch_size, using, max_batches=None):
+    """Apply batches after offset, to the end of the log or max_batches; return the events applied"""
+    applied = batches = 0
+    with connections[using].cursor() as cursor:
+        while max_batches is None or batches < max_batches:
+            cursor.execute(NEXT_BATCH_SQL, [offset.transaction_id, offset.event_id, batch_size])
+            row = cursor.fetchone()
+            if row is None:
+                break
+            batch = Batch(*row)
+            projection.apply(
+                cursor,
+                (offset.transaction_id, offset.event_id),
+                (batch.transaction_id, batch.event_id),
+            )
+            offset.transaction_id, offset.event_id = batch.transaction_id, batch.event_id
+            offset.events += batch.events
+            applied += batch.events
+            batches += 1
+    if applied:
+        offset.save(using=using)
+    return applied
+
+
+def catch_up(projection, batch_size=None, using='default'):
+    """Apply the events appended since projection last ran; return how many"""
+    batch_size = batch_size or settings.TRIP_PROJECTION_BATCH
+    applied = 0
+    while True:
+        # A transaction per batch keeps locks short on a long backlog
+        with transaction.atomic(using=using):
+            offset = _locked_offset(projection.name, using)
+            count = _apply_batches(projection, offset, batch_size, using, max_batches=1)
+        if not count:
+            return applied
+        applied += count
+
+
+def replay(projection, batch_size=None, using='default'):
+    """Rebuild projection from the start of the log; return the events applied"""
+    batch_size = batch_size or settings.TRIP_PROJECTION_REPLAY_BATCH
+    with transaction.atomic(using=using):
+        offset = _locked_offset(projection.name, using)
+        with connections[using].cursor() as cursor:
+            projection.reset(cursor)
+        offset.transaction_id = offset.event_id = offset.events = 0
+        offset.save(using=using)
+        return _apply_batches(projection, offset, batch_size, using)
@@ -0,0 +1,109 @@
+"""
+The hot Trip queries, built exactly as the views and admin issue them, and
+EXPLAIN checks asserting each one is answered by its index without a sort.
+"""
+import re
+
+from django.db import connection
+
+from .models import Trip
+from .pagination import rows_after, rows_before
+
+PAGE_SIZE = 10
+ADMIN_PAGE_SIZE = 100
+NEARBY_RESULTS = 50
+NEARBY_RADIUS_KM = 5
+
+# Paths ordered by a computed value: sorting the few index candidates is fine
+SORTED_PATHS = {'nearby_trips'}
+# A Sort node; a Merge Append's "Sort Key" merges presorted index scans
+SORT_NODE_RE = re.compile(r'^(Incremental )?Sort\s+\(')
+
+
+def access_paths(rider, driver, position=None, point=None):
+    """
+    Return {name: (queryset, expected index)} for every hot Trip query.
+
+    With a (created_at, id) position the keyset pages after and before it
+    are included too, since deep pages must use the same index; with a
+    (lat, lng) point so is the drivers' radius search.
+    """
+    history = Trip.objects.select_related('rider', 'driver__user')
+    bases = {
+        'available_trips': (Trip.objects.available(), 'trip_open_feed_idx'),
+        'rider_history': (history.for_rider(rider), 'trip_rider_history_idx'),
+        'driver_history': (history.for_driver(driver), 'trip_driver_history_idx'),
+    }
+    paths = {}
+    for name, (queryset, index) in bases.items():
+        paths[name] = (rows_after(queryset)[:PAGE_SIZE + 1], index)
+        if position is not None:
+            paths[f'{name}_next_page'] = (
+                rows_after(queryset, position)[:PAGE_SIZE + 1], index
+            )
+            paths[f'{name}_previous_page'] = (
+                rows_before(queryset, position)[:PAGE_SIZE + 1], index
+            )
+    # TripAdmin changelist: Meta.ordering plus the '-pk' tie-breaker it adds
+    admin = Trip.objects.select_related('rider', 'driver', 'driver__user')
+    paths['admin_changelist'] = (
+        admin.order_by('-created_at', '-id')[:ADMIN_PAGE_SIZE], 'trip_created_idx'
+    )
+    paths['admin_status_filter'] = (
+        admin.filter(status='completed').order_by('-created_at', '-id')[:ADMIN_PAGE_SIZE],
+        'trip_created_idx',
+    )
+    if point is not None:
+        paths['nearby_trips'] = (
+            Trip.objects.nearby(*point, NEARBY_RADIUS_KM)[:NEARBY_RESULTS],
+            'trip_open_cell_idx',
+        )
+    return paths
+
+
+def partition_indexes(index):
+    """The index and the per-partition indexes attached to it"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT inhrelid::regclass::text FROM pg_inherits '
+            'WHERE inhparent = to_regclass(%s)', [index]
+        )
+        return [index] + [name for (name,) in cursor.fetchall()]
+
+
+def empty_partitions():
+    """Trip partitions the planner estimates to hold no rows"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT inhrelid::regclass::text FROM pg_inherits '
+            'JOIN pg_class ON pg_class.oid = pg_inherits.inhrelid '
+            'WHERE inhparent = to_regclass(%s) AND pg_class.reltuples <= 0', [Trip._meta.db_table]
+        )
+        return {name for (name,) in cursor.fetchall()}
+
+
+def plan_problems(plan, index, allow_sort=False):
+    """Return a list of reasons why plan does not read trips via index"""
+    problems = []
+    # Partitions are scanned under their own names; reading the empty
+    # future months sequentially costs nothing
+    empty = empty_partitions()
+    scanned = re.findall(r'Seq Scan on (\w+)', plan)
+    if any(name.startswith('trips_trip') and name not in empty for name in scanned):
+        problems.append('sequential scan on trips_trip')
+    nodes = [line.strip().lstrip('-> ') for line in plan.splitlines()]
+    if not allow_sort and any(SORT_NODE_RE.match(node) for node in nodes):
+        problems.append('explicit sort')
+    names = partition_indexes(index)
+    if not any(re.search(rf'\b{re.escape(name)}\b', plan) for name in names):
+        problems.append(f'{index} not used')
+    return problems
+
+
+def check_access_paths(rider, driver, position=None, point=None):
+    """EXPLAIN every access path; return {name: (plan, problems)}"""
+    results = {}
+    for name, (queryset, index) in access_paths(rider, driver, position, point).items():
+        plan = queryset.explain()
+        results[name] = (plan, plan_problems(plan, index, name in SORTED_PATHS))
+    return results
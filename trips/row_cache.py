@@ -0,0 +1,72 @@
+"""
+Cache of rendered trip-list rows.
+
+Each row of ``trips/trip_list.html`` is rendered once per (trip, viewer
+role) and kept in the default cache under ``trip-row:<id>:<role>`` together
+with the version it was rendered from: the trip's ``updated_at`` and the
+email it shows. A page fetches all its rows with one ``get_many()`` and
+renders only those missing or out of date, so a long history of completed
+trips costs a cache read per page instead of template work per row.
+
+Saves, deletions and status transitions delete the trip's rows once their
+transaction commits; the version check covers writes that bypass them.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import get_template
+
+from .models import Trip
+from .signals import trip_status_changed
+
+ROW_TEMPLATE = 'trips/trip_list_row.html'
+ROLES = ('rider', 'driver')
+
+
+def row_key(trip_id, role):
+    return f'trip-row:{trip_id}:{role}'
+
+
+def _version(trip, role):
+    if role == 'driver':
+        shown = trip.rider.email
+    else:
+        shown = trip.driver.user.email if trip.driver_id is not None else None
+    return trip.updated_at.isoformat(), shown
+
+
+def render_rows(trips, role):
+    """The rendered rows of trips as seen by role, from the cache where current"""
+    keys = [row_key(trip.pk, role) for trip in trips]
+    cached = cache.get_many(keys)
+    template = get_template(ROW_TEMPLATE)
+    rows, rendered = [], {}
+    for trip, key in zip(trips, keys):
+        version = _version(trip, role)
+        entry = cached.get(key)
+        if entry is None or entry[0] != version:
+            html = template.render({'trip': trip, 'viewer_is_driver': role == 'driver'})
+            entry = rendered[key] = (version, html)
+        rows.append(entry[1])
+    if rendered:
+        cache.set_many(rendered, settings.TRIP_ROW_CACHE_TIMEOUT)
+    return rows
+
+
+def invalidate(trip_ids):
+    """Drop the cached rows of trip_ids once the current transaction commits"""
+    keys = [row_key(trip_id, role) for trip_id in trip_ids for role in ROLES]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def invalidate_trip(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+@receiver(trip_status_changed)
+def invalidate_transition(sender, transition, **kwargs):
+    invalidate([transition.trip_id])
@@ -0,0 +1,51 @@
+"""
+Full-text search over a rider's or driver's own trips.
+
+Each trip has a ``TripSearch`` row: a ``tsvector`` of its origin (weight
+A), destination (B) and comment (C) words, written by triggers on
+``trips_trip`` whenever those change (migration 0010). Every word is in it
+twice, qualified by the rider (``#r42:airport``) and by the driver
+(``#d7:airport``), and a search asks for the user's qualified words: the
+posting lists read hold that user's trips only, so a search costs the
+same whether "airport" appears in ten trips or in a million.
+
+The documents are kept out of the monthly trip partitions so that one
+index answers a search instead of one per month. Words are matched whole:
+a prefix (``airp:*``) would read every lexeme starting with it.
+"""
+import re
+
+from django.db import connections
+
+# Words of the query; anything else is a separator, so users cannot write
+# tsquery operators or quotes
+WORD_RE = re.compile(r'\w+')
+MAX_WORDS = 8
+
+RANKED_SQL = '''
+    SELECT trip_id, created_at, ts_rank(document, %s::tsquery) AS rank
+    FROM {table}
+    WHERE document @@ %s::tsquery
+    ORDER BY rank DESC, created_at DESC, trip_id DESC
+    LIMIT %s
+'''
+
+
+def owner_prefix(rider_id=None, driver_id=None):
+    """Prefix of the words of the trips of a rider or a driver"""
+    if (rider_id is None) == (driver_id is None):
+        raise ValueError('Search the trips of either a rider or a driver')
+    return f'#r{rider_id}:' if driver_id is None else f'#d{driver_id}:'
+
+
+def parse_query(text, prefix):
+    """tsquery of the trips having every word of text; '' if there are none"""
+    words = WORD_RE.findall(text.lower())[:MAX_WORDS]
+    return ' & '.join(f"'{prefix}{word}'" for word in words)
+
+
+def rank_trips(table, query, limit, using='default'):
+    """(trip_id, created_at, rank) of the best limit matches of query"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(RANKED_SQL.format(table=table), [query, query, limit])
+        return cursor.fetchall()
@@ -0,0 +1,26 @@
+from rest_framework import serializers
+
+from taxi_project.api import ValuesSerializer
+
+from .models import Trip
+
+
+class TripSerializer(ValuesSerializer):
+    """A trip row of TripViewSet; rider and driver are ids"""
+
+    id = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Trip.STATUS_CHOICES)
+    origin = serializers.CharField()
+    destination = serializers.CharField()
+    origin_lat = serializers.FloatField()
+    origin_lng = serializers.FloatField()
+    destination_lat = serializers.FloatField()
+    destination_lng = serializers.FloatField()
+    comment = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    rider = serializers.IntegerField()
+    rider_name = serializers.CharField()
+    driver = serializers.IntegerField()
+    driver_name = serializers.CharField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
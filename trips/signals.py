@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent inside the transaction that changed a trip's status, with
+# ``transition`` (a TripTransition) and ``actor`` (the user or None).
+trip_status_changed = Signal()
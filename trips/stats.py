@@ -0,0 +1,158 @@
+"""
+Per-user trip statistics kept up to date as trips change.
+
+Every trip contributes one row's worth of counts (trips, open, completed,
+cancelled, amount) to its rider and, once assigned, to its driver. A change
+of status, driver or price turns into the difference between the old and
+the new contribution, applied with one upsert in the transaction that made
+the change: the status transitions carry it in their own statement (see
+``COUNT_CHANGES_SQL`` in trips.models), direct saves and deletes go through
+the receivers below. Profile pages then read a single row instead of
+aggregating over every trip.
+
+``QuerySet.update()`` and raw SQL on trips bypass this; ``rebuild()``
+(the ``rebuild_trip_stats`` command) recomputes the table from scratch.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.models import DriverProfile
+
+from .models import Trip, TripState, TripStats
+
+OPEN_STATUSES = ('requested', 'accepted')
+COUNTERS = ['trips', 'open_trips', 'completed', 'cancelled', 'amount']
+
+# Driver deltas are keyed by driver profile and resolved to the user here;
+# a driver whose profile is gone has nobody left to count for.
+UPSERT_SQL = '''
+    INSERT INTO {stats} (user_id, role, {counters}, updated_at)
+    SELECT coalesce(driver.user_id, delta.user_id), delta.role, {delta_counters}, %s
+    FROM (VALUES {values}) AS delta(role, user_id, driver_id, {counters})
+    LEFT JOIN {drivers} AS driver ON driver.id = delta.driver_id
+    WHERE delta.role = 'rider' OR driver.user_id IS NOT NULL
+    ON CONFLICT (user_id, role) DO UPDATE SET {increments}, updated_at = EXCLUDED.updated_at
+'''
+# Deletes only adjust existing rows: when a user is deleted their trips
+# cascade too, and their own stats rows may already be gone.
+UPDATE_SQL = '''
+    UPDATE {stats} AS stats SET {increments}, updated_at = %s
+    FROM (VALUES {values}) AS delta(role, user_id, driver_id, {counters})
+    LEFT JOIN {drivers} AS driver ON driver.id = delta.driver_id
+    WHERE stats.user_id = coalesce(driver.user_id, delta.user_id) AND stats.role = delta.role
+'''
+VALUES_ROW = '(%s, %s::bigint, %s::bigint, %s::int, %s::int, %s::int, %s::int, %s::numeric)'
+
+REBUILD_SQL = '''
+    INSERT INTO {stats} (user_id, role, {counters}, updated_at)
+    SELECT user_id, role, count(*),
+           count(*) FILTER (WHERE status IN ('requested', 'accepted')),
+           count(*) FILTER (WHERE status = 'completed'),
+           count(*) FILTER (WHERE status = 'cancelled'),
+           coalesce(sum(price) FILTER (WHERE status = 'completed'), 0),
+           %s
+    FROM (
+        SELECT rider_id AS user_id, 'rider' AS role, status, price FROM {trips}
+        UNION ALL
+        SELECT driver.user_id, 'driver', trip.status, trip.price
+        FROM {trips} AS trip JOIN {drivers} AS driver ON driver.id = trip.driver_id
+    ) AS party
+    GROUP BY user_id, role
+'''
+
+
+def _contribution(state):
+    if state is None:
+        return {}
+    completed = state.status == 'completed'
+    counts = (
+        1,
+        int(state.status in OPEN_STATUSES),
+        int(completed),
+        int(state.status == 'cancelled'),
+        state.price if completed and state.price is not None else Decimal(0),
+    )
+    parties = {('rider', state.rider_id): counts}
+    if state.driver_id is not None:
+        parties[('driver', state.driver_id)] = counts
+    return parties
+
+
+def record_change(old, new, using='default'):
+    """Apply the difference between two TripStates (None: no trip) to TripStats"""
+    deltas = defaultdict(lambda: [0, 0, 0, 0, Decimal(0)])
+    for sign, state in ((1, new), (-1, old)):
+        for party, counts in _contribution(state).items():
+            delta = deltas[party]
+            for i, count in enumerate(counts):
+                delta[i] += sign * count
+    # Sorted so concurrent changes lock the stats rows in the same order
+    rows = [(party, delta) for party, delta in sorted(deltas.items()) if any(delta)]
+    if not rows:
+        return
+
+    params = []
+    for (role, pk), delta in rows:
+        params += [role, pk if role == 'rider' else None, pk if role == 'driver' else None]
+        params += delta
+    table = TripStats._meta.db_table
+    if new is None:
+        sql = UPDATE_SQL.format(
+            stats=table,
+            drivers=DriverProfile._meta.db_table,
+            counters=', '.join(COUNTERS),
+            values=', '.join([VALUES_ROW] * len(rows)),
+            increments=', '.join(f'{name} = stats.{name} + delta.{name}' for name in COUNTERS),
+        )
+    else:
+        sql = UPSERT_SQL.format(
+            stats=table,
+            drivers=DriverProfile._meta.db_table,
+            counters=', '.join(COUNTERS),
+            delta_counters=', '.join(f'delta.{name}' for name in COUNTERS),
+            values=', '.join([VALUES_ROW] * len(rows)),
+            increments=', '.join(
+                f'{name} = {table}.{name} + EXCLUDED.{name}' for name in COUNTERS
+            ),
+        )
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [timezone.now(), *params])
+
+
+def rebuild(using='default'):
+    """Recompute all of TripStats from the trips; return the number of rows"""
+    table = TripStats._meta.db_table
+    sql = REBUILD_SQL.format(
+        stats=table,
+        trips=Trip._meta.db_table,
+        drivers=DriverProfile._meta.db_table,
+        counters=', '.join(COUNTERS),
+    )
+    with transaction.atomic(using=using), connections[using].cursor() as cursor:
+        # Waits for transactions that already applied a delta and holds off
+        # new ones, which then apply theirs on top of the rebuilt rows
+        cursor.execute(f'LOCK TABLE {table} IN EXCLUSIVE MODE')
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(sql, [timezone.now()])
+        return cursor.rowcount
+
+
+@receiver(post_save, sender=Trip)
+def count_saved_trip(sender, instance, created, raw, using, **kwargs):
+    # Set by Trip.save() unless the saved fields cannot change the counts
+    if raw or '_saved_from' not in vars(instance):
+        return
+    old = vars(instance).pop('_saved_from')
+    new = TripState(instance.rider_id, instance.driver_id, instance.status, instance.price)
+    record_change(None if created else old, new, using=using)
+
+
+@receiver(post_delete, sender=Trip)
+def count_deleted_trip(sender, instance, using, **kwargs):
+    old = TripState(instance.rider_id, instance.driver_id, instance.status, instance.price)
+    record_change(old, None, using=using)
@@ -0,0 +1,13 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from trips.row_cache import render_rows
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def trip_rows(context, trips):
+    """The table rows of trips for the current user, cached per trip and role"""
+    role = 'driver' if context['user'].is_driver() else 'rider'
+    return mark_safe(''.join(render_rows(trips, role)))
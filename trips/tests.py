@@ -1,9 +1,71 @@
-﻿from django.test import TestCase
+﻿import asyncio
+import csv
+import json
+import math
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
 from accounts.models import DriverProfile, User
+from taxi_project.admin import EstimatedCountPaginator
+from taxi_project.asgi import StreamDisconnectMiddleware
+from taxi_project.testing import QueryBudgetMixin
+
+from . import addresses, fares, geocoding, partitions, projections
+from .dispatch import DispatchWeights, dispatch_once, solve
+from .export import aiter_chunks
+from .geo import cell_ranges, grid_cell, haversine_km
+from .live import LocalBroadcaster, PostgresBroadcaster, trip_card
+from .models import (
+    DriverActivity,
+    ProjectionOffset,
+    Tariff,
+    Trip,
+    TripEvent,
+    TripRating,
+    TripSearch,
+    TripStats,
+    WaitTimeBucket,
+)
+from .query_plans import check_access_paths
+from .row_cache import row_key
+from .signals import trip_status_changed
+from .stats import rebuild as rebuild_trip_stats
+
+
+class FakeGeocoder:
+    """Places the addresses the tests use, A and B a few km apart"""
 
-from .models import Trip
+    points = {'A': (40.70, -74.0), 'B': (40.75, -73.95), 'C': (40.80, -73.90)}
+
+    def geocode(self, address):
+        return self.points.get(address)
+
+
+class FailingGeocoder:
+    def geocode(self, address):
+        raise geocoding.GeocodingError('unreachable')
 
 
 class TripModelTest(TestCase):
@@ -68,8 +130,10 @@ class TripModelTest(TestCase):
         self.assertEqual(trip.driver, self.driver_profile)
 
 
+@override_settings(TRIP_GEOCODER='trips.tests.FakeGeocoder')
 class TripViewsTest(TestCase):
     def setUp(self):
+        cache.clear()
         self.rider = User.objects.create_user(
             username='rider1',
             email='rider@test.com',
@@ -92,3 +156,1960 @@ class TripViewsTest(TestCase):
         trip = Trip.objects.first()
         self.assertEqual(trip.origin, '123 Main St')
         self.assertEqual(trip.rider, self.rider)
+
+
+class TripTransitionTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.trip = Trip.objects.create(
+            rider=self.rider,
+            origin='123 Main St',
+            destination='456 Oak Ave'
+        )
+
+    def test_accept_only_once(self):
+        self.assertTrue(Trip.objects.accept(self.trip.pk, self.driver_profile))
+        self.assertFalse(Trip.objects.accept(self.trip.pk, self.driver_profile))
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.status, 'accepted')
+        self.assertEqual(self.trip.driver, self.driver_profile)
+
+    def test_accept_is_single_update(self):
+        with self.assertNumQueries(1):
+            Trip.objects.accept(self.trip.pk, self.driver_profile)
+
+    def test_transition_reports_change(self):
+        change = Trip.objects.accept(self.trip.pk, self.driver_profile)
+        self.assertEqual(change.trip_id, self.trip.pk)
+        self.assertEqual(change.rider_id, self.rider.pk)
+        self.assertEqual(change.driver_id, self.driver_profile.pk)
+        self.assertEqual((change.from_status, change.to_status), ('requested', 'accepted'))
+        change = Trip.objects.cancel(self.trip.pk, self.rider)
+        self.assertEqual((change.from_status, change.to_status), ('accepted', 'cancelled'))
+
+    def test_transition_sends_signal(self):
+        received = []
+
+        def handler(sender, transition, actor, **kwargs):
+            received.append((transition.to_status, actor))
+
+        trip_status_changed.connect(handler)
+        self.addCleanup(trip_status_changed.disconnect, handler)
+        Trip.objects.accept(self.trip.pk, self.driver_profile, actor=self.driver_user)
+        Trip.objects.accept(self.trip.pk, self.driver_profile)
+        self.assertEqual(received, [('accepted', self.driver_user)])
+
+    def test_complete_requires_assigned_driver(self):
+        self.assertFalse(Trip.objects.complete(self.trip.pk, self.driver_profile))
+        Trip.objects.accept(self.trip.pk, self.driver_profile)
+        self.assertTrue(Trip.objects.complete(self.trip.pk, self.driver_profile))
+        self.assertFalse(Trip.objects.cancel(self.trip.pk, self.rider))
+
+    def test_cancel_by_rider(self):
+        other = User.objects.create_user(
+            username='other', email='other@test.com', password='testpass123'
+        )
+        self.assertFalse(Trip.objects.cancel(self.trip.pk, other))
+        self.assertTrue(Trip.objects.cancel(self.trip.pk, self.rider))
+        self.trip.refresh_from_db()
+        self.assertEqual(self.trip.status, 'cancelled')
+
+    def test_accept_view(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:accept_trip', args=[self.trip.pk]))
+        self.assertRedirects(response, reverse('trips:trip_detail', args=[self.trip.pk]))
+        response = self.client.get(reverse('trips:accept_trip', args=[self.trip.pk]))
+        self.assertRedirects(response, reverse('trips:available_trips'))
+        response = self.client.get(reverse('trips:accept_trip', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_complete_view_permission(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:complete_trip', args=[self.trip.pk]))
+        self.assertRedirects(response, reverse('trips:trip_list'))
+
+
+class TripAcceptRaceTest(TransactionTestCase):
+    def test_exactly_one_driver_wins(self):
+        rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        drivers = []
+        for i in range(8):
+            user = User.objects.create_user(
+                username=f'driver{i}',
+                email=f'driver{i}@test.com',
+                password='testpass123',
+                role='driver'
+            )
+            drivers.append(DriverProfile.objects.create(
+                user=user,
+                license_number=f'DL{i}',
+                car_number=f'CAR-{i}',
+                car_model='Toyota Camry'
+            ))
+        trip = Trip.objects.create(rider=rider, origin='A', destination='B')
+        barrier = threading.Barrier(len(drivers))
+        results = []
+
+        def accept(driver):
+            try:
+                barrier.wait()
+                results.append(Trip.objects.accept(trip.pk, driver))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=accept, args=(d,)) for d in drivers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len([won for won in results if won]), 1)
+        trip.refresh_from_db()
+        self.assertEqual(trip.status, 'accepted')
+
+
+class TripQueryBudgetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.add_trips()
+
+    def add_trips(self, count=5):
+        for i in range(count):
+            Trip.objects.create(
+                rider=self.rider,
+                driver=self.driver_profile if i % 2 else None,
+                origin=f'{i} Main St',
+                destination=f'{i} Oak Ave',
+                status='accepted' if i % 2 else 'requested'
+            )
+
+    def test_rider_trip_list(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.assertPageQueryBudget(reverse('trips:trip_list'), 3, self.add_trips)
+
+    def test_driver_trip_list(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        self.assertPageQueryBudget(reverse('trips:trip_list'), 4, self.add_trips)
+
+    def test_available_trips(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        # One more for the conditional GET validators
+        self.assertPageQueryBudget(
+            reverse('trips:available_trips'), 4, self.add_trips
+        )
+
+    def test_trip_detail(self):
+        trip = Trip.objects.filter(driver__isnull=False).first()
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.assertPageQueryBudget(
+            reverse('trips:trip_detail', args=[trip.pk]), 4, self.add_trips
+        )
+
+    def test_trip_update(self):
+        trip = Trip.objects.filter(status='requested').first()
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.assertPageQueryBudget(
+            reverse('trips:trip_update', args=[trip.pk]), 3, self.add_trips
+        )
+
+
+class TripPaginationTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        created_at = timezone.now()
+        for i in range(25):
+            trip = Trip.objects.create(
+                rider=self.rider, origin=f'{i} Main St', destination='Oak Ave'
+            )
+            # Pairs of trips share a timestamp to exercise the id tie-breaker
+            Trip.objects.filter(pk=trip.pk).update(
+                created_at=created_at - timedelta(minutes=i // 2)
+            )
+        self.expected = list(
+            Trip.objects.order_by('-created_at', '-id').values_list('pk', flat=True)
+        )
+        self.client.login(username='rider@test.com', password='testpass123')
+
+    def page_ids(self, response):
+        return [trip.pk for trip in response.context['trips']]
+
+    def test_walk_forward_and_back(self):
+        url = reverse('trips:trip_list')
+        response = self.client.get(url)
+        pages = [self.page_ids(response)]
+        self.assertFalse(response.context['page_obj'].has_previous())
+        while response.context['page_obj'].has_next():
+            response = self.client.get(
+                url, {'cursor': response.context['page_obj'].next_cursor}
+            )
+            pages.append(self.page_ids(response))
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+
+        response = self.client.get(
+            url, {'cursor': response.context['page_obj'].previous_cursor}
+        )
+        self.assertEqual(self.page_ids(response), pages[1])
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_last_page(self):
+        url = reverse('trips:trip_list')
+        response = self.client.get(url)
+        response = self.client.get(
+            url, {'cursor': response.context['page_obj'].last_cursor}
+        )
+        page_obj = response.context['page_obj']
+        self.assertEqual(self.page_ids(response), self.expected[-10:])
+        self.assertFalse(page_obj.has_next())
+        self.assertTrue(page_obj.has_previous())
+
+    def test_no_count_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('trips:trip_list'))
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in context.captured_queries)
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('trips:trip_list'), {'cursor': '!!'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TripAccessPathTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        for i in range(30):
+            Trip.objects.create(
+                rider=self.rider,
+                driver=self.driver_profile if i % 3 else None,
+                origin=f'{i} Main St',
+                destination='Oak Ave',
+                status='completed' if i % 3 else 'requested'
+            )
+        # Other riders and drivers, so that with real statistics the history
+        # filters are as selective as they are in production
+        others = User.objects.bulk_create([
+            User(username=f'other{i}', email=f'other{i}@test.com', role='driver')
+            for i in range(20)
+        ])
+        other_drivers = DriverProfile.objects.bulk_create([
+            DriverProfile(user=user, license_number=f'DL-O{i}',
+                          car_number=f'O-{i}', car_model='Other')
+            for i, user in enumerate(others)
+        ])
+        Trip.objects.bulk_create([
+            Trip(rider=others[i % 20], driver=other_drivers[i % 20],
+                 origin=f'{i} Side St', destination='Elm St', status='completed')
+            for i in range(2000)
+        ] + [
+            Trip(rider=others[i % 20], origin=f'{i} Open St', destination='Elm St',
+                 origin_lat=40 + i % 100 / 50, origin_lng=-74 + i // 100 / 50,
+                 origin_cell=grid_cell(40 + i % 100 / 50, -74 + i // 100 / 50))
+            for i in range(2000)
+        ])
+
+    def test_every_access_path_has_an_ordered_index(self):
+        # The table is tiny, so make the planner show which index it would
+        # use at scale instead of choosing a sequential scan.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            # Likewise for sorting a handful of rows gathered from several
+            # partitions; without an ordered index the Sort still shows up
+            cursor.execute('SET LOCAL enable_sort = off')
+            # Statistics left behind by other tests must not sway the plans
+            cursor.execute('ANALYZE accounts_user, accounts_driverprofile, trips_trip')
+        trip = Trip.objects.order_by('-created_at')[15]
+        results = check_access_paths(
+            self.rider, self.driver_profile, (trip.created_at, trip.pk), (40.7, -74.0)
+        )
+        for name, (plan, problems) in results.items():
+            self.assertEqual(problems, [], f'{name}:\n{plan}')
+
+
+class RecordingBroadcaster:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, frame):
+        self.published.append((channel, frame.split('\n', 1)[0]))
+
+
+class LiveFeedTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.broadcaster = RecordingBroadcaster()
+        patcher = mock.patch('trips.live.get_broadcaster', return_value=self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_events_published_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        self.assertEqual(self.broadcaster.published, [('drivers', 'event: trip_created')])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Trip.objects.accept(trip.pk, self.driver_profile)
+        self.assertEqual(self.broadcaster.published[1:], [
+            ('drivers', 'event: trip_removed'),
+            (f'trip-{trip.pk}', 'event: trip_status'),
+        ])
+
+    def test_direct_status_saves_are_published(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        with self.captureOnCommitCallbacks(execute=True):
+            trip.status = 'cancelled'
+            trip.save()
+        self.assertEqual(self.broadcaster.published, [
+            ('drivers', 'event: trip_removed'),
+            (f'trip-{trip.pk}', 'event: trip_status'),
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            trip.comment = 'Gate 4'
+            trip.save()
+        self.assertEqual(len(self.broadcaster.published), 2)
+
+    def test_long_comments_fit_a_notification(self):
+        broadcaster = PostgresBroadcaster()
+        with mock.patch('trips.live.get_broadcaster', return_value=broadcaster), \
+                self.captureOnCommitCallbacks(execute=True):
+            trip = Trip.objects.create(
+                rider=self.rider, origin='A', destination='B', comment='Ä' * 9000
+            )
+        self.assertEqual(len(trip_card(trip)['comment']), 300)
+
+    def test_publish_errors_are_logged(self):
+        with mock.patch.object(self.broadcaster, 'publish', side_effect=DatabaseError), \
+                self.assertLogs('trips.live', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            Trip.objects.create(rider=self.rider, origin='A', destination='B')
+
+    def test_nothing_published_without_commit(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        Trip.objects.accept(trip.pk, self.driver_profile)
+        self.assertEqual(self.broadcaster.published, [])
+
+    def test_available_feed_is_for_drivers(self):
+        url = reverse('trips:available_trips_feed')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.login(username='driver@test.com', password='testpass123')
+        # Streams need ASGI
+        self.assertEqual(self.client.get(url).status_code, 204)
+        client = AsyncClient()
+        client.cookies = self.client.cookies
+        response = async_to_sync(client.get)(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+
+class BroadcasterTest(SimpleTestCase):
+    def test_fan_out_and_unsubscribe(self):
+        broadcaster = LocalBroadcaster()
+
+        async def scenario():
+            async with broadcaster.subscribe(['drivers']) as first, \
+                    broadcaster.subscribe(['drivers', 'trip-1']) as second:
+                await asyncio.to_thread(broadcaster.publish, 'drivers', 'frame-a')
+                await asyncio.to_thread(broadcaster.publish, 'trip-1', 'frame-b')
+                received = (
+                    await asyncio.wait_for(first.get(), 1),
+                    await asyncio.wait_for(second.get(), 1),
+                    await asyncio.wait_for(second.get(), 1),
+                )
+            return received
+
+        self.assertEqual(asyncio.run(scenario()), ('frame-a', 'frame-a', 'frame-b'))
+        self.assertEqual(dict(broadcaster._subscribers), {})
+
+    def test_slow_consumer_drops_oldest(self):
+        broadcaster = LocalBroadcaster(queue_size=2)
+
+        async def scenario():
+            async with broadcaster.subscribe(['drivers']) as queue:
+                for frame in ('a', 'b', 'c'):
+                    broadcaster.publish('drivers', frame)
+                await asyncio.sleep(0)
+                return [queue.get_nowait() for _ in range(queue.qsize())]
+
+        self.assertEqual(asyncio.run(scenario()), ['b', 'c'])
+
+    def test_stream_cancelled_on_disconnect(self):
+        cancelled = []
+
+        async def endless_app(scope, receive, send):
+            await receive()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        messages = [
+            {'type': 'http.request', 'body': b'', 'more_body': False},
+            {'type': 'http.disconnect'},
+        ]
+
+        async def receive():
+            await asyncio.sleep(0.01)
+            return messages.pop(0)
+
+        async def send(message):
+            pass
+
+        app = StreamDisconnectMiddleware(endless_app)
+        scope = {'type': 'http', 'path': '/trips/available/feed/'}
+        asyncio.run(asyncio.wait_for(app(scope, receive, send), 5))
+        self.assertEqual(cancelled, [True])
+
+
+class GeoTest(SimpleTestCase):
+    def test_haversine(self):
+        # Paris - London
+        self.assertAlmostEqual(haversine_km(48.8566, 2.3522, 51.5074, -0.1278), 343.6, 0)
+        self.assertEqual(haversine_km(10, 20, 10, 20), 0)
+
+    def test_cell_ranges_cover_the_circle(self):
+        rng = random.Random(3)
+        for lat, lng, radius in [(40.7, -74.0, 5), (0, 179.99, 3), (-33.9, 151.2, 20),
+                                 (89.95, 10, 10), (64.1, -21.9, 1)]:
+            ranges = cell_ranges(lat, lng, radius)
+            for _ in range(500):
+                # Random point within the circle
+                bearing = rng.uniform(0, 2 * math.pi)
+                distance = radius * math.sqrt(rng.random()) * 0.999
+                point_lat = lat + distance / 111.2 * math.cos(bearing)
+                point_lng = lng + distance / 111.2 * math.sin(bearing) / math.cos(
+                    math.radians(point_lat))
+                point_lng = (point_lng + 180) % 360 - 180
+                if haversine_km(lat, lng, point_lat, point_lng) > radius:
+                    continue
+                cell = grid_cell(point_lat, point_lng)
+                self.assertTrue(
+                    any(first <= cell <= last for first, last in ranges),
+                    (lat, lng, radius, point_lat, point_lng),
+                )
+
+    def test_antimeridian_splits_ranges(self):
+        ranges = cell_ranges(0, 179.999, 2)
+        self.assertEqual(len(ranges), 2 * len({first // 36000 for first, _ in ranges}))
+
+    def test_no_coordinates_no_cell(self):
+        self.assertIsNone(grid_cell(None, 10))
+
+
+class NearbyTripsTest(QueryBudgetMixin, TestCase):
+    center = (40.7128, -74.0060)
+
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        # Trips 0.5, 1.5, ... 9.5 km north of the centre
+        self.trips = [
+            Trip.objects.create(
+                rider=self.rider, origin=f'{i} North St', destination='B',
+                origin_lat=self.center[0] + (i + 0.5) / 111.195, origin_lng=self.center[1],
+            )
+            for i in range(10)
+        ]
+
+    def test_save_sets_cell(self):
+        trip = self.trips[0]
+        self.assertEqual(trip.origin_cell, grid_cell(trip.origin_lat, trip.origin_lng))
+        trip.origin_lat, trip.origin_lng = 1, 1
+        trip.save(update_fields=['origin_lat', 'origin_lng'])
+        trip.refresh_from_db()
+        self.assertEqual(trip.origin_cell, grid_cell(1, 1))
+
+    def test_nearby_within_radius_nearest_first(self):
+        trips = list(Trip.objects.nearby(*self.center, 5))
+        self.assertEqual([trip.pk for trip in trips], [trip.pk for trip in self.trips[:5]])
+        self.assertAlmostEqual(trips[0].distance_km, 0.5, 2)
+
+    def test_nearby_only_open_trips(self):
+        Trip.objects.accept(self.trips[0].pk, self.driver_profile)
+        trips = Trip.objects.nearby(*self.center, 1)
+        self.assertEqual(list(trips), [])
+
+    def test_nearest_expands_until_limit(self):
+        trips = Trip.objects.nearest(*self.center, 50, limit=3)
+        self.assertEqual(trips, self.trips[:3])
+        self.assertEqual(Trip.objects.nearest(*self.center, 2, limit=5), self.trips[:2])
+
+    def test_nearby_view(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        url = reverse('trips:nearby_trips')
+        response = self.client.get(url, {'lat': self.center[0], 'lng': self.center[1], 'radius': 3})
+        self.assertEqual(list(response.context['trips']), self.trips[:3])
+        self.assertContains(response, '0.5 km')
+
+        # Without coordinates the driver's last known location is used
+        response = self.client.get(url)
+        self.assertIsNone(response.context['location'])
+        self.driver_profile.set_location(*self.center)
+        response = self.client.get(url, {'radius': 'nan'})
+        self.assertEqual(response.context['radius_km'], 5)
+        self.assertEqual(list(response.context['trips']), self.trips[:5])
+
+    def test_nearby_view_for_drivers_without_profile(self):
+        User.objects.create_user(
+            username='driver2', email='driver2@test.com', password='testpass123',
+            role='driver'
+        )
+        self.client.login(username='driver2@test.com', password='testpass123')
+        url = reverse('trips:nearby_trips')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['location'])
+        self.assertEqual(list(response.context['trips']), [])
+        response = self.client.get(url, {'lat': self.center[0], 'lng': self.center[1], 'radius': 1})
+        self.assertEqual(list(response.context['trips']), self.trips[:1])
+
+    def test_nearby_view_for_drivers_only(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.assertEqual(self.client.get(reverse('trips:nearby_trips')).status_code, 403)
+
+    def test_update_driver_location(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        url = reverse('trips:update_driver_location')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, {'lat': 95, 'lng': 0}).status_code, 400)
+        response = self.client.post(url, {'lat': 40.7, 'lng': -74.0})
+        self.assertEqual(response.json(), {'ok': True})
+        self.driver_profile.refresh_from_db()
+        self.assertEqual(self.driver_profile.location_cell, grid_cell(40.7, -74.0))
+        self.assertIsNotNone(self.driver_profile.location_updated_at)
+
+    def test_nearby_query_budget(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        # Session and user, then at most one query per radius doubling
+        with self.assertQueryBudget(7):
+            self.client.get(reverse('trips:nearby_trips'),
+                            {'lat': self.center[0], 'lng': self.center[1]})
+
+
+class DispatchSolverTest(SimpleTestCase):
+    weights = DispatchWeights(max_pickup_km=5, wait_weight=0.2, rating_weight=1.0)
+
+    def arrays(self, trip_points, driver_points, wait_min=None, ratings=None):
+        trips = {
+            'lat': np.array([lat for lat, _ in trip_points], dtype=float),
+            'lng': np.array([lng for _, lng in trip_points], dtype=float),
+            'wait_min': np.array(wait_min or [0] * len(trip_points), dtype=float),
+        }
+        drivers = {
+            'lat': np.array([lat for lat, _ in driver_points], dtype=float),
+            'lng': np.array([lng for _, lng in driver_points], dtype=float),
+            'rating': np.array(ratings or [5] * len(driver_points), dtype=float),
+        }
+        return trips, drivers
+
+    def test_pairs_nearest_drivers(self):
+        # 0.01 degrees of latitude is ~1.1 km
+        trips, drivers = self.arrays(
+            [(40.70, -74.0), (40.80, -74.0)],
+            [(40.81, -74.0), (40.71, -74.0)],
+        )
+        self.assertEqual(sorted(solve(trips, drivers, self.weights)), [(0, 1), (1, 0)])
+
+    def test_drivers_beyond_max_pickup_are_not_assigned(self):
+        trips, drivers = self.arrays([(40.70, -74.0)], [(40.80, -74.0)])
+        self.assertEqual(solve(trips, drivers, self.weights), [])
+
+    def test_each_trip_and_driver_used_once(self):
+        rng = np.random.default_rng(7)
+        trips, drivers = self.arrays(
+            list(zip(rng.normal(40.7, 0.02, 300), rng.normal(-74.0, 0.02, 300))),
+            list(zip(rng.normal(40.7, 0.02, 100), rng.normal(-74.0, 0.02, 100))),
+        )
+        pairs = solve(trips, drivers, self.weights, candidates=2)
+        self.assertEqual(len(pairs), 100)
+        self.assertEqual(len({trip for trip, _ in pairs}), len(pairs))
+        self.assertEqual(len({driver for _, driver in pairs}), len(pairs))
+
+    def test_longest_waiting_rider_wins_a_contested_driver(self):
+        trips, drivers = self.arrays(
+            [(40.700, -74.0), (40.702, -74.0)], [(40.7005, -74.0)], wait_min=[0, 10],
+        )
+        self.assertEqual(solve(trips, drivers, self.weights), [(1, 0)])
+
+    def test_better_rated_driver_preferred_at_equal_distance(self):
+        trips, drivers = self.arrays(
+            [(40.70, -74.0)], [(40.71, -74.0), (40.69, -74.0)], ratings=[3.5, 4.9],
+        )
+        self.assertEqual(solve(trips, drivers, self.weights), [(0, 1)])
+
+
+class DispatchTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.drivers = []
+        for i in range(2):
+            user = User.objects.create_user(
+                username=f'driver{i}',
+                email=f'driver{i}@test.com',
+                password='testpass123',
+                role='driver'
+            )
+            driver = DriverProfile.objects.create(
+                user=user,
+                license_number=f'DL{i}',
+                car_number=f'ABC-{i}',
+                car_model='Toyota Camry'
+            )
+            driver.set_location(40.70 + i / 10, -74.0)
+            self.drivers.append(driver)
+        self.trips = [
+            Trip.objects.create(
+                rider=self.rider, origin=f'{i} Main St', destination='B',
+                origin_lat=40.70 + i / 10, origin_lng=-74.0,
+            )
+            for i in range(2)
+        ]
+
+    def test_assign_skips_taken_trips_and_busy_drivers(self):
+        Trip.objects.accept(self.trips[0].pk, self.drivers[1])
+        extra = Trip.objects.create(rider=self.rider, origin='C', destination='D')
+        changes = Trip.objects.assign([
+            (self.trips[0].pk, self.drivers[0].pk),
+            (self.trips[1].pk, self.drivers[1].pk),
+            (extra.pk, self.drivers[0].pk),
+        ])
+        self.assertEqual(
+            [(change.trip_id, change.driver_id) for change in changes],
+            [(extra.pk, self.drivers[0].pk)],
+        )
+        self.trips[1].refresh_from_db()
+        self.assertEqual(self.trips[1].status, 'requested')
+
+    def test_dispatch_once_assigns_nearest_and_sends_signals(self):
+        received = []
+
+        def receiver(sender, transition, **kwargs):
+            received.append(transition)
+
+        trip_status_changed.connect(receiver)
+        self.addCleanup(trip_status_changed.disconnect, receiver)
+        result = dispatch_once()
+
+        self.assertEqual((result.trips, result.drivers, len(result.assigned)), (2, 2, 2))
+        for trip, driver in zip(self.trips, self.drivers):
+            trip.refresh_from_db()
+            self.assertEqual((trip.status, trip.driver_id), ('accepted', driver.pk))
+        self.assertEqual(
+            sorted((change.from_status, change.to_status) for change in received),
+            [('requested', 'accepted')] * 2,
+        )
+        # Both drivers are busy now
+        self.assertEqual(dispatch_once().drivers, 0)
+
+    def test_stale_driver_locations_ignored(self):
+        DriverProfile.objects.update(
+            location_updated_at=timezone.now() - timedelta(hours=1)
+        )
+        result = dispatch_once()
+        self.assertEqual((result.drivers, result.assigned), (0, []))
+
+
+@override_settings(DRIVER_RATING_WINDOW=3)
+class TripRatingTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+
+    def completed_trip(self):
+        return Trip.objects.create(
+            rider=self.rider, driver=self.driver, origin='A', destination='B',
+            status='completed',
+        )
+
+    def test_counters_follow_each_rating(self):
+        for score in [5, 4, 1, 2]:
+            self.assertIsNotNone(
+                TripRating.objects.rate(self.completed_trip().pk, self.rider, score)
+            )
+        self.driver.refresh_from_db()
+        self.assertEqual((self.driver.rating_count, self.driver.rating_sum), (4, 12))
+        self.assertEqual(self.driver.rating, Decimal('3.00'))
+        # Newest first, the oldest score fell out of the window
+        self.assertEqual(self.driver.recent_ratings, [2, 1, 4])
+        self.assertEqual(self.driver.recent_rating, Decimal('2.33'))
+
+    def test_rate_is_one_insert_and_one_update(self):
+        trip = self.completed_trip()
+        with CaptureQueriesContext(connection) as queries:
+            TripRating.objects.rate(trip.pk, self.rider, 5)
+        statements = [q['sql'] for q in queries if not q['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertEqual(len(statements), 2)
+
+    def test_only_completed_trips_of_the_rider_once(self):
+        other = User.objects.create_user(
+            username='rider2', email='rider2@test.com', password='testpass123'
+        )
+        trip = self.completed_trip()
+        open_trip = Trip.objects.create(
+            rider=self.rider, driver=self.driver, origin='A', destination='B',
+            status='accepted',
+        )
+        self.assertIsNone(TripRating.objects.rate(open_trip.pk, self.rider, 5))
+        self.assertIsNone(TripRating.objects.rate(trip.pk, other, 5))
+        self.assertIsNotNone(TripRating.objects.rate(trip.pk, self.rider, 5))
+        self.assertIsNone(TripRating.objects.rate(trip.pk, self.rider, 1))
+        self.driver.refresh_from_db()
+        self.assertEqual(self.driver.rating_count, 1)
+
+    def test_rate_view(self):
+        trip = self.completed_trip()
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:trip_detail', args=[trip.pk]))
+        self.assertContains(response, reverse('trips:rate_trip', args=[trip.pk]))
+
+        response = self.client.post(
+            reverse('trips:rate_trip', args=[trip.pk]), {'score': 4, 'comment': 'Nice'}
+        )
+        self.assertRedirects(response, reverse('trips:trip_detail', args=[trip.pk]))
+        self.assertEqual(trip.rating.score, 4)
+        response = self.client.get(reverse('trips:trip_detail', args=[trip.pk]))
+        self.assertNotContains(response, reverse('trips:rate_trip', args=[trip.pk]))
+        self.assertContains(response, 'Nice')
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        for score in [5, 3]:
+            TripRating.objects.rate(self.completed_trip().pk, self.rider, score)
+        out = StringIO()
+        call_command('reconcile_driver_ratings', stdout=out)
+        self.assertIn('match their history', out.getvalue())
+
+        # A lost update and a deleted rating
+        DriverProfile.objects.filter(pk=self.driver.pk).update(rating_count=7)
+        TripRating.objects.filter(score=3).delete()
+        out = StringIO()
+        call_command('reconcile_driver_ratings', '--fix', stdout=out)
+        self.assertIn('rating_count 7 -> 1', out.getvalue())
+        self.assertIn('Fixed 1 drivers', out.getvalue())
+        self.driver.refresh_from_db()
+        self.assertEqual(
+            (self.driver.rating_count, self.driver.rating_sum, self.driver.rating,
+             self.driver.recent_ratings, self.driver.recent_rating),
+            (1, 5, Decimal('5.00'), [5], Decimal('5.00')),
+        )
+
+
+class TripStatsTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+
+    def stats(self):
+        # A party whose trips are all gone may keep a row of zeros
+        return {
+            (row.user_id, row.role): (
+                row.trips, row.open_trips, row.completed, row.cancelled, row.amount
+            )
+            for row in TripStats.objects.exclude(trips=0)
+        }
+
+    def assertStatsMatchRebuild(self):
+        incremental = self.stats()
+        rebuild_trip_stats()
+        self.assertEqual(incremental, self.stats())
+
+    def test_transitions_update_both_parties(self):
+        trips = [
+            Trip.objects.create(rider=self.rider, origin='A', destination='B', price=10)
+            for _ in range(3)
+        ]
+        for trip in trips[:2]:
+            Trip.objects.accept(trip.pk, self.driver)
+        Trip.objects.complete(trips[0].pk, self.driver)
+        Trip.objects.cancel(trips[1].pk, self.rider)
+        self.assertEqual(self.stats(), {
+            (self.rider.pk, 'rider'): (3, 1, 1, 1, Decimal('10.00')),
+            (self.driver_user.pk, 'driver'): (2, 0, 1, 1, Decimal('10.00')),
+        })
+        self.assertStatsMatchRebuild()
+
+    def test_direct_saves_and_deletes(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        # As the admin's list_editable status column would
+        trip.driver, trip.status, trip.price = self.driver, 'completed', Decimal('7.50')
+        trip.save()
+        trip.comment = 'No effect on the counts'
+        trip.save(update_fields=['comment'])
+        self.assertEqual(self.stats()[(self.driver_user.pk, 'driver')],
+                         (1, 0, 1, 0, Decimal('7.50')))
+        other = Trip.objects.create(rider=self.rider, origin='C', destination='D')
+        other.delete()
+        self.assertStatsMatchRebuild()
+
+    def test_deleting_a_rider_keeps_driver_stats_consistent(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        Trip.objects.accept(trip.pk, self.driver)
+        self.rider.delete()
+        self.assertEqual(self.stats(), {})
+        self.assertStatsMatchRebuild()
+
+    def test_profile_shows_stats(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B', price=12)
+        Trip.objects.accept(trip.pk, self.driver)
+        Trip.objects.complete(trip.pk, self.driver)
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(response.context['stats'].completed, 1)
+        self.assertContains(response, '$12.00')
+
+
+@override_settings(TRIP_GEOCODER='trips.tests.FakeGeocoder')
+class FareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Tariff.objects.all().delete()
+        self.standard = Tariff.objects.create(
+            name='Standard', base_fare=2, per_km=1, per_minute=Decimal('0.5'),
+            minimum_fare=5,
+        )
+        self.night = Tariff.objects.create(
+            name='Night', start_hour=22, end_hour=6, base_fare=4, per_km=2,
+            per_minute=1, minimum_fare=8,
+        )
+        # The compiled table outlives the test transaction
+        self.addCleanup(fares.invalidate)
+
+    def test_narrower_window_wins(self):
+        table = fares.get_table()
+        self.assertEqual(table.tariff_ids[[21, 22, 23, 0, 5, 6]].tolist(), [
+            self.standard.pk, self.night.pk, self.night.pk, self.night.pk,
+            self.night.pk, self.standard.pk,
+        ])
+
+    def test_quote_many_matches_quote_one(self):
+        distance = np.array([0.5, 3.0, 10.0, 10.0])
+        duration = np.array([1.0, 8.0, 20.0, 20.0])
+        hours = np.array([12, 12, 12, 23])
+        quoted = fares.quote_many(distance, duration, hours)
+        # 2 + 0.5 + 0.5 is below the minimum fare of 5
+        self.assertEqual(quoted.tolist(), [5.0, 9.0, 22.0, 44.0])
+        self.assertEqual(
+            quoted.tolist(),
+            [fares.quote_one(*args) for args in zip(distance, duration, hours)],
+        )
+
+    def test_uncovered_hours_are_not_priced(self):
+        self.standard.delete()
+        self.assertIsNone(fares.quote_one(3.0, 8.0, 12))
+        self.assertTrue(np.isnan(fares.quote_many([3.0], [8.0], [12])[0]))
+
+    def test_tariff_changes_invalidate_the_cache(self):
+        self.assertEqual(fares.quote_one(3.0, 8.0, 12), 9.0)
+        self.standard.base_fare = 3
+        self.standard.save()
+        self.assertEqual(fares.quote_one(3.0, 8.0, 12), 10.0)
+
+    def test_quote_trips_batch_matches_single(self):
+        rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        trips = [
+            Trip(rider=rider, origin='A', destination='B', origin_lat=40.70 + i / 100,
+                 origin_lng=-74.0, destination_lat=40.75, destination_lng=-73.95)
+            for i in range(5)
+        ] + [Trip(rider=rider, origin='A', destination='B')]
+        prices = fares.quote_trips(trips)
+        self.assertEqual(prices, [fares.quote_trip(trip) for trip in trips])
+        self.assertIsNone(prices[-1])
+        self.assertIsInstance(prices[0], Decimal)
+
+    def test_created_trips_are_priced(self):
+        User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.post(reverse('trips:trip_create'), {
+            'origin': 'A', 'destination': 'B',
+            # Posted coordinates are ignored: a 0 km trip at the minimum fare
+            'origin_lat': 40.75, 'origin_lng': -73.95,
+            'destination_lat': 40.75, 'destination_lng': -73.95,
+        })
+        trip = Trip.objects.get()
+        self.assertEqual((trip.origin_lat, trip.origin_lng), (40.70, -74.0))
+        self.assertEqual((trip.destination_lat, trip.destination_lng), (40.75, -73.95))
+        self.assertIsNotNone(trip.price)
+        self.assertEqual(trip.price, fares.quote_trip(trip))
+        self.assertGreater(trip.price, self.standard.minimum_fare)
+
+    def test_changed_addresses_are_repriced(self):
+        rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.post(reverse('trips:trip_create'), {'origin': 'A', 'destination': 'B'})
+        trip = Trip.objects.get(rider=rider)
+        price = trip.price
+        self.client.post(reverse('trips:trip_update', args=[trip.pk]), {
+            'origin': 'A', 'destination': 'C', 'comment': '',
+        })
+        trip.refresh_from_db()
+        self.assertEqual((trip.destination_lat, trip.destination_lng), (40.80, -73.90))
+        self.assertGreater(trip.price, price)
+
+    def test_unlocated_trips_are_not_priced(self):
+        User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.post(reverse('trips:trip_create'), {'origin': 'A', 'destination': 'Nowhere'})
+        trip = Trip.objects.get()
+        self.assertIsNone(trip.destination_lat)
+        self.assertIsNone(trip.price)
+
+    def test_reprice_trips(self):
+        rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        trip = Trip.objects.create(
+            rider=rider, origin='A', destination='B', origin_lat=40.70,
+            origin_lng=-74.0, destination_lat=40.75, destination_lng=-73.95,
+        )
+        call_command('reprice_trips', stdout=StringIO())
+        trip.refresh_from_db()
+        self.assertEqual(trip.price, fares.quote_trip(trip))
+
+
+@override_settings(TRIP_GEOCODER='trips.tests.FakeGeocoder')
+class GeocodingTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_answers_are_cached(self):
+        with mock.patch.object(
+            FakeGeocoder, 'geocode', autospec=True, side_effect=FakeGeocoder.geocode
+        ) as geocode:
+            self.assertEqual(geocoding.geocode('A'), (40.70, -74.0))
+            self.assertEqual(geocoding.geocode(' a '), (40.70, -74.0))
+            self.assertIsNone(geocoding.geocode('Nowhere'))
+            self.assertIsNone(geocoding.geocode('Nowhere'))
+        self.assertEqual(geocode.call_count, 2)
+
+    @override_settings(TRIP_GEOCODER='trips.tests.FailingGeocoder')
+    def test_failures_are_not_cached(self):
+        with self.assertLogs('trips.geocoding', 'WARNING'):
+            self.assertIsNone(geocoding.geocode('A'))
+        with self.settings(TRIP_GEOCODER='trips.tests.FakeGeocoder'):
+            self.assertEqual(geocoding.geocode('A'), (40.70, -74.0))
+
+    def test_nominatim_answers(self):
+        geocoder = geocoding.NominatimGeocoder()
+        answer = json.dumps([{'lat': '40.70', 'lon': '-74.0'}]).encode()
+        with mock.patch.object(geocoding, 'urlopen', return_value=BytesIO(answer)) as urlopen:
+            self.assertEqual(geocoder.geocode('1 Main St'), (40.70, -74.0))
+        self.assertIn('q=1+Main+St', urlopen.call_args.args[0].full_url)
+        with mock.patch.object(geocoding, 'urlopen', return_value=BytesIO(b'[]')):
+            self.assertIsNone(geocoder.geocode('Nowhere'))
+        for error in (OSError('timed out'), None):
+            with mock.patch.object(
+                geocoding, 'urlopen', side_effect=error, return_value=BytesIO(b'<html>')
+            ), self.assertRaises(geocoding.GeocodingError):
+                geocoder.geocode('1 Main St')
+
+
+class TripPartitionTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.old_month = partitions.add_months(partitions.month_start(timezone.now()), -24)
+
+    def _partition_of(self, trip):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT tableoid::regclass::text FROM trips_trip WHERE id = %s', [trip.pk]
+            )
+            row = cursor.fetchone()
+        return row and row[0]
+
+    def _old_trip(self):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        Trip.objects.filter(pk=trip.pk).update(
+            created_at=partitions._bound(self.old_month) + timedelta(days=3)
+        )
+        return trip
+
+    def test_new_trips_go_to_the_current_month(self):
+        self.assertTrue(partitions.is_partitioned())
+        month = partitions.month_start(timezone.now())
+        names = [partition.name for partition in partitions.list_partitions()]
+        for ahead in range(4):
+            self.assertIn(partitions.partition_name(partitions.add_months(month, ahead)), names)
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+        self.assertEqual(self._partition_of(trip), partitions.partition_name(month))
+
+    def test_creating_a_month_moves_its_rows_out_of_the_default(self):
+        trip = self._old_trip()
+        self.assertEqual(self._partition_of(trip), partitions.DEFAULT_PARTITION)
+        self.assertTrue(partitions.create_partition(self.old_month))
+        self.assertFalse(partitions.create_partition(self.old_month))
+        self.assertEqual(self._partition_of(trip), partitions.partition_name(self.old_month))
+        self.assertEqual(Trip.objects.get(pk=trip.pk).origin, 'A')
+        self.assertTrue(TripSearch.objects.filter(trip_id=trip.pk).exists())
+
+    @override_settings(TIME_ZONE='Pacific/Auckland')
+    def test_months_are_utc_months(self):
+        # Next to the months the migration created, in UTC: no overlap, no gap
+        last = partitions.list_partitions()[-1].month
+        created = partitions.ensure_partitions(
+            months_ahead=settings.TRIP_PARTITION_MONTHS_AHEAD + 1
+        )
+        month = partitions.add_months(last, 1)
+        self.assertEqual(created, [partitions.partition_name(month)])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_get_expr(relpartbound, oid) FROM pg_class WHERE relname = %s',
+                [created[0]],
+            )
+            bound = cursor.fetchone()[0]
+        self.assertIn(f"'{month} 00:00:00+00'", bound)
+
+    def test_archive_detaches_old_months(self):
+        trip = self._old_trip()
+        partitions.create_partition(self.old_month)
+        out = StringIO()
+        call_command('archive_trip_partitions', '--dry-run', stdout=out)
+        self.assertIn(partitions.partition_name(self.old_month), out.getvalue())
+        self.assertTrue(Trip.objects.filter(pk=trip.pk).exists())
+
+        old = partitions.list_partitions()[0]
+        archived = partitions.archive_partition(old)
+        self.assertFalse(Trip.objects.filter(pk=trip.pk).exists())
+        self.assertFalse(TripSearch.objects.filter(trip_id=trip.pk).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {archived}')
+            self.assertEqual(cursor.fetchall(), [(trip.pk,)])
+        self.assertNotIn(old, partitions.list_partitions())
+
+
+class TripExportTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.other = User.objects.create_user(
+            username='rider2', email='other@test.com', password='testpass123'
+        )
+        self.trips = [
+            Trip.objects.create(rider=self.rider, origin=f'{i} Main St, "Downtown"',
+                                destination='Oak Ave', status='completed' if i % 2 else 'requested')
+            for i in range(5)
+        ]
+        self.other_trip = Trip.objects.create(rider=self.other, origin='A', destination='B')
+
+    def _export(self, **params):
+        response = self.client.get(reverse('trips:export_trips'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, list(response.streaming_content)
+
+    def test_csv_export_of_own_trips(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response, chunks = self._export(rider=self.other.pk)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        rows = list(csv.reader(StringIO(b''.join(chunks).decode())))
+        self.assertEqual(rows[0][:4], ['id', 'created_at', 'updated_at', 'status'])
+        # The rider filter is for staff only
+        self.assertEqual([int(row[0]) for row in rows[1:]], [trip.pk for trip in self.trips])
+        self.assertEqual(rows[1][6], '0 Main St, "Downtown"')
+
+    @override_settings(TRIP_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_is_streamed_in_chunks(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        _, chunks = self._export(format='ndjson')
+        self.assertEqual(len(chunks), 3)
+        records = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([record['id'] for record in records], [trip.pk for trip in self.trips])
+        self.assertEqual(records[0]['rider'], 'rider@test.com')
+        self.assertIsNone(records[0]['driver'])
+
+    def test_staff_filters(self):
+        User.objects.create_user(
+            username='staff', email='staff@test.com', password='testpass123', is_staff=True
+        )
+        self.client.login(username='staff@test.com', password='testpass123')
+        today = timezone.localdate()
+        _, chunks = self._export(format='ndjson', rider=self.rider.pk, status='completed',
+                                 since=today.isoformat(), until=today.isoformat())
+        ids = [json.loads(line)['id'] for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual(ids, [self.trips[1].pk, self.trips[3].pk])
+        _, chunks = self._export(format='ndjson', since=(today + timedelta(days=1)).isoformat())
+        self.assertEqual(chunks, [])
+
+    def test_invalid_filters(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:export_trips'), {
+            'since': '2024-02-01', 'until': '2024-01-01',
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_trips', '--status', 'requested', '--chunk-size', '1', stdout=out)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(
+            [int(row[0]) for row in rows[1:]],
+            [self.trips[0].pk, self.trips[2].pk, self.trips[4].pk, self.other_trip.pk],
+        )
+
+    def test_async_iteration_closes_the_generator(self):
+        closed = []
+
+        def chunks():
+            try:
+                yield 'a'
+                yield 'b'
+            finally:
+                closed.append(True)
+
+        async def first_chunk():
+            async for chunk in aiter_chunks(chunks()):
+                return chunk
+
+        async def collect():
+            return [chunk async for chunk in aiter_chunks(chunks())]
+
+        self.assertEqual(async_to_sync(collect)(), ['a', 'b'])
+        self.assertEqual(async_to_sync(first_chunk)(), 'a')
+        self.assertEqual(closed, [True, True])
+
+
+class TripApiTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            first_name='Rita',
+            last_name='Rider',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            first_name='Dan',
+            last_name='Driver',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.trips = [
+            Trip.objects.create(
+                rider=self.rider,
+                driver=self.driver_profile if i % 2 else None,
+                origin=f'{i} Main St',
+                destination=f'{i} Oak Ave',
+                status='completed' if i % 2 else 'requested',
+                price=Decimal('12.50') if i % 2 else None,
+            )
+            for i in range(5)
+        ]
+
+    def test_driver_without_profile_sees_no_trips(self):
+        User.objects.create_user(
+            username='driver2', email='noprofile@test.com', password='testpass123',
+            role='driver'
+        )
+        self.client.login(username='noprofile@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:trip_list'))
+        self.assertEqual(list(response.context['trips']), [])
+        self.assertNotContains(response, 'rider@test.com')
+        response = self.client.get(reverse('trips:export_trips'), {'format': 'ndjson'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        response = self.client.get(reverse('v1:trip-list'))
+        self.assertEqual(response.json()['results'], [])
+
+    def test_list_pages_with_cursors(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:trip-list'), {'page_size': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [trip['id'] for trip in data['results']],
+            [trip.pk for trip in reversed(self.trips[2:])],
+        )
+        self.assertIsNone(data['previous'])
+        newest = data['results'][0]
+        self.assertEqual(newest['rider_name'], 'Rita Rider')
+        self.assertIsNone(newest['driver'])
+        self.assertIsNone(newest['driver_name'])
+        self.assertEqual(data['results'][1]['driver_name'], 'Dan Driver')
+        self.assertEqual(data['results'][1]['price'], '12.50')
+
+        data = self.client.get(data['next']).json()
+        self.assertEqual([trip['id'] for trip in data['results']],
+                         [self.trips[1].pk, self.trips[0].pk])
+        self.assertIsNone(data['next'])
+        self.assertIsNotNone(data['previous'])
+
+        response = self.client.get(reverse('v1:trip-list'), {'cursor': 'bogus'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_query_count(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.get(reverse('v1:trip-list'))
+        # session, user, page, rider names, driver names
+        with self.assertNumQueries(5):
+            self.client.get(reverse('v1:trip-list'))
+
+    def test_field_selection(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:trip-list'), {'fields': 'id,status'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'status'})
+        response = self.client.get(reverse('v1:trip-list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['fields'])
+
+    def test_conditional_get(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        url = reverse('v1:trip-detail', args=[self.trips[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        Trip.objects.filter(pk=self.trips[0].pk).update(
+            comment='Changed', updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['comment'], 'Changed')
+
+    def test_available_is_for_drivers(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:trip-available'))
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:trip-available'))
+        self.assertEqual(
+            [trip['id'] for trip in response.json()['results']],
+            [self.trips[4].pk, self.trips[2].pk, self.trips[0].pk],
+        )
+
+    def test_retrieve_visibility(self):
+        User.objects.create_user(
+            username='other', email='other@test.com', password='testpass123', role='rider'
+        )
+        self.client.login(username='other@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:trip-detail', args=[self.trips[0].pk]))
+        self.assertEqual(response.status_code, 404)
+
+        # Drivers see open trips and their own
+        self.client.login(username='driver@test.com', password='testpass123')
+        for trip in self.trips[:2]:
+            response = self.client.get(reverse('v1:trip-detail', args=[trip.pk]))
+            self.assertEqual(response.status_code, 200)
+
+    def test_requires_authentication(self):
+        response = self.client.get(reverse('v1:trip-list'))
+        self.assertEqual(response.status_code, 403)
+
+
+class TripConditionalGetTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.trip = Trip.objects.create(
+            rider=self.rider,
+            driver=self.driver_profile,
+            origin='123 Main St',
+            destination='456 Oak Ave',
+            status='completed',
+            price=Decimal('12.50'),
+        )
+
+    def _touch(self, trip):
+        Trip.objects.filter(pk=trip.pk).update(
+            updated_at=timezone.now() + timedelta(seconds=1)
+        )
+
+    def test_trip_detail_not_modified(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        url = reverse('trips:trip_detail', args=[self.trip.pk])
+        self.client.get(url)  # sets the CSRF cookie the rating form needs
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # session, user, validator: no trip loaded, nothing rendered
+        with self.assertQueryBudget(3):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        self._touch(self.trip)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_trip_detail_follows_rating_and_driver(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        url = reverse('trips:trip_detail', args=[self.trip.pk])
+        etag = self.client.get(url)['ETag']
+        self.client.post(reverse('trips:rate_trip', args=[self.trip.pk]), {'score': 4})
+        self.client.get(url)  # shows the flash message, uncached
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Your Rating')
+
+        etag = response['ETag']
+        DriverProfile.objects.filter(pk=self.driver_profile.pk).update(
+            car_model='Honda Civic', updated_at=timezone.now() + timedelta(seconds=2)
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Honda Civic')
+
+    def test_validators_are_per_user(self):
+        url = reverse('trips:trip_detail', args=[self.trip.pk])
+        self.client.login(username='rider@test.com', password='testpass123')
+        etag = self.client.get(url)['ETag']
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_trip(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:trip_detail', args=[self.trip.pk + 1]))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+    def test_available_trips_feed(self):
+        open_trip = Trip.objects.create(
+            rider=self.rider, origin='1 Elm St', destination='2 Pine St', status='requested'
+        )
+        self.client.login(username='driver@test.com', password='testpass123')
+        url = reverse('trips:available_trips')
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Leaving the feed changes the page, not any row still on it
+        Trip.objects.filter(pk=open_trip.pk).update(status='cancelled')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '1 Elm St')
+
+
+class TripRowCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rider = User.objects.create_user(
+            username='rider1',
+            email='rider@test.com',
+            password='testpass123',
+            role='rider'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.trip = Trip.objects.create(
+            rider=self.rider,
+            origin='123 Main St',
+            destination='456 Oak Ave',
+            status='requested'
+        )
+
+    def test_rows_are_cached_per_role(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('trips:trip_list'))
+        self.assertContains(response, '123 Main St')
+        self.assertContains(response, reverse('trips:trip_update', args=[self.trip.pk]))
+        version, html = cache.get(row_key(self.trip.pk, 'rider'))
+        self.assertIn('Pending', html)
+        self.assertIsNone(cache.get(row_key(self.trip.pk, 'driver')))
+
+        # Served from the cache: the entry is returned as it was stored
+        cache.set(row_key(self.trip.pk, 'rider'), (version, '<tr><td>cached</td></tr>'))
+        self.assertContains(self.client.get(reverse('trips:trip_list')), 'cached')
+
+    def test_status_change_drops_the_rows(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.get(reverse('trips:trip_list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Trip.objects.accept(self.trip.pk, self.driver_profile)
+        self.assertIsNone(cache.get(row_key(self.trip.pk, 'rider')))
+
+        response = self.client.get(reverse('trips:trip_list'))
+        self.assertContains(response, 'Accepted')
+        self.assertContains(response, 'driver@test.com')
+        self.assertNotContains(response, reverse('trips:trip_update', args=[self.trip.pk]))
+
+    def test_stale_rows_are_rendered_again(self):
+        Trip.objects.filter(pk=self.trip.pk).update(driver=self.driver_profile)
+        self.client.login(username='rider@test.com', password='testpass123')
+        self.client.get(reverse('trips:trip_list'))
+        # Neither write sends a signal: the stored version no longer matches
+        User.objects.filter(pk=self.driver_user.pk).update(email='new@test.com')
+        self.assertContains(self.client.get(reverse('trips:trip_list')), 'new@test.com')
+        Trip.objects.filter(pk=self.trip.pk).update(
+            origin='789 Pine St', updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        self.assertContains(self.client.get(reverse('trips:trip_list')), '789 Pine St')
+
+
+class TripEventTest(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1', email='driver@test.com', password='testpass123', role='driver'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=self.driver_user, license_number='DL1', car_number='ABC-1', car_model='Camry'
+        )
+        self.trip = Trip.objects.create(rider=self.rider, origin='A', destination='B')
+
+    def history(self, trip=None):
+        return list(
+            TripEvent.objects.filter(trip=trip or self.trip)
+            .values_list('from_status', 'to_status', 'driver_id', 'actor_id')
+        )
+
+    def test_transitions_are_recorded(self):
+        Trip.objects.accept(self.trip.pk, self.driver, actor=self.driver_user)
+        Trip.objects.complete(self.trip.pk, self.driver, actor=self.driver_user)
+        Trip.objects.cancel(self.trip.pk, self.rider)  # too late: nothing happens
+        self.assertEqual(self.history(), [
+            ('', 'requested', None, None),
+            ('requested', 'accepted', self.driver.pk, self.driver_user.pk),
+            ('accepted', 'completed', self.driver.pk, self.driver_user.pk),
+        ])
+        self.trip.refresh_from_db()
+        event = TripEvent.objects.get(to_status='completed')
+        self.assertEqual(event.occurred_at, self.trip.updated_at)
+        self.assertNotEqual(event.transaction_id, 0)
+
+    def test_cancel_and_assign_are_recorded(self):
+        other = Trip.objects.create(rider=self.rider, origin='C', destination='D')
+        Trip.objects.cancel(self.trip.pk, self.rider)
+        Trip.objects.assign([(other.pk, self.driver.pk)])
+        self.assertEqual(self.history()[-1], ('requested', 'cancelled', None, self.rider.pk))
+        self.assertEqual(self.history(other)[-1], ('requested', 'accepted', self.driver.pk, None))
+
+    def test_direct_saves_record_status_changes_only(self):
+        self.trip.comment = 'Luggage'
+        self.trip.save()
+        self.trip.status = 'cancelled'
+        self.trip.save()
+        self.assertEqual(self.history(), [
+            ('', 'requested', None, None),
+            ('requested', 'cancelled', None, None),
+        ])
+
+    def test_log_is_append_only(self):
+        trip_id = self.trip.pk
+        self.trip.delete()
+        self.assertTrue(TripEvent.objects.filter(trip_id=trip_id).exists())
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            TripEvent.objects.update(to_status='completed')
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            TripEvent.objects.all()._raw_delete(TripEvent.objects.db)
+
+
+class TripProjectionTest(TransactionTestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=User.objects.create_user(
+                username='driver1', email='driver@test.com', password='testpass123',
+                role='driver'
+            ),
+            license_number='DL1', car_number='ABC-1', car_model='Camry',
+        )
+
+    def ride(self, waited_minutes, price=Decimal('12.50')):
+        trip = Trip.objects.create(rider=self.rider, origin='A', destination='B', price=price)
+        accepted_at = trip.created_at + timedelta(minutes=waited_minutes)
+        with mock.patch('trips.models.timezone.now', return_value=accepted_at):
+            Trip.objects.accept(trip.pk, self.driver)
+            Trip.objects.complete(trip.pk, self.driver)
+        return trip
+
+    def read_models(self):
+        return (
+            sorted(WaitTimeBucket.objects.values_list('minutes', 'trips')),
+            list(DriverActivity.objects.values_list('driver_id', 'accepted', 'completed', 'earned')),
+        )
+
+    def test_catch_up_is_incremental(self):
+        self.ride(0.5)
+        self.ride(7)
+        for projection in projections.PROJECTIONS.values():
+            self.assertEqual(projections.catch_up(projection), 6)
+        self.ride(7)
+        Trip.objects.create(rider=self.rider, origin='C', destination='D')
+        wait_times = projections.PROJECTIONS['wait_times']
+        self.assertEqual(projections.catch_up(wait_times, batch_size=2), 4)
+        self.assertEqual(projections.catch_up(wait_times), 0)
+        projections.catch_up(projections.PROJECTIONS['driver_activity'])
+
+        self.assertEqual(self.read_models(), (
+            [(0, 1), (5, 2)],
+            [(self.driver.pk, 3, 3, Decimal('37.50'))],
+        ))
+        self.assertEqual(ProjectionOffset.objects.get(name='wait_times').events, 10)
+
+    def test_replay_rebuilds_the_same_read_models(self):
+        for minutes in (0, 2.2, 2.5, 45):
+            self.ride(minutes)
+        for projection in projections.PROJECTIONS.values():
+            projections.catch_up(projection)
+        incremental = self.read_models()
+        self.assertEqual(incremental[0], [(0, 1), (2, 2), (30, 1)])
+
+        out = StringIO()
+        call_command('trip_projections', '--replay', '--batch-size', '3', stdout=out)
+        self.assertEqual(self.read_models(), incremental)
+        self.assertIn('wait_times: 12 events', out.getvalue())
+        self.assertIn('driver_activity: 12 events', out.getvalue())
+
+
+class TripAdminTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@test.com', password='testpass123'
+        )
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.other_rider = User.objects.create_user(
+            username='rider2', email='other@test.com', password='testpass123'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=User.objects.create_user(
+                username='driver1', email='driver@test.com', password='testpass123', role='driver'
+            ),
+            license_number='DL1', car_number='ABC-1', car_model='Camry'
+        )
+        self.add_trips()
+        self.client.login(username='admin@test.com', password='testpass123')
+        self.url = reverse('admin:trips_trip_changelist')
+
+    def add_trips(self, count=5):
+        for i in range(count):
+            Trip.objects.create(
+                rider=self.rider if i % 2 else self.other_rider,
+                driver=self.driver if i % 2 else None,
+                origin=f'{i} Main St', destination='Airport',
+                status='accepted' if i % 2 else 'requested'
+            )
+
+    def listed(self, query=''):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_changelist_query_budget(self):
+        self.assertPageQueryBudget(self.url, 5, self.add_trips)
+
+    def test_event_changelist_query_budget(self):
+        self.assertPageQueryBudget(
+            reverse('admin:trips_tripevent_changelist'), 4, self.add_trips
+        )
+
+    def test_rating_changelist_query_budget(self):
+        def add_ratings():
+            for _ in range(3):
+                trip = Trip.objects.create(
+                    rider=self.rider, driver=self.driver, origin='A', destination='B',
+                    status='completed'
+                )
+                TripRating.objects.rate(trip.pk, self.rider, 5)
+
+        self.assertPageQueryBudget(
+            reverse('admin:trips_triprating_changelist'), 5, add_ratings
+        )
+
+    def test_counts_are_exact_up_to_the_limit(self):
+        trips = Trip.objects.all()
+        with self.settings(ADMIN_EXACT_COUNT_LIMIT=10):
+            self.assertEqual(EstimatedCountPaginator(trips, 2).count, 5)
+        with self.settings(ADMIN_EXACT_COUNT_LIMIT=3):
+            # Never below what was counted, whatever the planner guesses
+            self.assertGreaterEqual(EstimatedCountPaginator(trips, 2).count, 4)
+            self.assertGreaterEqual(self.listed().result_count, 4)
+
+    def test_search_own_and_related_fields(self):
+        self.assertEqual(self.listed('?q=3 main').result_count, 1)
+        cl = self.listed('?q=rider@test')
+        self.assertEqual({trip.rider_id for trip in cl.result_list}, {self.rider.pk})
+        self.assertEqual(self.listed('?q=driver@test airport').result_count, 2)
+        with self.settings(ADMIN_SEARCH_RELATED_LIMIT=0):
+            # Too many matches for a list of ids: filtered by subquery
+            self.assertEqual(self.listed('?q=rider@test').result_count, 2)
+        self.assertEqual(self.listed('?q=nowhere').result_count, 0)
+
+    def test_ordering_follows_the_index(self):
+        self.assertEqual(self.listed().queryset.query.order_by, ('-created_at', '-pk'))
+        # created_at ascending: the tie-breaker walks the same index backwards
+        self.assertEqual(self.listed('?o=8').queryset.query.order_by, ('created_at', 'pk'))
+        self.assertEqual(self.listed('?o=-1').queryset.query.order_by, ('-id',))
+
+
+class TripSearchTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.rider = User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123'
+        )
+        self.other_rider = User.objects.create_user(
+            username='rider2', email='other@test.com', password='testpass123'
+        )
+        self.driver_user = User.objects.create_user(
+            username='driver1', email='driver@test.com', password='testpass123', role='driver'
+        )
+        self.driver = DriverProfile.objects.create(
+            user=self.driver_user, license_number='DL1', car_number='ABC-1', car_model='Camry'
+        )
+        self.to_airport = Trip.objects.create(
+            rider=self.rider, origin='12 Main Street, Downtown', destination='Airport Terminal'
+        )
+        self.from_airport = Trip.objects.create(
+            rider=self.rider, origin='Airport Terminal', destination='4 Oak Avenue'
+        )
+        self.via_comment = Trip.objects.create(
+            rider=self.rider, origin='9 Pine Road', destination='Lake Road',
+            comment='Stop at the airport shop on the way'
+        )
+        # Spells a word qualified by the first rider
+        self.other_trip = Trip.objects.create(
+            rider=self.other_rider, origin='Airport Terminal', destination='Main Street',
+            comment=f'#r{self.rider.pk}:secret'
+        )
+
+    def search(self, text, **owner):
+        return [trip.pk for trip in Trip.objects.search(text, **owner)]
+
+    def test_ranked_whole_word_matches_of_own_trips(self):
+        self.assertEqual(
+            self.search('Airport', rider=self.rider),
+            [self.from_airport.pk, self.to_airport.pk, self.via_comment.pk],
+        )
+        self.assertEqual(self.search('main street', rider=self.rider), [self.to_airport.pk])
+        self.assertEqual(self.search('main, street', rider=self.other_rider), [self.other_trip.pk])
+        self.assertEqual(self.search('airp', rider=self.rider), [])
+        self.assertEqual(self.search('airport', rider=self.rider, limit=1), [self.from_airport.pk])
+        self.assertEqual(self.search('secret', rider=self.rider), [])
+        self.assertEqual(self.search('secret', rider=self.other_rider), [self.other_trip.pk])
+        self.assertEqual(self.search('!& :*', rider=self.rider), [])
+
+    def test_documents_follow_writes(self):
+        self.to_airport.origin = '3 Hill Street'
+        self.to_airport.save()
+        self.assertEqual(self.search('hill', rider=self.rider), [self.to_airport.pk])
+        self.assertEqual(TripSearch.objects.count(), 4)
+        self.assertEqual(self.search('airport', driver=self.driver), [])
+        Trip.objects.accept(self.to_airport.pk, self.driver)
+        self.assertEqual(self.search('airport', driver=self.driver), [self.to_airport.pk])
+        self.assertEqual(self.search('airport', driver=self.driver.pk), [self.to_airport.pk])
+        self.to_airport.delete()
+        self.assertEqual(self.search('airport', driver=self.driver), [])
+        self.assertFalse(TripSearch.objects.filter(trip_id=self.to_airport.pk).exists())
+
+    def test_trip_list_search(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        url = reverse('trips:trip_list')
+        # The search, then the trips found
+        response = self.assertPageQueryBudget(url + '?q=airport', 4, lambda: None)
+        self.assertEqual(
+            [trip.pk for trip in response.context['trips']],
+            [self.from_airport.pk, self.to_airport.pk, self.via_comment.pk],
+        )
+        self.assertFalse(response.context['is_paginated'])
+        self.assertContains(response, 'Best matches for')
+        response = self.client.get(url + '?q=nowhere')
+        self.assertContains(response, 'No trips match your search.')
+
+        Trip.objects.accept(self.via_comment.pk, self.driver)
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(url + '?q=airport')
+        self.assertEqual([trip.pk for trip in response.context['trips']], [self.via_comment.pk])
+
+
+class AddressIndexTest(SimpleTestCase):
+    SPELLINGS = [
+        ('12 Main Street', 5), ('12 main street.', 7), ('Airport Terminal', 20),
+        ('Main Square', 3), ('Mainz Hbf', 1), ('4 Oak Avenue', 2), ('  ', 9),
+    ]
+
+    def test_normalize(self):
+        self.assertEqual(addresses.normalize('  12, Main   STREET. '), '12 main street')
+
+    def test_most_used_addresses_with_a_word_starting_with_the_prefix(self):
+        index = addresses.AddressIndex(self.SPELLINGS, size=3, scan_limit=1)
+        self.assertEqual(len(index), 5)
+        # One address per key, in its most used spelling
+        self.assertEqual(index.suggest('main'), ['12 main street.', 'Main Square', 'Mainz Hbf'])
+        self.assertEqual(index.suggest('main', limit=1), ['12 main street.'])
+        self.assertEqual(index.suggest('12 MA'), [])
+        self.assertEqual(index.suggest('12 ma'), ['12 main street.'])
+        self.assertEqual(index.suggest('ter'), ['Airport Terminal'])
+        self.assertEqual(index.suggest('x'), [])
+        self.assertEqual(index.suggest(''), [])
+
+    def test_added_trips_rank_like_a_rebuild(self):
+        added = ['Main Square'] * 10 + ['Mainz Hbf'] * 4 + ['4 oak avenue']
+        ranked = addresses.AddressIndex(self.SPELLINGS, size=3, scan_limit=0)
+        for address in added + ['Nowhere']:
+            ranked.add(address)
+        self.assertEqual(ranked.suggest('now'), [])
+        rebuilt = addresses.AddressIndex(
+            self.SPELLINGS + [(address, 1) for address in added], size=3, scan_limit=0
+        )
+        prefixes = {entry[:end] for entry in rebuilt._entries for end in range(1, len(entry) + 1)}
+        self.assertTrue(all(prefix in ranked._ranked for prefix in prefixes))
+        for prefix in prefixes:
+            self.assertEqual(
+                [addresses.normalize(spelling) for spelling in ranked.suggest(prefix)],
+                [addresses.normalize(spelling) for spelling in rebuilt.suggest(prefix)],
+                prefix,
+            )
+        self.assertEqual(ranked.suggest('main'), ['Main Square', '12 main street.', 'Mainz Hbf'])
+
+
+@override_settings(TRIP_GEOCODER='trips.tests.FakeGeocoder')
+class AddressSuggestionTest(TestCase):
+    def setUp(self):
+        addresses.invalidate()
+        self.addCleanup(addresses.invalidate)
+        self.riders = [
+            User.objects.create_user(
+                username=f'rider{i}', email=f'rider{i}@test.com', password='testpass123'
+            )
+            for i in range(3)
+        ]
+        for rider in self.riders:
+            Trip.objects.create(rider=rider, origin='Airport Terminal', destination='Main Square')
+        Trip.objects.create(
+            rider=self.riders[0], origin='7 Hidden Lane', destination='Airport terminal'
+        )
+        addresses.load_index()
+
+    def test_recent_addresses_first_then_shared_ones(self):
+        rider, other = self.riders[0].pk, self.riders[1].pk
+        # One suggestion per address, in the rider's own spelling
+        self.assertEqual(addresses.suggest('a', rider_id=rider), ['Airport terminal'])
+        self.assertEqual(addresses.suggest('a', rider_id=other), ['Airport Terminal'])
+        # A single rider's address is only suggested to them
+        self.assertEqual(addresses.suggest('hid', rider_id=rider), ['7 Hidden Lane'])
+        self.assertEqual(addresses.suggest('hid', rider_id=other), [])
+        self.assertEqual(addresses.suggest('hid'), [])
+        self.assertEqual(addresses.suggest('squ', rider_id=other), ['Main Square'])
+        with self.assertNumQueries(0):
+            addresses.suggest('m', rider_id=rider)
+            addresses.suggest('mai', rider_id=other)
+
+    def test_recent_addresses_only_while_the_index_builds(self):
+        addresses.invalidate()
+        with mock.patch('trips.addresses.threading.Thread') as thread:
+            self.addCleanup(addresses._building.release)
+            self.assertEqual(
+                addresses.suggest('a', rider_id=self.riders[1].pk), ['Airport Terminal']
+            )
+            self.assertEqual(addresses.suggest('a'), [])
+        thread.assert_called_once_with(target=addresses._rebuild, daemon=True)
+
+    def test_failed_builds_are_retried_later(self):
+        addresses.invalidate()
+        addresses._building.acquire()
+        with mock.patch('trips.addresses.build_index', side_effect=DatabaseError), \
+                mock.patch('trips.addresses.connection'), \
+                self.assertLogs('trips.addresses', 'ERROR'):
+            addresses._rebuild()
+        self.assertFalse(addresses._building.locked())
+        with mock.patch('trips.addresses.threading.Thread') as thread:
+            self.assertEqual(addresses.suggest('a'), [])
+            thread.assert_not_called()
+            later = time.monotonic() + settings.ADDRESS_INDEX_RETRY + 1
+            with mock.patch('trips.addresses.time.monotonic', return_value=later):
+                addresses.suggest('a')
+            self.addCleanup(addresses._building.release)
+        thread.assert_called_once_with(target=addresses._rebuild, daemon=True)
+
+    def test_created_trips_update_recents_and_weights(self):
+        self.client.login(username='rider2@test.com', password='testpass123')
+        url = reverse('trips:address_suggestions')
+        response = self.client.get(url, {'q': 'ai'})
+        self.assertEqual(response.json(), {'results': ['Airport Terminal']})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('trips:trip_create'), {
+                'origin': '5 New Road', 'destination': 'Main Square',
+            })
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                addresses.suggest('5', rider_id=self.riders[2].pk), ['5 New Road']
+            )
+            self.assertEqual(addresses.suggest('new'), [])
+        index = addresses.get_index()
+        self.assertEqual(index._weights[index._ids['main square']], 4)
+        self.assertEqual(self.client.get(url).json(), {'results': []})
@@ -10,8 +10,15 @@ urlpatterns = [
     path('<int:pk>/', views.TripDetailView.as_view(), name='trip_detail'),
     path('<int:pk>/update/', views.TripUpdateView.as_view(), name='trip_update'),
     path('<int:pk>/delete/', views.TripDeleteView.as_view(), name='trip_delete'),
+    path('export/', views.export_trips, name='export_trips'),
+    path('addresses/', views.address_suggestions, name='address_suggestions'),
     path('available/', views.AvailableTripsView.as_view(), name='available_trips'),
+    path('available/nearby/', views.NearbyTripsView.as_view(), name='nearby_trips'),
+    path('location/', views.update_driver_location, name='update_driver_location'),
     path('<int:pk>/accept/', views.accept_trip, name='accept_trip'),
     path('<int:pk>/complete/', views.complete_trip, name='complete_trip'),
     path('<int:pk>/cancel/', views.cancel_trip, name='cancel_trip'),
+    path('<int:pk>/rate/', views.rate_trip, name='rate_trip'),
+    path('available/feed/', views.available_trips_feed, name='available_trips_feed'),
+    path('<int:pk>/feed/', views.trip_feed, name='trip_feed'),
 ]
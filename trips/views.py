@@ -1,8 +1,24 @@
-﻿from django.contrib import messages
+﻿import math
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Q
+from django.db.models.functions import Greatest
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.views.decorators.http import require_POST
 from django.views.generic import (
     CreateView,
     DeleteView,
@@ -11,29 +27,89 @@ from django.views.generic import (
     UpdateView,
 )
 
-from .forms import TripCreateForm, TripUpdateForm
-from .models import Trip
+from accounts.models import DriverProfile
+from accounts.principal import get_principal
+from taxi_project.mixins import ConditionalPageMixin, SingleObjectCacheMixin
 
+from .addresses import suggest
+from .export import FORMATS, aiter_chunks, filter_trips, stream_trips
+from .fares import quote_trip
+from .forms import (
+    LocationForm,
+    TripCreateForm,
+    TripExportForm,
+    TripRatingForm,
+    TripUpdateForm,
+)
+from .geocoding import locate_trip
+from .live import DRIVERS_CHANNEL, event_stream, trip_channel
+from .models import Trip, TripRating
+from .pagination import KeysetPaginationMixin
 
-class TripListView(LoginRequiredMixin, ListView):
+
+class TripListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """List all trips for the current user"""
     model = Trip
     template_name = 'trips/trip_list.html'
     context_object_name = 'trips'
     paginate_by = 10
     
+    search_kwarg = 'q'
+    
+    def get_search_text(self):
+        return self.request.GET.get(self.search_kwarg, '').strip()
+    
+    def get_paginate_by(self, queryset):
+        # Search results are ranked, not in keyset order: the best ones only
+        return None if self.get_search_text() else self.paginate_by
+    
     def get_queryset(self):
         user = self.request.user
+        trips = Trip.objects.select_related('rider', 'driver__user')
+        text = self.get_search_text()
         if user.is_driver():
-            return Trip.objects.filter(driver=user.driver_profile)
-        return Trip.objects.filter(rider=user)
+            driver_id = get_principal(self.request).driver_id
+            if driver_id is None:
+                # No profile, no trips: for_driver(None) is every unassigned trip
+                return trips.none()
+            if text:
+                return trips.search(text, driver=driver_id)
+            return trips.for_driver(driver_id)
+        if text:
+            return trips.search(text, rider=user)
+        return trips.for_rider(user)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['search_text'] = self.get_search_text()
+        return context
 
 
-class TripDetailView(LoginRequiredMixin, DetailView):
+class TripDetailView(LoginRequiredMixin, ConditionalPageMixin, DetailView):
     """Detail view for a trip"""
     model = Trip
     template_name = 'trips/trip_detail.html'
     context_object_name = 'trip'
+    queryset = Trip.objects.select_related('rider', 'driver__user', 'rating')
+    
+    def get_last_modified(self):
+        # The page also shows the driver's profile and the rating
+        return (
+            Trip.objects.filter(pk=self.kwargs['pk'])
+            .values_list(
+                Greatest('updated_at', 'driver__updated_at', 'rating__created_at'), flat=True
+            )
+            .first()
+        )
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        trip = self.object
+        if (trip.status == 'completed' and trip.driver_id is not None
+                and trip.rider_id == self.request.user.pk
+                and not hasattr(trip, 'rating')):
+            context['rating_form'] = TripRatingForm()
+        return context
 
 
 class TripCreateView(LoginRequiredMixin, CreateView):
@@ -45,11 +121,15 @@ class TripCreateView(LoginRequiredMixin, CreateView):
     
     def form_valid(self, form):
         form.instance.rider = self.request.user
+        locate_trip(form.instance)
+        form.instance.price = quote_trip(form.instance)
         messages.success(self.request, 'Trip created successfully!')
         return super().form_valid(form)
 
 
-class TripUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class TripUpdateView(
+    LoginRequiredMixin, UserPassesTestMixin, SingleObjectCacheMixin, UpdateView
+):
     """Update an existing trip"""
     model = Trip
     form_class = TripUpdateForm
@@ -58,14 +138,19 @@ class TripUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     
     def test_func(self):
         trip = self.get_object()
-        return trip.rider == self.request.user and trip.can_be_edited()
+        return trip.rider_id == self.request.user.pk and trip.can_be_edited()
     
     def form_valid(self, form):
+        if {'origin', 'destination'} & set(form.changed_data):
+            locate_trip(form.instance)
+            form.instance.price = quote_trip(form.instance)
         messages.success(self.request, 'Trip updated successfully!')
         return super().form_valid(form)
 
 
-class TripDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class TripDeleteView(
+    LoginRequiredMixin, UserPassesTestMixin, SingleObjectCacheMixin, DeleteView
+):
     """Delete a trip"""
     model = Trip
     template_name = 'trips/trip_confirm_delete.html'
@@ -73,14 +158,16 @@ class TripDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     
     def test_func(self):
         trip = self.get_object()
-        return trip.rider == self.request.user and trip.can_be_edited()
+        return trip.rider_id == self.request.user.pk and trip.can_be_edited()
     
     def delete(self, request, *args, **kwargs):
         messages.success(request, 'Trip deleted successfully!')
         return super().delete(request, *args, **kwargs)
 
 
-class AvailableTripsView(LoginRequiredMixin, ListView):
+class AvailableTripsView(
+    LoginRequiredMixin, ConditionalPageMixin, KeysetPaginationMixin, ListView
+):
     """List available trips for drivers"""
     model = Trip
     template_name = 'trips/available_trips.html'
@@ -88,69 +175,242 @@ class AvailableTripsView(LoginRequiredMixin, ListView):
     paginate_by = 10
     
     def get_queryset(self):
-        return Trip.objects.filter(status='requested')
+        return Trip.objects.available()
+    
+    def get_last_modified(self):
+        # The same index range scan as the page, reading three columns
+        _, self.validator_page, _, _ = self.paginate_queryset(
+            self.get_queryset().values('id', 'created_at', 'updated_at'), self.paginate_by
+        )
+        return max((trip['updated_at'] for trip in self.validator_page), default=None)
+    
+    def get_etag_parts(self):
+        # Trips leaving the feed change the page without changing any row in it
+        page = self.validator_page
+        return [
+            [(trip['id'], trip['updated_at'].isoformat()) for trip in page],
+            page.has_next(), page.has_previous(),
+        ]
+
+
+class NearbyTripsView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+    """Open trips near the driver, nearest first"""
+    model = Trip
+    template_name = 'trips/nearby_trips.html'
+    context_object_name = 'trips'
+    max_results = 50
+    
+    def test_func(self):
+        return self.request.user.is_driver()
+    
+    def get_location(self):
+        """Position from ?lat=&lng=, else the driver's last known one"""
+        form = LocationForm(self.request.GET)
+        if form.is_valid():
+            return form.cleaned_data['lat'], form.cleaned_data['lng']
+        driver_id = get_principal(self.request).driver_id
+        if driver_id is None:
+            # No profile, no last known position
+            return None
+        location = (
+            DriverProfile.objects.filter(pk=driver_id)
+            .values_list('last_lat', 'last_lng').first()
+        )
+        if location is None or None in location:
+            return None
+        return location
+    
+    def get_radius(self):
+        try:
+            radius = float(self.request.GET.get('radius', settings.TRIP_NEARBY_RADIUS_KM))
+        except ValueError:
+            radius = settings.TRIP_NEARBY_RADIUS_KM
+        if math.isnan(radius):
+            radius = settings.TRIP_NEARBY_RADIUS_KM
+        return min(max(radius, 0.1), settings.TRIP_NEARBY_MAX_RADIUS_KM)
+    
+    def get_queryset(self):
+        self.location = self.get_location()
+        self.radius_km = self.get_radius()
+        if self.location is None:
+            return Trip.objects.none()
+        lat, lng = self.location
+        return Trip.objects.nearest(lat, lng, self.radius_km, self.max_results)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['location'] = self.location
+        context['radius_km'] = self.radius_km
+        return context
+
+
+@login_required
+@require_POST
+def update_driver_location(request):
+    """Record a driver's current position (posted by the driver's browser)"""
+    driver = get_principal(request).driver
+    if driver is None:
+        return HttpResponseForbidden()
+    form = LocationForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    driver.set_location(
+        form.cleaned_data['lat'], form.cleaned_data['lng']
+    )
+    return JsonResponse({'ok': True})
+
+
+@login_required
+def address_suggestions(request):
+    """Addresses completing ?q=, the rider's recent ones first (as JSON)"""
+    return JsonResponse({'results': suggest(request.GET.get('q', ''), rider_id=request.user.pk)})
 
 
 @login_required
 def accept_trip(request, pk):
     """Accept a trip as a driver"""
-    if not request.user.is_driver():
+    driver = get_principal(request).driver
+    if driver is None:
         messages.error(request, 'Only drivers can accept trips.')
         return redirect('trips:trip_list')
     
-    trip = get_object_or_404(Trip, pk=pk)
-    
-    if not trip.can_be_accepted():
+    if not Trip.objects.accept(pk, driver, actor=request.user):
+        # Lost the race or the trip is gone; only now pay for a lookup
+        get_object_or_404(Trip, pk=pk)
         messages.error(request, 'This trip cannot be accepted.')
         return redirect('trips:available_trips')
-    
-    trip.driver = request.user.driver_profile
-    trip.status = 'accepted'
-    trip.save()
-    
+
     messages.success(request, 'Trip accepted successfully!')
-    return redirect('trips:trip_detail', pk=trip.pk)
+    return redirect('trips:trip_detail', pk=pk)
 
 
 @login_required
 def complete_trip(request, pk):
     """Complete a trip"""
-    trip = get_object_or_404(Trip, pk=pk)
-    
-    if not request.user.is_driver() or trip.driver != request.user.driver_profile:
-        messages.error(request, 'You do not have permission to complete this trip.')
-        return redirect('trips:trip_list')
-    
-    if not trip.can_be_completed():
+    driver = get_principal(request).driver if request.user.is_driver() else None
+
+    if driver is None or not Trip.objects.complete(pk, driver, actor=request.user):
+        trip = get_object_or_404(Trip, pk=pk)
+        if driver is None or trip.driver_id != driver.pk:
+            messages.error(request, 'You do not have permission to complete this trip.')
+            return redirect('trips:trip_list')
         messages.error(request, 'This trip cannot be completed.')
-        return redirect('trips:trip_detail', pk=trip.pk)
-    
-    trip.status = 'completed'
-    trip.save()
-    
+        return redirect('trips:trip_detail', pk=pk)
+
     messages.success(request, 'Trip completed successfully!')
-    return redirect('trips:trip_detail', pk=trip.pk)
+    return redirect('trips:trip_detail', pk=pk)
 
 
 @login_required
 def cancel_trip(request, pk):
     """Cancel a trip"""
-    trip = get_object_or_404(Trip, pk=pk)
-    
-    # Check permissions
-    is_rider = trip.rider == request.user
-    is_driver = request.user.is_driver() and trip.driver == request.user.driver_profile
-    
-    if not (is_rider or is_driver):
-        messages.error(request, 'You do not have permission to cancel this trip.')
-        return redirect('trips:trip_list')
-    
-    if not trip.can_be_cancelled():
+    driver = get_principal(request).driver if request.user.is_driver() else None
+
+    if not Trip.objects.cancel(pk, request.user, driver):
+        trip = get_object_or_404(Trip, pk=pk)
+
+        # Check permissions
+        is_rider = trip.rider_id == request.user.pk
+        is_driver = driver is not None and trip.driver_id == driver.pk
+
+        if not (is_rider or is_driver):
+            messages.error(request, 'You do not have permission to cancel this trip.')
+            return redirect('trips:trip_list')
+
         messages.error(request, 'This trip cannot be cancelled.')
-        return redirect('trips:trip_detail', pk=trip.pk)
-    
-    trip.status = 'cancelled'
-    trip.save()
-    
+        return redirect('trips:trip_detail', pk=pk)
+
     messages.success(request, 'Trip cancelled successfully!')
-    return redirect('trips:trip_detail', pk=trip.pk)
+    return redirect('trips:trip_detail', pk=pk)
+
+
+@login_required
+@require_POST
+def rate_trip(request, pk):
+    """Rate a completed trip as its rider"""
+    form = TripRatingForm(request.POST)
+    if not form.is_valid():
+        messages.error(request, 'Please choose a score from 1 to 5.')
+        return redirect('trips:trip_detail', pk=pk)
+
+    rating = TripRating.objects.rate(
+        pk, request.user, form.cleaned_data['score'], form.cleaned_data['comment']
+    )
+    if rating is None:
+        trip = get_object_or_404(Trip, pk=pk)
+        if trip.rider_id != request.user.pk:
+            messages.error(request, 'You do not have permission to rate this trip.')
+            return redirect('trips:trip_list')
+        messages.error(request, 'This trip cannot be rated.')
+        return redirect('trips:trip_detail', pk=pk)
+
+    messages.success(request, 'Thank you for rating your trip!')
+    return redirect('trips:trip_detail', pk=pk)
+
+
+@login_required
+def export_trips(request):
+    """Stream the user's trip history (any trips for staff) as CSV or NDJSON"""
+    user = request.user
+    form = TripExportForm(request.GET, staff=user.is_staff)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    filters = form.cleaned_data
+    if user.is_staff:
+        trips = Trip.objects.all()
+    elif user.is_driver():
+        driver_id = get_principal(request).driver_id
+        # No profile, no trips: for_driver(None) is every unassigned trip
+        trips = Trip.objects.none() if driver_id is None else Trip.objects.for_driver(driver_id)
+    else:
+        trips = Trip.objects.for_rider(user)
+    trips = filter_trips(
+        trips, rider=filters.get('rider'), driver=filters.get('driver'),
+        status=filters['status'], since=filters['since'], until=filters['until'],
+    )
+    fmt = filters['format']
+    chunks = stream_trips(trips, fmt)
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="trips-{timezone.localdate():%Y%m%d}.{fmt}"'
+    )
+    return response
+
+
+def _sse_response(request, channels):
+    if not isinstance(request, ASGIRequest):
+        # WSGI would buffer the endless stream and hold a thread for good;
+        # 204 tells EventSource not to reconnect
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(
+        event_stream(channels), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _feed_user(request):
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+async def available_trips_feed(request):
+    """Server-Sent Events stream of open trips for drivers (ASGI only)"""
+    user = await sync_to_async(_feed_user)(request)
+    if user is None or not user.is_driver():
+        return HttpResponseForbidden()
+    return _sse_response(request, [DRIVERS_CHANNEL])
+
+
+async def trip_feed(request, pk):
+    """Server-Sent Events stream of status changes of one trip (ASGI only)"""
+    user = await sync_to_async(_feed_user)(request)
+    if user is None:
+        return HttpResponseForbidden()
+    involved = Q(rider=user) | Q(driver__user=user)
+    if not await Trip.objects.filter(involved, pk=pk).aexists():
+        raise Http404('No trip found matching the query')
+    return _sse_response(request, [trip_channel(pk)])
@@ -1,16 +1,24 @@
 ﻿from django.contrib import admin
 
+from taxi_project.admin import LargeTableAdmin
+
 from .models import Vehicle
 
 
 @admin.register(Vehicle)
-class VehicleAdmin(admin.ModelAdmin):
+class VehicleAdmin(LargeTableAdmin):
     list_display = [
         'id', 'car_number', 'car_model', 'driver',
         'seats', 'year', 'color', 'is_active', 'created_at'
     ]
     list_filter = ['is_active', 'seats', 'year', 'created_at']
-    search_fields = ['car_number', 'car_model', 'driver__user__email', 'color']
+    search_fields = ['car_number', 'car_model', 'color']
+    related_search_fields = {'driver': ['user__email']}
+    # The driver column shows the driver's email
+    list_select_related = ['driver__user']
+    # Served by vehicle_created_idx
+    ordering = ['-created_at', '-id']
+    sortable_by = ['id', 'created_at']
     readonly_fields = ['created_at', 'updated_at']
     list_editable = ['is_active']
     
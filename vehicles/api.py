@@ -0,0 +1,19 @@
+from rest_framework import viewsets
+
+from taxi_project.api import ConditionalGetMixin, ValuesQuerysetMixin
+
+from .models import Vehicle
+from .serializers import VehicleSerializer
+
+
+class VehicleViewSet(ConditionalGetMixin, ValuesQuerysetMixin, viewsets.ReadOnlyModelViewSet):
+    """A driver's own vehicles; all vehicles for staff"""
+    serializer_class = VehicleSerializer
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_staff:
+            return Vehicle.objects.all()
+        if user.is_driver():
+            return Vehicle.objects.filter(driver__user=user)
+        return Vehicle.objects.none()
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+from taxi_project.trigram import create_trigram_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehicles', '0002_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['-created_at', '-id'], name='vehicle_created_idx'),
+        ),
+        create_trigram_indexes('vehicles_vehicle', ['car_number', 'car_model', 'color']),
+    ]
@@ -33,6 +33,8 @@ class Vehicle(models.Model):
         null=True,
         verbose_name='Photo'
     )
+    # Resized copies of photo, built by taxi_project.images
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True, verbose_name='Is Active')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -41,6 +43,10 @@ class Vehicle(models.Model):
         verbose_name = 'Vehicle'
         verbose_name_plural = 'Vehicles'
         ordering = ['-created_at']
+        indexes = [
+            # Newest first, for the admin changelist and keyset pages
+            models.Index(fields=['-created_at', '-id'], name='vehicle_created_idx'),
+        ]
     
     def __str__(self):
         return f'{self.car_model} ({self.car_number})'
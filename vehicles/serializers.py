@@ -0,0 +1,31 @@
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+from taxi_project.api import ValuesSerializer
+
+
+class StoredFileURLField(serializers.Field):
+    """Absolute URL of a stored file name, or None for no file"""
+
+    def to_representation(self, name):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+
+class VehicleSerializer(ValuesSerializer):
+    """A vehicle row of VehicleViewSet; driver is an id"""
+
+    id = serializers.IntegerField()
+    driver = serializers.IntegerField()
+    car_number = serializers.CharField()
+    car_model = serializers.CharField()
+    seats = serializers.IntegerField()
+    year = serializers.IntegerField()
+    color = serializers.CharField()
+    photo = StoredFileURLField()
+    is_active = serializers.BooleanField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
@@ -1,3 +1,254 @@
-from django.test import TestCase
-
-# Create your tests here.
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from accounts.models import DriverProfile, User
+from tasks.models import Task
+from tasks.worker import run_pending
+from taxi_project import images
+from taxi_project.testing import QueryBudgetMixin
+
+from .models import Vehicle
+
+
+class VehicleViewsTest(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.vehicle = self.add_vehicle(0)
+        self.client.login(username='driver@test.com', password='testpass123')
+
+    def add_vehicle(self, number):
+        return Vehicle.objects.create(
+            driver=self.driver_profile,
+            car_number=f'CAR-{number}',
+            car_model='Toyota Camry',
+            seats=4
+        )
+
+    def add_vehicles(self, count=5):
+        start = Vehicle.objects.count()
+        for number in range(start, start + count):
+            self.add_vehicle(number)
+
+    def test_vehicle_list_query_budget(self):
+        response = self.assertPageQueryBudget(
+            reverse('vehicles:vehicle_list'), 4, self.add_vehicles
+        )
+        self.assertEqual(len(response.context['vehicles']), 6)
+
+    def test_admin_changelist_query_budget(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@test.com', password='testpass123'
+        )
+        self.client.login(username='admin@test.com', password='testpass123')
+        self.assertPageQueryBudget(
+            reverse('admin:vehicles_vehicle_changelist'), 6, self.add_vehicles
+        )
+
+    def test_vehicle_detail_query_budget(self):
+        self.assertPageQueryBudget(
+            # One more for the conditional GET validator
+            reverse('vehicles:vehicle_detail', args=[self.vehicle.pk]), 4,
+            self.add_vehicles
+        )
+
+    def test_vehicle_update_query_budget(self):
+        self.assertPageQueryBudget(
+            reverse('vehicles:vehicle_update', args=[self.vehicle.pk]), 3,
+            self.add_vehicles
+        )
+
+    def test_other_driver_cannot_edit(self):
+        other = User.objects.create_user(
+            username='driver2',
+            email='driver2@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        DriverProfile.objects.create(
+            user=other, license_number='DL2', car_number='X-2', car_model='Kia'
+        )
+        self.client.login(username='driver2@test.com', password='testpass123')
+        response = self.client.get(
+            reverse('vehicles:vehicle_update', args=[self.vehicle.pk])
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class VehicleApiTest(TestCase):
+    def setUp(self):
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.vehicle = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-123', car_model='Toyota Camry', year=2020
+        )
+        User.objects.create_user(
+            username='rider1', email='rider@test.com', password='testpass123', role='rider'
+        )
+
+    def test_drivers_list_their_vehicles(self):
+        self.client.login(username='driver@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:vehicle-list'))
+        results = response.json()['results']
+        self.assertEqual([vehicle['id'] for vehicle in results], [self.vehicle.pk])
+        self.assertEqual(results[0]['driver'], self.driver_profile.pk)
+        self.assertIsNone(results[0]['photo'])
+
+    def test_riders_list_no_vehicles(self):
+        self.client.login(username='rider@test.com', password='testpass123')
+        response = self.client.get(reverse('v1:vehicle-list'))
+        self.assertEqual(response.json()['results'], [])
+
+
+class VehicleConditionalGetTest(TestCase):
+    def test_vehicle_detail_not_modified(self):
+        driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        driver_profile = DriverProfile.objects.create(
+            user=driver_user, license_number='DL123456', car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        vehicle = Vehicle.objects.create(
+            driver=driver_profile, car_number='ABC-123', car_model='Toyota Camry', year=2020
+        )
+        self.client.login(username='driver@test.com', password='testpass123')
+        url = reverse('vehicles:vehicle_detail', args=[vehicle.pk])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        vehicle.color = 'Red'
+        vehicle.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Red')
+
+
+def jpeg_upload(name='car.jpg', size=(2000, 1500), color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class VehiclePhotoVariantsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.driver_user = User.objects.create_user(
+            username='driver1',
+            email='driver@test.com',
+            password='testpass123',
+            role='driver'
+        )
+        self.driver_profile = DriverProfile.objects.create(
+            user=self.driver_user,
+            license_number='DL123456',
+            car_number='ABC-123',
+            car_model='Toyota Camry'
+        )
+        self.client.login(username='driver@test.com', password='testpass123')
+
+    def test_upload_queues_a_variants_task(self):
+        self.client.post(reverse('vehicles:vehicle_create'), {
+            'car_number': 'ABC-123', 'car_model': 'Toyota Camry', 'seats': 4,
+            'year': 2020, 'is_active': True, 'photo': jpeg_upload(),
+        })
+        vehicle = Vehicle.objects.get()
+        # Nothing is resized on the request path
+        self.assertEqual(vehicle.photo_variants, {})
+        queued = Task.objects.get()
+        self.assertEqual(queued.name, images.build_photo_variants.task_name)
+        self.assertEqual(queued.args, ['vehicles.Vehicle', vehicle.pk])
+        self.assertEqual(run_pending(), 1)
+
+        vehicle.refresh_from_db()
+        variants = vehicle.photo_variants
+        self.assertEqual(variants['source'], vehicle.photo.name)
+        self.assertEqual((variants['thumb']['width'], variants['thumb']['height']), (320, 240))
+        self.assertEqual(variants['display']['width'], 960)
+        original_size = default_storage.size(vehicle.photo.name)
+        for entry in (variants['thumb'], variants['display']):
+            self.assertRegex(
+                entry['webp'], r'^vehicle_photos/variants/car-\w+-[0-9a-f]{16}\.webp$'
+            )
+            self.assertTrue(default_storage.exists(entry['jpg']))
+            self.assertLess(default_storage.size(entry['webp']), original_size)
+
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[vehicle.pk]))
+        self.assertContains(response, default_storage.url(variants['display']['webp']))
+        self.assertContains(response, 'type="image/webp"')
+
+    def test_pending_variants_fall_back_to_the_original(self):
+        vehicle = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-123', car_model='Toyota Camry',
+            photo=jpeg_upload(),
+        )
+        response = self.client.get(reverse('vehicles:vehicle_detail', args=[vehicle.pk]))
+        self.assertContains(response, vehicle.photo.url)
+        self.assertNotContains(response, '<picture>')
+
+    def test_same_content_same_names(self):
+        first = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-1', car_model='Camry',
+            photo=jpeg_upload(),
+        )
+        second = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-2', car_model='Camry',
+            photo=jpeg_upload(color='blue'),
+        )
+        images.process_photo(Vehicle, first.pk)
+        images.process_photo(Vehicle, second.pk)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        rebuilt = images.build_variants(first.photo.name)
+        self.assertEqual(first.photo_variants['thumb'], rebuilt['thumb'])
+        self.assertNotEqual(
+            first.photo_variants['thumb']['webp'], second.photo_variants['thumb']['webp']
+        )
+
+    def test_photo_replaced_while_building(self):
+        vehicle = Vehicle.objects.create(
+            driver=self.driver_profile, car_number='ABC-123', car_model='Camry',
+            photo=jpeg_upload(),
+        )
+
+        def replace_then_build(name):
+            Vehicle.objects.filter(pk=vehicle.pk).update(photo='vehicle_photos/new.jpg')
+            return {'source': name}
+
+        with mock.patch.object(images, 'build_variants', side_effect=replace_then_build):
+            images.process_photo(Vehicle, vehicle.pk)
+        # The new upload's own job fills them in
+        self.assertEqual(Vehicle.objects.get(pk=vehicle.pk).photo_variants, {})
@@ -9,6 +9,9 @@ from django.views.generic import (
     UpdateView,
 )
 
+from accounts.principal import get_principal
+from taxi_project.mixins import ConditionalPageMixin, SingleObjectCacheMixin
+
 from .forms import VehicleForm
 from .models import Vehicle
 
@@ -22,15 +25,22 @@ class VehicleListView(LoginRequiredMixin, ListView):
     
     def get_queryset(self):
         if self.request.user.is_driver():
-            return Vehicle.objects.filter(driver=self.request.user.driver_profile)
+            return Vehicle.objects.filter(driver__user=self.request.user)
         return Vehicle.objects.none()
 
 
-class VehicleDetailView(LoginRequiredMixin, DetailView):
+class VehicleDetailView(LoginRequiredMixin, ConditionalPageMixin, DetailView):
     """Detail view for a vehicle"""
     model = Vehicle
     template_name = 'vehicles/vehicle_detail.html'
     context_object_name = 'vehicle'
+    
+    def get_last_modified(self):
+        return (
+            Vehicle.objects.filter(pk=self.kwargs['pk'])
+            .values_list('updated_at', flat=True)
+            .first()
+        )
 
 
 class VehicleCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
@@ -44,23 +54,26 @@ class VehicleCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         return self.request.user.is_driver()
     
     def form_valid(self, form):
-        form.instance.driver = self.request.user.driver_profile
+        form.instance.driver = get_principal(self.request).driver
         messages.success(self.request, 'Vehicle created successfully!')
         return super().form_valid(form)
 
 
-class VehicleUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class VehicleUpdateView(
+    LoginRequiredMixin, UserPassesTestMixin, SingleObjectCacheMixin, UpdateView
+):
     """Update an existing vehicle"""
     model = Vehicle
     form_class = VehicleForm
     template_name = 'vehicles/vehicle_form.html'
     success_url = reverse_lazy('vehicles:vehicle_list')
+    queryset = Vehicle.objects.select_related('driver')
     
     def test_func(self):
         vehicle = self.get_object()
         return (
             self.request.user.is_driver() and
-            vehicle.driver == self.request.user.driver_profile
+            vehicle.driver.user_id == self.request.user.pk
         )
     
     def form_valid(self, form):
@@ -68,17 +81,20 @@ class VehicleUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return super().form_valid(form)
 
 
-class VehicleDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class VehicleDeleteView(
+    LoginRequiredMixin, UserPassesTestMixin, SingleObjectCacheMixin, DeleteView
+):
     """Delete a vehicle"""
     model = Vehicle
     template_name = 'vehicles/vehicle_confirm_delete.html'
     success_url = reverse_lazy('vehicles:vehicle_list')
+    queryset = Vehicle.objects.select_related('driver')
     
     def test_func(self):
         vehicle = self.get_object()
         return (
             self.request.user.is_driver() and
-            vehicle.driver == self.request.user.driver_profile
+            vehicle.driver.user_id == self.request.user.pk
         )
     
     def delete(self, request, *args, **kwargs):